@@ -0,0 +1,150 @@
+"""
+Benchmark: one hot statistics row vs. sharded counter slots under parallel writers.
+
+Each writer thread has its own connection and commits every increment, like
+concurrent message handlers do. Needs a PostgreSQL database; it creates and
+drops its own bench_* tables.
+
+With BENCH_FULL_PATH=1 it also times the real write path: parallel
+Database.update_user_activity calls (user row, sharded counter, daily
+image count and the activity rollups in one transaction). That part runs
+the bot's migrations and leaves counter/rollup increments behind, so only
+use it on a scratch database; its bench users (negative ids) are removed.
+
+Run from the repository root:
+    POSTGRES_URL=postgresql://... python -m benchmarks.bench_counters
+    BENCH_FULL_PATH=1 POSTGRES_URL=postgresql://scratch... python -m benchmarks.bench_counters
+"""
+
+import os
+import random
+import threading
+import time
+
+import psycopg2
+
+from src.database_postgres import Database
+
+SETUP = """
+    DROP TABLE IF EXISTS bench_counter_single, bench_counter_shards;
+    CREATE TABLE bench_counter_single (key VARCHAR(100) PRIMARY KEY, value BIGINT DEFAULT 0);
+    CREATE TABLE bench_counter_shards (
+        key VARCHAR(100), slot SMALLINT, value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (key, slot)
+    );
+    INSERT INTO bench_counter_single (key, value) VALUES ('total_messages', 0);
+"""
+
+SINGLE = "UPDATE bench_counter_single SET value = value + 1 WHERE key = 'total_messages'"
+
+SHARDED = """
+    INSERT INTO bench_counter_shards (key, slot, value) VALUES ('total_messages', %s, 1)
+    ON CONFLICT (key, slot) DO UPDATE SET value = bench_counter_shards.value + EXCLUDED.value
+"""
+
+
+def run_writers(url: str, writers: int, increments: int, sharded: bool, shards: int) -> float:
+    """Run `writers` threads doing `increments` committed increments each; returns increments/sec."""
+    barrier = threading.Barrier(writers + 1)
+    connections = [psycopg2.connect(url) for _ in range(writers)]
+
+    def writer(conn):
+        cursor = conn.cursor()
+        barrier.wait()
+        for _ in range(increments):
+            if sharded:
+                cursor.execute(SHARDED, (random.randrange(shards),))
+            else:
+                cursor.execute(SINGLE)
+            conn.commit()
+        cursor.close()
+
+    threads = [threading.Thread(target=writer, args=(conn,)) for conn in connections]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for conn in connections:
+        conn.close()
+    return writers * increments / elapsed
+
+
+def run_activity_writers(url: str, writers: int, increments: int) -> float:
+    """Like run_writers, but each increment is a full update_user_activity transaction."""
+    barrier = threading.Barrier(writers + 1)
+    # All writers share one Database and its pool, as the bot's handlers and worker threads do
+    db = Database(url)
+    for index in range(writers):
+        db.add_user(-1 - index, "bench", "Bench")
+
+    def writer(index):
+        barrier.wait()
+        for i in range(increments):
+            db.update_user_activity(-1 - index, "photo" if i % 10 == 0 else "text")
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    db.close()
+    return writers * increments / elapsed
+
+
+def remove_bench_users(conn) -> None:
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE user_id < 0 AND username = 'bench'")
+        cursor.execute("DELETE FROM daily_active_users WHERE user_id < 0")
+        cursor.execute("DELETE FROM daily_image_counts WHERE user_id < 0")
+
+
+def read_total(conn, sharded: bool) -> int:
+    with conn.cursor() as cursor:
+        table = "bench_counter_shards" if sharded else "bench_counter_single"
+        cursor.execute(f"SELECT COALESCE(SUM(value), 0) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def main() -> None:
+    url = os.getenv("POSTGRES_URL")
+    if not url:
+        raise SystemExit("Set POSTGRES_URL to a database the benchmark may create tables in.")
+    shards = int(os.getenv("COUNTER_SHARDS", "16"))
+    increments = int(os.getenv("BENCH_INCREMENTS", "500"))
+
+    admin = psycopg2.connect(url)
+    admin.autocommit = True
+    try:
+        print(f"counter increments/sec ({increments} per writer, {shards} slots)")
+        for writers in (1, 4, 16, 32):
+            with admin.cursor() as cursor:
+                cursor.execute(SETUP)
+            single = run_writers(url, writers, increments, sharded=False, shards=shards)
+            sharded = run_writers(url, writers, increments, sharded=True, shards=shards)
+            expected = writers * increments
+            assert read_total(admin, False) == expected and read_total(admin, True) == expected
+            print(
+                f"{writers:>3} writers | single row {single:9.0f}/s | "
+                f"sharded {sharded:9.0f}/s | x{sharded / single:5.2f}"
+            )
+        if os.getenv("BENCH_FULL_PATH") == "1":
+            print(f"\nupdate_user_activity transactions/sec ({increments} per writer)")
+            for writers in (1, 4, 16):
+                rate = run_activity_writers(url, writers, increments)
+                print(f"{writers:>3} writers | {rate:9.0f}/s | {rate / writers:7.0f}/s per writer")
+    finally:
+        with admin.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS bench_counter_single, bench_counter_shards")
+        if os.getenv("BENCH_FULL_PATH") == "1":
+            remove_bench_users(admin)
+        admin.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: the per-message database calls against each storage backend.
+
+Every private message runs a handful of Storage calls (ban and premium
+checks, the image quota, the active prompt, the activity update); this
+times each of them, and a full message round, on the in-memory backend,
+an in-memory SQLite database and a SQLite file. PostgreSQL is included
+when BENCH_POSTGRES_URL is set; it writes bench users and groups with
+negative ids, so point it at a scratch database.
+
+Run from the repository root:
+    python -m benchmarks.bench_db
+    BENCH_POSTGRES_URL=postgresql://... python -m benchmarks.bench_db
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from src.storage import create_database
+
+USERS = int(os.getenv("BENCH_USERS", "1000"))
+OPS = int(os.getenv("BENCH_OPS", "5000"))
+ID_BASE = -10_000_000
+
+
+def message_round(db, user_id: int) -> None:
+    """The calls handle_message/handle_photo make for one private message."""
+    if db.is_user_banned(user_id):
+        return
+    db.is_user_exist(user_id)
+    db.can_user_send_image(user_id)
+    db.get_active_prompt()
+    db.update_user_activity(user_id, "text")
+
+
+def cases(db, user_ids, chat_ids):
+    pick_user = lambda: random.choice(user_ids)
+    pick_chat = lambda: random.choice(chat_ids)
+    return {
+        "add_user (upsert)": lambda: db.add_user(pick_user(), "bench", "Bench"),
+        "update_user_activity text": lambda: db.update_user_activity(pick_user(), "text"),
+        "update_user_activity image": lambda: db.update_user_activity(pick_user(), "photo"),
+        "is_user_banned": lambda: db.is_user_banned(pick_user()),
+        "can_user_send_image": lambda: db.can_user_send_image(pick_user()),
+        "get_user_info": lambda: db.get_user_info(pick_user()),
+        "get_active_prompt": db.get_active_prompt,
+        "update_group_activity": lambda: db.update_group_activity(pick_chat()),
+        "get_group_prompt": lambda: db.get_group_prompt(pick_chat()),
+        "message round": lambda: message_round(db, pick_user()),
+    }
+
+
+def run_backend(name: str, url: str) -> None:
+    db = create_database(url)
+    try:
+        user_ids = [ID_BASE - i for i in range(USERS)]
+        chat_ids = [ID_BASE - i for i in range(max(USERS // 10, 1))]
+        started = time.perf_counter()
+        for user_id in user_ids:
+            db.add_user(user_id, "bench", "Bench")
+        for chat_id in chat_ids:
+            db.add_group(chat_id, "Bench group")
+        for user_id in user_ids[::10]:
+            db.add_premium_user(user_id)
+        print(f"\n{name}: seeded {USERS} users in {time.perf_counter() - started:.2f}s")
+
+        for label, call in cases(db, user_ids, chat_ids).items():
+            started = time.perf_counter()
+            for _ in range(OPS):
+                call()
+            elapsed = time.perf_counter() - started
+            print(f"  {label:<28} {OPS / elapsed:10.0f} ops/s  {elapsed / OPS * 1e6:8.1f} us/op")
+    finally:
+        db.close()
+
+
+def main() -> None:
+    random.seed(7)
+    print(f"storage hot paths ({USERS} users, {OPS} calls per case)")
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": "memory://",
+            "sqlite (in-memory)": "sqlite://",
+            "sqlite (file, WAL)": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        }
+        if os.getenv("BENCH_POSTGRES_URL"):
+            backends["postgres"] = os.getenv("BENCH_POSTGRES_URL")
+        for name, url in backends.items():
+            run_backend(name, url)
+
+
+if __name__ == "__main__":
+    main()
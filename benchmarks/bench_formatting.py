@@ -0,0 +1,106 @@
+"""
+Benchmark: single-pass format_message vs. the previous multi-regex version.
+
+Run from the repository root:
+    python -m benchmarks.bench_formatting
+"""
+
+import re
+import html
+import random
+import timeit
+
+from src.utils.formatting import format_message
+
+
+def legacy_format_message(text: str) -> str:
+    """The regex/placeholder implementation that format_message replaced."""
+    code_blocks = []
+
+    def _sub_code_block(match):
+        code = html.escape(match.group(2))
+        lang = match.group(1)
+        if lang:
+            tag = f'<pre><code class="language-{lang}">{code}</code></pre>'
+        else:
+            tag = f'<pre><code>{code}</code></pre>'
+        code_blocks.append(tag)
+        return f"__CODE_BLOCK_{len(code_blocks)-1}__"
+
+    text = re.sub(r'```(\w*)\n(.*?)\n```', _sub_code_block, text, flags=re.DOTALL)
+
+    def _sub_inline_code(match):
+        code = html.escape(match.group(1))
+        tag = f'<code>{code}</code>'
+        code_blocks.append(tag)
+        return f"__CODE_BLOCK_{len(code_blocks)-1}__"
+
+    text = re.sub(r'`([^`]+)`', _sub_inline_code, text)
+    text = html.escape(text)
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text, flags=re.DOTALL)
+    text = re.sub(r'__(.*?)__', r'<b>\1</b>', text, flags=re.DOTALL)
+    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text, flags=re.DOTALL)
+    text = re.sub(r'_(.*?)_', r'<i>\1</i>', text, flags=re.DOTALL)
+
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        stripped_line = line.strip()
+        if stripped_line.startswith(('* ', '- ')):
+            lines[i] = '• ' + stripped_line[2:]
+    text = '\n'.join(lines)
+
+    for i, code_block in enumerate(code_blocks):
+        text = text.replace(f"__CODE_BLOCK_{i}__", code_block)
+
+    return text.strip()
+
+
+PROSE = [
+    "هذا **شرح مهم** للمفهوم مع *ملاحظة* صغيرة.",
+    "Use `snake_case_names` for variables and call `obj.__init__()` when needed.",
+    "* الخطوة الأولى: ثبّت الحزمة",
+    "- Step two: run the `setup_env` script & check the <output>.",
+    "Compare a < b and c > d, then __highlight__ the result.",
+]
+
+CODE = '''```python
+def parse_config(path: str) -> dict:
+    """Load key=value pairs."""
+    result = {}
+    with open(path) as fh:
+        for line in fh:
+            if "=" in line and not line.startswith("#"):
+                key, _, value = line.partition("=")
+                result[key.strip()] = value.strip()
+    return result
+```'''
+
+
+def make_document(blocks: int, seed: int = 7) -> str:
+    """A model-style answer with `blocks` code blocks and prose in between."""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(blocks):
+        parts.extend(rng.choice(PROSE) for _ in range(rng.randint(2, 6)))
+        parts.append(CODE)
+    return "\n".join(parts)
+
+
+def bench(label: str, text: str, repeat: int = 5) -> None:
+    number = max(1, 2000 // max(1, len(text) // 1000))
+    legacy = min(timeit.repeat(lambda: legacy_format_message(text), number=number, repeat=repeat)) / number
+    single = min(timeit.repeat(lambda: format_message(text), number=number, repeat=repeat)) / number
+    print(
+        f"{label:<24} {len(text):>9,} chars | legacy {legacy * 1e3:8.3f} ms | "
+        f"single-pass {single * 1e3:8.3f} ms | x{legacy / single:5.2f}"
+    )
+
+
+def main() -> None:
+    print("format_message benchmark (best of 5)")
+    for blocks in (2, 20, 100, 400):
+        bench(f"{blocks} code blocks", make_document(blocks))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,18 +19,23 @@ from telegram.ext import (
 )
 
 # --- Local Imports ---
-from src.config import TELEGRAM_TOKEN, WEBHOOK_URL, POSTGRES_URL
+from src.config import TELEGRAM_TOKEN, WEBHOOK_URL, DATABASE_URL
 from src.database_postgres import Database
+from src.storage import create_database
+from src.maintenance import start_maintenance_tasks
 from src.handlers import (
     start,
     handle_message,
     handle_photo,
     check_subscription_callback,
+    handle_channel_member_update,
     admin_panel,
     handle_admin_callback,
     GroupHandler,
     error_handler,
+    resume_broadcast_jobs,
 )
+from src.utils import search_more_callback, init_search_client
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -40,7 +45,8 @@ logger = logging.getLogger(__name__)
 
 # --- Global Variables & Initialization ---
 flask_app = Flask(__name__)
-db = Database(POSTGRES_URL)
+db = create_database(DATABASE_URL)
+group_handler_instance = GroupHandler(db)
 
 ptb_application: Application = None
 main_event_loop: asyncio.AbstractEventLoop = None
@@ -56,8 +62,6 @@ def setup_handlers(app: Application):
     check_subscription_handler = partial(check_subscription_callback, db=db)
     admin_callback_handler = partial(handle_admin_callback, db=db)
 
-    group_handler_instance = GroupHandler(db)
-
     # --- Command Handlers ---
     app.add_handler(CommandHandler("start", start_handler))
     app.add_handler(CommandHandler("admin", admin_panel))
@@ -68,6 +72,7 @@ def setup_handlers(app: Application):
 
     # --- Callback Query Handlers ---
     app.add_handler(CallbackQueryHandler(check_subscription_handler, pattern="^check_subscription$"))
+    app.add_handler(CallbackQueryHandler(search_more_callback, pattern="^search_more:"))
     app.add_handler(CallbackQueryHandler(admin_callback_handler))
 
     # --- Group Handlers ---
@@ -76,7 +81,10 @@ def setup_handlers(app: Application):
     app.add_handler(CommandHandler('setprompt', group_handler_instance.set_prompt_command))
     app.add_handler(CommandHandler('resetprompt', group_handler_instance.reset_prompt_command))
     app.add_handler(CommandHandler('getprompt', group_handler_instance.get_prompt_command))
+    app.add_handler(CommandHandler('autoscan', group_handler_instance.auto_scan_command))
     app.add_handler(ChatMemberHandler(group_handler_instance.handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    # Channel join/leave updates (bot must be a channel admin) keep the subscription cache fresh
+    app.add_handler(ChatMemberHandler(handle_channel_member_update, ChatMemberHandler.CHAT_MEMBER))
     app.add_handler(MessageHandler(filters.ChatType.GROUPS & (filters.TEXT | filters.PHOTO) & ~filters.COMMAND, group_handler_instance.handle_message))
 
     # --- Error Handler ---
@@ -113,6 +121,21 @@ async def ptb_async_setup_and_run(app: Application, loop: asyncio.AbstractEventL
     await app.initialize()
     logger.info("PTB Application initialized.")
 
+    # Background tasks run for the lifetime of the loop, not lazily per message
+    await group_handler_instance.start_background_tasks()
+
+    # Maintenance and broadcast jobs need PostgreSQL
+    if isinstance(db, Database):
+        start_maintenance_tasks(db)
+
+        # Pick up broadcasts interrupted by a redeploy
+        await resume_broadcast_jobs(app.bot, db)
+
+    try:
+        init_search_client()
+    except Exception as e:
+        logger.error(f"Failed to create search client: {e}", exc_info=True)
+
     if WEBHOOK_URL:
         full_webhook_url = f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}"
         try:
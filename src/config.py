@@ -13,10 +13,16 @@ if not GEMINI_API_KEYS and GEMINI_API_KEY:
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Exa web search
+EXA_API_KEY = os.getenv("EXA_API_KEY")
+
 # PostgreSQL Database URL
 POSTGRES_URL = os.getenv("POSTGRES_URL")
 
-if not POSTGRES_URL:
+# Storage backend; sqlite:///path/to/bot.db or memory:// run without PostgreSQL
+DATABASE_URL = os.getenv("DATABASE_URL") or POSTGRES_URL
+
+if not DATABASE_URL:
     logger.warning("POSTGRES_URL not found in environment variables. Database will not function properly.")
 
 
@@ -30,6 +36,9 @@ else:
 
 ADMIN_USERS = ["WAT4F", "M984D", "A66S6", "HTTHT"]
 
+# Channel users must join before using the bot in private chats
+REQUIRED_CHANNEL = os.getenv("REQUIRED_CHANNEL", "@cyber_code1")
+
 
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
 GEMINI_VISION_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
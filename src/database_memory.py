@@ -0,0 +1,413 @@
+"""
+In-memory storage backend: plain dicts behind one lock.
+
+Mirrors the semantics of the PostgreSQL `Database` for the `Storage`
+interface, so handlers can be exercised and benchmarked offline. Nothing
+is persisted; every instance starts empty with the default prompt active.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import logging
+import threading
+
+from .storage import BROWSE_SORTS, Storage, normalize_search
+
+logger = logging.getLogger(__name__)
+
+_USER_COLUMNS = ("user_id", "username", "first_name", "join_date", "message_count", "image_count", "last_active")
+_GROUP_COLUMNS = ("chat_id", "title", "join_date", "message_count", "members_count", "last_active")
+_COLUMNS = {"users": ("user_id", _USER_COLUMNS), "groups": ("chat_id", _GROUP_COLUMNS)}
+_EMPTY_DAY = {'messages': 0, 'images': 0, 'group_messages': 0, 'active_users': 0, 'active_groups': 0}
+
+
+class MemoryDatabase(Storage):
+    def __init__(self):
+        """Create an empty store."""
+        self._lock = threading.RLock()
+        self.users: Dict[int, dict] = {}
+        self.groups: Dict[int, dict] = {}
+        self.banned_users = set()
+        self.premium_users = set()
+        self.daily_image_counts: Counter = Counter()
+        self.statistics: Counter = Counter()
+        self.activity_daily: Dict[str, dict] = {}
+        self.daily_active_users = set()
+        self.daily_active_groups = set()
+        self.prompts: Dict[str, dict] = {
+            'default': {'content': self._get_default_prompt_text(), 'is_active': True, 'updated_at': self._now()}
+        }
+        self.url_scan_cache: Dict[str, dict] = {}
+
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _rows(self, kind: str) -> List[dict]:
+        """Snapshot of the users or groups table with the public columns."""
+        table = self.users if kind == "users" else self.groups
+        columns = _COLUMNS[kind][1]
+        with self._lock:
+            return [{column: row[column] for column in columns} for row in table.values()]
+
+    def _search(self, kind: str, text_of, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Rows whose normalized text contains the query, or whose id equals a numeric query."""
+        query = query.strip().lstrip("@")
+        if not query:
+            return []
+        needle = normalize_search(query)
+        id_match = int(query) if query.lstrip("-").isdigit() else None
+        id_column = _COLUMNS[kind][0]
+        matches = [row for row in self._rows(kind)
+                   if row[id_column] == id_match or needle in normalize_search(text_of(row))]
+        matches.sort(key=lambda row: (row[id_column] == id_match, row['last_active']), reverse=True)
+        return matches[:limit]
+
+    def _record_activity(self, members: set, member_id: int, active_column: str,
+                         messages: int = 0, images: int = 0, group_messages: int = 0):
+        """Add one event to today's rollup; the chat counts as active once per day."""
+        today = self._get_current_date_str()
+        day = self.activity_daily.setdefault(today, dict(_EMPTY_DAY))
+        day['messages'] += messages
+        day['images'] += images
+        day['group_messages'] += group_messages
+        if (today, member_id) not in members:
+            members.add((today, member_id))
+            day[active_column] += 1
+
+    # ==================== User Methods ====================
+
+    def is_user_exist(self, user_id: int) -> bool:
+        """Check if user exists in database."""
+        return user_id in self.users
+
+    def add_user(self, user_id: int, username: str, first_name: str):
+        """Add a user, or refresh the name and last_active of an existing one."""
+        now = self._now()
+        with self._lock:
+            user = self.users.get(user_id)
+            if user is None:
+                user = self.users[user_id] = {
+                    'user_id': user_id, 'join_date': now, 'message_count': 0, 'image_count': 0,
+                }
+            user.update(username=username or "", first_name=first_name or "المستخدم",
+                        last_active=now, is_reachable=True)
+        logger.info(f"Added/Updated user: {user_id}")
+
+    def update_user_activity(self, user_id: int, message_type: str = "text"):
+        """Count a message or image for the user, the global counters and today's rollup."""
+        is_image = message_type in ["photo", "image"]
+        with self._lock:
+            user = self.users.get(user_id)
+            if user is not None:
+                user['last_active'] = self._now()
+                user['is_reachable'] = True
+            if message_type == "text":
+                if user is not None:
+                    user['message_count'] += 1
+                self.statistics['total_messages'] += 1
+            elif is_image:
+                if user is not None:
+                    user['image_count'] += 1
+                self.statistics['total_images'] += 1
+                self.daily_image_counts[(user_id, self._get_current_date_str())] += 1
+            self._record_activity(self.daily_active_users, user_id, 'active_users',
+                                  messages=1 if message_type == "text" else 0,
+                                  images=1 if is_image else 0)
+
+    def get_user_stats(self, user_id: int) -> Optional[dict]:
+        """Get user statistics."""
+        user = self.users.get(user_id)
+        return {column: user[column] for column in _USER_COLUMNS} if user else None
+
+    def get_total_users(self) -> int:
+        """Get total number of users."""
+        return len(self.users)
+
+    def get_daily_image_count_for_user(self, user_id: int) -> int:
+        """Get daily image count for a user."""
+        return self.daily_image_counts.get((user_id, self._get_current_date_str()), 0)
+
+    def ban_user(self, user_id: int):
+        """Ban a user."""
+        with self._lock:
+            self.banned_users.add(user_id)
+        logger.info(f"Banned user: {user_id}")
+
+    def unban_user(self, user_id: int):
+        """Unban a user."""
+        with self._lock:
+            self.banned_users.discard(user_id)
+        logger.info(f"Unbanned user: {user_id}")
+
+    def is_user_banned(self, user_id: int) -> bool:
+        """Check if user is banned."""
+        return user_id in self.banned_users
+
+    def get_banned_users_ids(self) -> List[str]:
+        """Get list of banned user IDs."""
+        return [str(user_id) for user_id in list(self.banned_users)]
+
+    def is_user_premium(self, user_id: int) -> bool:
+        """Check if user is premium."""
+        return user_id in self.premium_users
+
+    def add_premium_user(self, user_id: int) -> bool:
+        """Add a premium user."""
+        with self._lock:
+            self.premium_users.add(user_id)
+        logger.info(f"Added premium user: {user_id}")
+        return True
+
+    def remove_premium_user(self, user_id: int) -> bool:
+        """Remove a premium user."""
+        with self._lock:
+            self.premium_users.discard(user_id)
+        logger.info(f"Removed premium user: {user_id}")
+        return True
+
+    def get_premium_users_ids(self) -> List[str]:
+        """Get list of premium user IDs."""
+        return [str(user_id) for user_id in list(self.premium_users)]
+
+    def get_browse_page(self, kind: str, sort: str, cursor: Optional[tuple] = None,
+                        backwards: bool = False, limit: int = 10) -> tuple:
+        """Get one page of users or groups ordered by a BROWSE_SORTS column, descending.
+
+        Same keyset semantics as `Database.get_browse_page`: `cursor` is the
+        (sort value, id) of the row the page continues from.
+        """
+        id_column = _COLUMNS[kind][0]
+        sort_column = BROWSE_SORTS[kind][sort]
+        key = lambda row: (row[sort_column], row[id_column])
+        rows = sorted(self._rows(kind), key=key, reverse=not backwards)
+        if cursor:
+            rows = [row for row in rows if (key(row) > cursor if backwards else key(row) < cursor)]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        return rows, has_more
+
+    def search_users(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search users by first name, username or user_id."""
+        return self._search("users", lambda user: f"{user['first_name'] or ''} {user['username'] or ''}",
+                            query, limit)
+
+    def set_chats_reachable(self, chat_ids: List[int], reachable: bool) -> int:
+        """Mark users/groups as (un)reachable, e.g. after the bot was blocked or kicked."""
+        updated = 0
+        with self._lock:
+            for chat_id in chat_ids:
+                row = self.users.get(chat_id) or self.groups.get(chat_id)
+                if row is not None and row['is_reachable'] != reachable:
+                    row['is_reachable'] = reachable
+                    updated += 1
+        return updated
+
+    def count_broadcast_audience(self, audience: str, segment: Optional[dict] = None) -> int:
+        """Number of chats a broadcast to this audience/segment would reach."""
+        with self._lock:
+            if audience == "groups":
+                return sum(1 for group in self.groups.values() if group['is_reachable'])
+            users = [user for user in self.users.values() if user['is_reachable']]
+            segment = segment or {}
+            if segment.get("active_days"):
+                since = self._now() - timedelta(days=segment["active_days"])
+                users = [user for user in users if user['last_active'] >= since]
+            if segment.get("premium"):
+                users = [user for user in users if user['user_id'] in self.premium_users]
+            if segment.get("min_messages"):
+                users = [user for user in users if user['message_count'] >= segment["min_messages"]]
+            if segment.get("joined_after"):
+                since = datetime.fromisoformat(segment["joined_after"]).replace(tzinfo=timezone.utc)
+                users = [user for user in users if user['join_date'] >= since]
+            return len(users)
+
+    # ==================== Group Methods ====================
+
+    def add_group(self, chat_id: int, title: str, members_count: Optional[int] = None):
+        """Add or update a group."""
+        now = self._now()
+        with self._lock:
+            group = self.groups.get(chat_id)
+            if group is None:
+                group = self.groups[chat_id] = {
+                    'chat_id': chat_id, 'join_date': now, 'message_count': 0,
+                    'custom_prompt': None, 'auto_scan': False,
+                }
+            group.update(title=title, last_active=now, members_count=members_count, is_reachable=True)
+        logger.info(f"Added/Updated group: {title} ({chat_id})")
+
+    def update_group_activity(self, chat_id: int) -> bool:
+        """Update group activity. Returns True if group exists and was updated."""
+        with self._lock:
+            group = self.groups.get(chat_id)
+            if group is None:
+                return False
+            group['message_count'] += 1
+            group['last_active'] = self._now()
+            group['is_reachable'] = True
+            self._record_activity(self.daily_active_groups, chat_id, 'active_groups', group_messages=1)
+            return True
+
+    def update_group_info(self, chat_id: str, info: Dict[str, Any]):
+        """Update the title and/or members_count of a group."""
+        fields = {key: value for key, value in info.items() if key in ['title', 'members_count']}
+        with self._lock:
+            group = self.groups.get(int(chat_id))
+            if group is not None and fields:
+                group.update(fields)
+                logger.info(f"Updated group info for {chat_id}")
+
+    def remove_group(self, chat_id: str):
+        """Remove a group."""
+        with self._lock:
+            self.groups.pop(int(chat_id), None)
+        logger.info(f"Removed group: {chat_id}")
+
+    def get_total_groups(self) -> int:
+        """Get total number of groups."""
+        return len(self.groups)
+
+    def get_group_counts(self) -> Dict[str, int]:
+        """Number of groups, and of groups that have sent at least one message."""
+        with self._lock:
+            active = sum(1 for group in self.groups.values() if group['message_count'] > 0)
+            return {'total': len(self.groups), 'active': active}
+
+    def get_recent_groups(self, limit: int = 5) -> List[dict]:
+        """Get the most recently active groups."""
+        groups = sorted(self._rows("groups"), key=lambda group: group['last_active'], reverse=True)
+        return groups[:limit]
+
+    def search_groups(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search groups by title or chat_id."""
+        return self._search("groups", lambda group: group['title'], query, limit)
+
+    def cleanup_inactive_groups(self, inactivity_days_threshold: int = 30) -> tuple:
+        """Delete groups that never spoke or have been idle for the threshold."""
+        cutoff = self._now() - timedelta(days=inactivity_days_threshold)
+        with self._lock:
+            removed = [
+                group for group in self.groups.values()
+                if (group['message_count'] == 0 and group['join_date'] < cutoff) or group['last_active'] < cutoff
+            ]
+            for group in removed:
+                del self.groups[group['chat_id']]
+        if removed:
+            logger.info(f"Cleaned up {len(removed)} inactive groups")
+        return len(removed), [{"chat_id": str(group['chat_id']), "title": group['title']} for group in removed]
+
+    def _set_group_field(self, chat_id: int, field: str, value):
+        with self._lock:
+            group = self.groups.get(chat_id)
+            if group is not None:
+                group[field] = value
+
+    def set_group_prompt(self, chat_id: int, prompt: str):
+        """Set a custom prompt for a group."""
+        self._set_group_field(chat_id, 'custom_prompt', prompt)
+
+    def reset_group_prompt(self, chat_id: int):
+        """Reset group prompt to default."""
+        self._set_group_field(chat_id, 'custom_prompt', None)
+
+    def get_group_prompt(self, chat_id: int) -> Optional[str]:
+        """Get custom prompt for a group."""
+        group = self.groups.get(chat_id)
+        return group['custom_prompt'] if group else None
+
+    def set_group_auto_scan(self, chat_id: int, enabled: bool):
+        """Enable or disable automatic link scanning for a group."""
+        self._set_group_field(chat_id, 'auto_scan', enabled)
+
+    def get_group_auto_scan(self, chat_id: int) -> bool:
+        """Whether automatic link scanning is enabled for a group."""
+        group = self.groups.get(chat_id)
+        return bool(group and group['auto_scan'])
+
+    # ==================== Statistics Methods ====================
+
+    def get_counter_values(self, keys: List[str]) -> Dict[str, int]:
+        """Current value of each counter, 0 for unknown keys."""
+        return {key: self.statistics.get(key, 0) for key in keys}
+
+    def get_daily_activity_stats(self, date_str: Optional[str] = None) -> dict:
+        """Get the activity rollup of one day (today by default)."""
+        day = self.activity_daily.get(date_str or self._get_current_date_str(), _EMPTY_DAY)
+        return {
+            'messages': day['messages'],
+            'images': day['images'],
+            'group_messages': day['group_messages'],
+            'unique_active_users': day['active_users'],
+            'active_groups': day['active_groups'],
+        }
+
+    def get_activity_history(self, days: int = 7) -> List[dict]:
+        """Get the daily rollups for the last `days` days, newest first."""
+        today = date.fromisoformat(self._get_current_date_str())
+        history = []
+        with self._lock:
+            for offset in range(days):
+                day = today - timedelta(days=offset)
+                row = self.activity_daily.get(day.isoformat())
+                if row:
+                    history.append(dict(row, date=day))
+        return history
+
+    # ==================== Prompt Methods ====================
+
+    def get_active_prompt(self) -> str:
+        """Get the active prompt, or the default text if none is active."""
+        with self._lock:
+            active = [prompt for prompt in self.prompts.values() if prompt['is_active']]
+        if not active:
+            return self._get_default_prompt_text()
+        return max(active, key=lambda prompt: prompt['updated_at'])['content']
+
+    def get_prompt_content(self, prompt_name: str = 'default') -> str:
+        """Get content of a system prompt by name."""
+        prompt = self.prompts.get(prompt_name)
+        return prompt['content'] if prompt else ""
+
+    def update_prompt(self, name: str, content: str) -> bool:
+        """Create or replace a prompt and make it the only active one."""
+        with self._lock:
+            for prompt in self.prompts.values():
+                prompt['is_active'] = False
+            self.prompts[name] = {'content': content, 'is_active': True, 'updated_at': self._now()}
+        logger.info(f"Updated prompt: {name}")
+        return True
+
+    def reset_to_default_prompt(self) -> bool:
+        """Make the 'default' prompt the only active one."""
+        with self._lock:
+            for name, prompt in self.prompts.items():
+                prompt['is_active'] = name == 'default'
+        logger.info("Reset to default prompt")
+        return True
+
+    # ==================== Link Scan Cache Methods ====================
+
+    def get_url_scan(self, url_key: str) -> Optional[dict]:
+        """Get a cached scan result that has not expired yet."""
+        entry = self.url_scan_cache.get(url_key)
+        if not entry or entry['expires_at'] <= self._now():
+            return None
+        return dict(entry)
+
+    def save_url_scan(self, url_key: str, verdict: str, results: list, ttl_seconds: int):
+        """Store a scan result for ttl_seconds."""
+        entry = {
+            'verdict': verdict,
+            'results': [list(result) for result in results],
+            'expires_at': self._now() + timedelta(seconds=ttl_seconds),
+        }
+        with self._lock:
+            self.url_scan_cache[url_key] = entry
+
+    # ==================== Utility Methods ====================
+
+    def close(self):
+        """Nothing to release."""
@@ -1,18 +1,57 @@
 import psycopg2
 from psycopg2 import pool, sql
 from psycopg2.extras import RealDictCursor
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 import logging
+import json
 import os
+import random
+
+from .migrations import run_migrations
+from .retention import delete_in_batches
+from .storage import BROWSE_SORTS, BROWSE_TABLES, Storage
 
 logger = logging.getLogger(__name__)
 
+# Datasets the admin panel can export, as the SELECT fed to COPY
+EXPORT_QUERIES = {
+    "users": """
+        SELECT u.user_id, u.username, u.first_name, u.join_date, u.last_active, u.message_count, u.image_count,
+               u.is_reachable,
+               EXISTS (SELECT 1 FROM premium_users p WHERE p.user_id = u.user_id) AS is_premium,
+               EXISTS (SELECT 1 FROM banned_users b WHERE b.user_id = u.user_id) AS is_banned
+        FROM users u ORDER BY u.user_id
+    """,
+    "groups": """
+        SELECT chat_id, title, join_date, last_active, message_count, members_count, auto_scan, is_reachable
+        FROM groups ORDER BY chat_id
+    """,
+    "activity_daily": """
+        SELECT date, SUM(messages)::bigint AS messages, SUM(images)::bigint AS images,
+               SUM(group_messages)::bigint AS group_messages, SUM(active_users)::bigint AS active_users,
+               SUM(active_groups)::bigint AS active_groups
+        FROM activity_daily GROUP BY date ORDER BY date
+    """,
+    "activity_hourly": """
+        SELECT hour, SUM(messages)::bigint AS messages, SUM(images)::bigint AS images,
+               SUM(group_messages)::bigint AS group_messages
+        FROM activity_hourly GROUP BY hour ORDER BY hour
+    """,
+}
+
+# Slot rows per sharded counter and per activity rollup day/hour; more slots
+# means less lock contention between writers
+COUNTER_SHARDS = int(os.getenv("COUNTER_SHARDS", "16"))
 
-class Database:
+
+class Database(Storage):
     def __init__(self, postgres_url: str = None):
         """Initialize PostgreSQL database connection."""
         self.postgres_url = postgres_url or os.getenv("POSTGRES_URL")
+        # Fuzzy search needs pg_trgm, which migration 5 installs only if the server allows it
+        self.trigram_search = False
         
         if not self.postgres_url:
             logger.error("PostgreSQL URL not provided. Database will not function.")
@@ -20,16 +59,16 @@ class Database:
             return
         
         try:
-            # Create connection pool
-            self.pool = psycopg2.pool.SimpleConnectionPool(
+            # Thread-safe pool: maintenance jobs, exports and cleanups use it from worker threads
+            self.pool = psycopg2.pool.ThreadedConnectionPool(
                 1, 20,  # min and max connections
                 self.postgres_url
             )
             
             if self.pool:
                 logger.info("PostgreSQL connection pool created successfully.")
-                self._init_tables()
-                self._init_default_prompt()
+                self._run_migrations()
+                self.trigram_search = self._has_extension("pg_trgm")
             else:
                 logger.error("Failed to create PostgreSQL connection pool.")
         except Exception as e:
@@ -47,180 +86,126 @@ class Database:
         if self.pool and conn:
             self.pool.putconn(conn)
 
-    def _init_tables(self):
-        """Initialize all database tables."""
-        conn = None
-        cursor = None
+    @contextmanager
+    def advisory_lock(self, key: int):
+        """Hold the session-level advisory lock `key` on a dedicated connection.
+
+        Yields the connection, or None if the database is unavailable or
+        another session holds the lock. Long batched jobs run on this
+        connection, so they never tie up one from the pool; it is closed
+        afterwards, which also drops the lock if unlocking failed.
+        """
+        if not self.pool:
+            yield None
+            return
+        
+        conn = psycopg2.connect(self.postgres_url)
         try:
-            conn = self._get_connection()
             cursor = conn.cursor()
-            
-            # Users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username VARCHAR(255),
-                    first_name VARCHAR(255),
-                    join_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    message_count INTEGER DEFAULT 0,
-                    image_count INTEGER DEFAULT 0,
-                    last_active TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Banned users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS banned_users (
-                    user_id BIGINT PRIMARY KEY,
-                    banned_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Premium users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS premium_users (
-                    user_id BIGINT PRIMARY KEY,
-                    added_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Groups table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS groups (
-                    chat_id BIGINT PRIMARY KEY,
-                    title VARCHAR(500),
-                    join_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    message_count INTEGER DEFAULT 0,
-                    members_count INTEGER,
-                    last_active TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    custom_prompt TEXT
-                )
-            """)
-
-            # Ensure custom_prompt column exists (for existing tables)
-            cursor.execute("""
-                DO $$
-                BEGIN
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='groups' AND column_name='custom_prompt') THEN
-                        ALTER TABLE groups ADD COLUMN custom_prompt TEXT;
-                    END IF;
-                END $$;
-            """)
-            
-            # Daily image counts table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS daily_image_counts (
-                    user_id BIGINT,
-                    date DATE,
-                    count INTEGER DEFAULT 0,
-                    PRIMARY KEY (user_id, date)
-                )
-            """)
-            
-            # Statistics table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS statistics (
-                    key VARCHAR(100) PRIMARY KEY,
-                    value BIGINT DEFAULT 0,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Initialize statistics keys if not exist
-            cursor.execute("""
-                INSERT INTO statistics (key, value) VALUES ('total_messages', 0)
-                ON CONFLICT (key) DO NOTHING
-            """)
-            cursor.execute("""
-                INSERT INTO statistics (key, value) VALUES ('total_images', 0)
-                ON CONFLICT (key) DO NOTHING
-            """)
-            
-            # Prompts table (NEW)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS prompts (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) UNIQUE NOT NULL,
-                    content TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Bot settings table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS bot_settings (
-                    key VARCHAR(100) PRIMARY KEY,
-                    value TEXT,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            locked = cursor.fetchone()[0]
             conn.commit()
-            logger.info("PostgreSQL Database tables initialized successfully.")
-            
+            if not locked:
+                yield None
+                return
+            try:
+                yield conn
+            finally:
+                try:
+                    conn.rollback()
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+                    conn.commit()
+                except Exception as e:
+                    logger.error(f"Failed to release advisory lock {key}: {e}")
+        finally:
+            conn.close()
+
+    def _run_migrations(self):
+        """Bring the schema up to date; only pending migrations are applied."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            applied = run_migrations(conn)
+            if applied:
+                logger.info(f"Applied {applied} database migration(s).")
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"Failed to initialize tables: {e}", exc_info=True)
+            logger.error(f"Failed to run database migrations: {e}", exc_info=True)
         finally:
-            if cursor:
-                cursor.close()
             if conn:
                 self._return_connection(conn)
 
-    def _init_default_prompt(self):
-        """Initialize default prompt if not exists."""
-        default_prompt = """ملاحظة مرفقة مع الرسالة: كن ودودًا وحنونًا في تواصلك مع المستخدمين، 
-وتحدث بأسلوب طبيعي يجعلهم يشعرون بالراحة والحب . 
-جعل ردودك ممتعة، مرنة ومليئة بالحيوية، مع لمسة شخصية مميزة. 
-لا تذكر اسمي إلا إذا طُلب منك ذلك. 
-استخدم لغة طبيعية وواضحة، ولا تطيل الكلام بلا داعٍ.  
-اسمك على تليجرام هو أبو راس، وتم ربطك عبر بوت تليجرام من قِبل وهيب الشرعبي من اليمن 🇾🇪. 
-تذكر أن جنسيتك يمنية وأن ثقافتك جزء من شخصيتك. 
-عند طلب تقديم معلومات، كن عاقلًا وواقعيًا، مع توضيح المفيد فقط. 
-استخدم الإيموجيات بشكل متناسق لإضفاء المرح والتفاعل، مثل .
-
-━━━━━━━━━━━━━━
-رسالة المستخدم:
-{user_message}
-
-💬 أجب بأسلوب ودود، مرح، وواقعي. أضف لمسة شخصية تجعل المستخدم يريد التفاعل معك دائمًا!"""
-        
+    def _has_extension(self, name: str) -> bool:
+        """Whether the extension is installed in the database."""
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            # Check if default prompt exists
-            cursor.execute("SELECT id FROM prompts WHERE name = 'default'")
-            if not cursor.fetchone():
-                cursor.execute("""
-                    INSERT INTO prompts (name, content, is_active)
-                    VALUES ('default', %s, TRUE)
-                """, (default_prompt,))
-                conn.commit()
-                logger.info("Default prompt initialized.")
-            
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = %s)", (name,))
+            return cursor.fetchone()[0]
         except Exception as e:
-            if conn:
-                conn.rollback()
-            logger.error(f"Failed to initialize default prompt: {e}", exc_info=True)
+            logger.error(f"Error checking extension {name}: {e}")
+            return False
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 self._return_connection(conn)
 
-    def _get_current_utc_iso(self) -> str:
-        """Get current UTC time in ISO format."""
-        return datetime.now(timezone.utc).isoformat()
+    def _current_hour(self) -> datetime:
+        """Start of the current UTC hour, the key for activity_hourly."""
+        return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    def _record_activity(self, cursor, member_table: str, member_column: str, member_id: int,
+                         active_column: str, messages: int = 0, images: int = 0, group_messages: int = 0):
+        """Add one event to the hourly and daily rollups.
+
+        The chat is inserted into `member_table` (daily_active_users or
+        daily_active_groups) once per day; only that first insert bumps
+        `active_column`, so the distinct count never needs a COUNT(DISTINCT).
+        Each event goes to a random slot row of its day and hour, so
+        concurrent writers rarely wait on each other's row locks.
+        """
+        slot = random.randrange(COUNTER_SHARDS)
+        cursor.execute(f"""
+            WITH seen AS (
+                INSERT INTO {member_table} (date, {member_column}) VALUES (%(date)s, %(member_id)s)
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            )
+            INSERT INTO activity_daily (date, slot, messages, images, group_messages, {active_column})
+            SELECT %(date)s, %(slot)s, %(messages)s, %(images)s, %(group_messages)s, COUNT(*) FROM seen
+            ON CONFLICT (date, slot) DO UPDATE SET
+                messages = activity_daily.messages + EXCLUDED.messages,
+                images = activity_daily.images + EXCLUDED.images,
+                group_messages = activity_daily.group_messages + EXCLUDED.group_messages,
+                {active_column} = activity_daily.{active_column} + EXCLUDED.{active_column}
+        """, {
+            "date": self._get_current_date_str(),
+            "member_id": member_id,
+            "slot": slot,
+            "messages": messages,
+            "images": images,
+            "group_messages": group_messages,
+        })
+        if messages or images or group_messages:
+            cursor.execute("""
+                INSERT INTO activity_hourly (hour, slot, messages, images, group_messages)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (hour, slot) DO UPDATE SET
+                    messages = activity_hourly.messages + EXCLUDED.messages,
+                    images = activity_hourly.images + EXCLUDED.images,
+                    group_messages = activity_hourly.group_messages + EXCLUDED.group_messages
+            """, (self._current_hour(), slot, messages, images, group_messages))
 
-    def _get_current_date_str(self) -> str:
-        """Get current date string."""
-        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    def _increment_counter(self, cursor, key: str, amount: int = 1):
+        """Add `amount` to a random slot of a sharded counter."""
+        cursor.execute("""
+            INSERT INTO statistics_shards (key, slot, value) VALUES (%s, %s, %s)
+            ON CONFLICT (key, slot) DO UPDATE SET value = statistics_shards.value + EXCLUDED.value
+        """, (key, random.randrange(COUNTER_SHARDS), amount))
 
     # ==================== User Methods ====================
     
@@ -259,7 +244,8 @@ class Database:
                 ON CONFLICT (user_id) DO UPDATE SET
                     username = EXCLUDED.username,
                     first_name = EXCLUDED.first_name,
-                    last_active = EXCLUDED.last_active
+                    last_active = EXCLUDED.last_active,
+                    is_reachable = TRUE
             """, (user_id, username or "", first_name or "المستخدم", 
                   self._get_current_utc_iso(), self._get_current_utc_iso()))
             
@@ -289,7 +275,7 @@ class Database:
             
             # Update user last_active
             cursor.execute("""
-                UPDATE users SET last_active = %s WHERE user_id = %s
+                UPDATE users SET last_active = %s, is_reachable = TRUE WHERE user_id = %s
             """, (self._get_current_utc_iso(), user_id))
             
             if message_type == "text":
@@ -299,9 +285,7 @@ class Database:
                 """, (user_id,))
                 
                 # Update total messages statistics
-                cursor.execute("""
-                    UPDATE statistics SET value = value + 1, updated_at = %s WHERE key = 'total_messages'
-                """, (self._get_current_utc_iso(),))
+                self._increment_counter(cursor, 'total_messages')
                 
             elif message_type in ["photo", "image"]:
                 # Update user image count
@@ -310,9 +294,7 @@ class Database:
                 """, (user_id,))
                 
                 # Update total images statistics
-                cursor.execute("""
-                    UPDATE statistics SET value = value + 1, updated_at = %s WHERE key = 'total_images'
-                """, (self._get_current_utc_iso(),))
+                self._increment_counter(cursor, 'total_images')
                 
                 # Update daily image count
                 today = self._get_current_date_str()
@@ -322,6 +304,12 @@ class Database:
                     ON CONFLICT (user_id, date) DO UPDATE SET count = daily_image_counts.count + 1
                 """, (user_id, today))
             
+            self._record_activity(
+                cursor, "daily_active_users", "user_id", user_id, "active_users",
+                messages=1 if message_type == "text" else 0,
+                images=1 if message_type in ["photo", "image"] else 0
+            )
+            
             conn.commit()
             
         except Exception as e:
@@ -357,26 +345,45 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
-    def get_all_users_data(self) -> Dict[str, dict]:
-        """Get all users data."""
+    def get_browse_page(self, kind: str, sort: str, cursor: Optional[tuple] = None,
+                        backwards: bool = False, limit: int = 10) -> tuple:
+        """Get one page of users or groups ordered by a BROWSE_SORTS column, descending.
+
+        Keyset pagination: `cursor` is the (sort value, id) of the row the
+        page continues from: the last row shown when going forward, the
+        first when going `backwards`. Each page is one range scan on the
+        (column, id) index however deep it is. Returns (rows, has_more),
+        where has_more says whether another page exists in that direction.
+        """
+        table, id_column, columns = BROWSE_TABLES[kind]
+        sort_column = BROWSE_SORTS[kind][sort]
+        order = "ASC" if backwards else "DESC"
+        query = f"SELECT {columns} FROM {table}"
+        params = []
+        if cursor:
+            query += f" WHERE ({sort_column}, {id_column}) {'>' if backwards else '<'} (%s, %s)"
+            params.extend(cursor)
+        query += f" ORDER BY {sort_column} {order}, {id_column} {order} LIMIT %s"
+        params.append(limit + 1)
+        
         conn = None
-        cursor = None
+        db_cursor = None
         try:
             conn = self._get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
-                SELECT user_id, username, first_name, join_date, message_count, 
-                       image_count, last_active
-                FROM users
-            """)
-            results = cursor.fetchall()
-            return {str(row['user_id']): dict(row) for row in results}
+            db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+            db_cursor.execute(query, params)
+            rows = [dict(row) for row in db_cursor.fetchall()]
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if backwards:
+                rows.reverse()
+            return rows, has_more
         except Exception as e:
-            logger.error(f"Error getting all users: {e}")
-            return {}
+            logger.error(f"Error browsing {kind}: {e}")
+            return [], False
         finally:
-            if cursor:
-                cursor.close()
+            if db_cursor:
+                db_cursor.close()
             if conn:
                 self._return_connection(conn)
 
@@ -420,28 +427,6 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
-    def get_user_info(self, user_id: int) -> Optional[dict]:
-        """Get user info (alias for get_user_stats)."""
-        return self.get_user_stats(user_id)
-
-    def get_all_user_ids_for_broadcast(self) -> List[str]:
-        """Get all user IDs for broadcasting."""
-        conn = None
-        cursor = None
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users")
-            return [str(row[0]) for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting user IDs: {e}")
-            return []
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                self._return_connection(conn)
-
     # ==================== Ban/Premium Methods ====================
     
     def ban_user(self, user_id: int):
@@ -638,13 +623,20 @@ class Database:
                 ON CONFLICT (chat_id) DO UPDATE SET
                     title = EXCLUDED.title,
                     last_active = EXCLUDED.last_active,
-                    members_count = EXCLUDED.members_count
+                    members_count = EXCLUDED.members_count,
+                    is_reachable = TRUE
             """, (chat_id, title, current_time, current_time, members_count))
             
             conn.commit()
             logger.info(f"Added/Updated group: {title} ({chat_id})")
             
         except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to add group {chat_id}: {e}", exc_info=True)
+        finally:
+            if cursor:
+                cursor.close()
             if conn:
                 self._return_connection(conn)
 
@@ -720,6 +712,53 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
+    def set_group_auto_scan(self, chat_id: int, enabled: bool):
+        """Enable or disable automatic link scanning for a group."""
+        if not self.pool:
+            return
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE groups SET auto_scan = %s WHERE chat_id = %s
+            """, (enabled, chat_id))
+            conn.commit()
+            logger.info(f"Set auto_scan={enabled} for group {chat_id}")
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to set group auto_scan: {e}", exc_info=True)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_group_auto_scan(self, chat_id: int) -> bool:
+        """Whether automatic link scanning is enabled for a group."""
+        if not self.pool:
+            return False
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT auto_scan FROM groups WHERE chat_id = %s", (chat_id,))
+            result = cursor.fetchone()
+            return bool(result and result[0])
+        except Exception as e:
+            logger.error(f"Error getting group auto_scan: {e}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
     def get_prompt_content(self, prompt_name: str = 'default') -> str:
         """Get content of a system prompt by name."""
         conn = None
@@ -740,21 +779,40 @@ class Database:
                 self._return_connection(conn)
 
 
-    def get_all_groups(self) -> List[Dict[str, Any]]:
-        """Get all groups."""
+    def get_group_counts(self) -> Dict[str, int]:
+        """Number of groups, and of groups that have sent at least one message."""
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             cursor.execute("""
-                SELECT chat_id, title, join_date, message_count, members_count, last_active
-                FROM groups ORDER BY last_active DESC
+                SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE message_count > 0) AS active FROM groups
             """)
-            results = cursor.fetchall()
-            return [dict(row) for row in results]
+            return dict(cursor.fetchone())
+        except Exception as e:
+            logger.error(f"Error counting groups: {e}")
+            return {'total': 0, 'active': 0}
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_recent_groups(self, limit: int = 5) -> List[dict]:
+        """Get the most recently active groups (uses idx_groups_last_active_id)."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT chat_id, title, join_date, message_count, members_count, last_active
+                FROM groups ORDER BY last_active DESC LIMIT %s
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"Error getting groups: {e}")
+            logger.error(f"Error getting recent groups: {e}")
             return []
         finally:
             if cursor:
@@ -762,6 +820,24 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
+    def get_total_groups(self) -> int:
+        """Get total number of groups."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM groups")
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error getting total groups: {e}")
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
     def update_group_activity(self, chat_id: int) -> bool:
         """Update group activity. Returns True if group exists and was updated."""
         if not self.pool:
@@ -775,10 +851,14 @@ class Database:
             cursor.execute("""
                 UPDATE groups SET 
                     message_count = message_count + 1,
-                    last_active = %s
+                    last_active = %s,
+                    is_reachable = TRUE
                 WHERE chat_id = %s
             """, (self._get_current_utc_iso(), chat_id))
             updated = cursor.rowcount > 0
+            if updated:
+                self._record_activity(cursor, "daily_active_groups", "chat_id", chat_id, "active_groups",
+                                      group_messages=1)
             conn.commit()
             return updated
         except Exception as e:
@@ -851,22 +931,86 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
-    def search_groups(self, query: str) -> List[Dict[str, Any]]:
-        """Search groups by title or chat_id."""
+    def migrate_group(self, old_chat_id: int, new_chat_id: int) -> bool:
+        """Move a group to the id of the supergroup it was upgraded to.
+
+        If the new id is already stored (the bot saw the supergroup first),
+        the old row is dropped instead. Returns True if anything changed.
+        """
+        if not self.pool:
+            return False
+        
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = conn.cursor()
             cursor.execute("""
-                SELECT chat_id, title, join_date, message_count, members_count, last_active
-                FROM groups
-                WHERE LOWER(title) LIKE %s OR CAST(chat_id AS TEXT) LIKE %s
-            """, (f'%{query.lower()}%', f'%{query}%'))
-            results = cursor.fetchall()
-            return [dict(row) for row in results]
+                UPDATE groups SET chat_id = %(new)s, is_reachable = TRUE
+                WHERE chat_id = %(old)s AND NOT EXISTS (SELECT 1 FROM groups WHERE chat_id = %(new)s)
+            """, {"old": old_chat_id, "new": new_chat_id})
+            changed = cursor.rowcount
+            cursor.execute("DELETE FROM groups WHERE chat_id = %s", (old_chat_id,))
+            changed += cursor.rowcount
+            conn.commit()
+            logger.info(f"Migrated group {old_chat_id} to {new_chat_id}")
+            return changed > 0
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to migrate group {old_chat_id}: {e}", exc_info=True)
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    # Indexed expressions from migration 5; queries must repeat them exactly to use the GIN indexes
+    _GROUP_SEARCH_EXPR = "normalize_search(title)"
+    _USER_SEARCH_EXPR = "normalize_search(COALESCE(first_name, '') || ' ' || COALESCE(username, ''))"
+
+    def _search(self, table: str, id_column: str, columns: str, expression: str,
+                query: str, limit: int) -> List[Dict[str, Any]]:
+        """Trigram search over `expression`, best matches first.
+
+        A row matches if the normalized query is a substring of it or a
+        close fuzzy match for one of its words; both use the GIN index.
+        A numeric query also matches the id exactly. Without pg_trgm only
+        substring matches are found, most recently active first.
+        """
+        query = query.strip().lstrip("@")
+        if not query:
+            return []
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        id_match = int(query) if query.lstrip("-").isdigit() else None
+        if self.trigram_search:
+            sql_query = f"""
+                SELECT {columns}, word_similarity(normalize_search(%(query)s), {expression}) AS rank
+                FROM {table}
+                WHERE {expression} LIKE normalize_search(%(pattern)s)
+                   OR normalize_search(%(query)s) <%% {expression}
+                   OR {id_column} = %(id_match)s
+                ORDER BY {id_column} = %(id_match)s DESC NULLS LAST, rank DESC
+                LIMIT %(limit)s
+            """
+        else:
+            sql_query = f"""
+                SELECT {columns} FROM {table}
+                WHERE {expression} LIKE normalize_search(%(pattern)s) OR {id_column} = %(id_match)s
+                ORDER BY {id_column} = %(id_match)s DESC NULLS LAST, last_active DESC
+                LIMIT %(limit)s
+            """
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(sql_query, {"query": query, "pattern": pattern, "id_match": id_match, "limit": limit})
+            return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"Error searching groups: {e}")
+            logger.error(f"Error searching {table}: {e}")
             return []
         finally:
             if cursor:
@@ -874,38 +1018,38 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
+    def search_groups(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search groups by title or chat_id."""
+        return self._search(
+            "groups", "chat_id", "chat_id, title, join_date, message_count, members_count, last_active",
+            self._GROUP_SEARCH_EXPR, query, limit
+        )
+
+    def search_users(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search users by first name, username or user_id."""
+        return self._search(
+            "users", "user_id", "user_id, username, first_name, message_count, image_count, last_active",
+            self._USER_SEARCH_EXPR, query, limit
+        )
+
     def cleanup_inactive_groups(self, inactivity_days_threshold: int = 30) -> tuple:
-        """Clean up inactive groups."""
+        """Clean up inactive groups, in batches so a large cleanup never holds long locks."""
         if not self.pool:
             return 0, []
         
         conn = None
-        cursor = None
         try:
             conn = self._get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Get inactive groups
-            cursor.execute("""
-                SELECT chat_id, title FROM groups
-                WHERE (message_count = 0 AND join_date < NOW() - INTERVAL '%s days')
-                   OR (last_active < NOW() - INTERVAL '%s days')
-            """, (inactivity_days_threshold, inactivity_days_threshold))
-            
-            inactive_groups = cursor.fetchall()
-            removed_count = len(inactive_groups)
-            removed_groups_info = [{"chat_id": str(g['chat_id']), "title": g['title']} for g in inactive_groups]
-            
-            # Delete inactive groups
-            if inactive_groups:
-                chat_ids = [g['chat_id'] for g in inactive_groups]
-                cursor.execute("""
-                    DELETE FROM groups WHERE chat_id = ANY(%s)
-                """, (chat_ids,))
-                conn.commit()
+            removed_count, _, removed = delete_in_batches(
+                conn, "groups",
+                """(message_count = 0 AND join_date < NOW() - %(days)s * INTERVAL '1 day')
+                   OR last_active < NOW() - %(days)s * INTERVAL '1 day'""",
+                {"days": inactivity_days_threshold},
+                returning="chat_id, title"
+            )
+            if removed_count:
                 logger.info(f"Cleaned up {removed_count} inactive groups")
-            
-            return removed_count, removed_groups_info
+            return removed_count, [{"chat_id": str(chat_id), "title": title} for chat_id, title in removed]
             
         except Exception as e:
             if conn:
@@ -913,116 +1057,233 @@ class Database:
             logger.error(f"Failed to cleanup groups: {e}", exc_info=True)
             return 0, []
         finally:
-            if cursor:
-                cursor.close()
             if conn:
                 self._return_connection(conn)
 
     # ==================== Statistics Methods ====================
     
-    def get_total_stats(self) -> dict:
-        """Get total statistics."""
+    def get_counter_values(self, keys: List[str]) -> Dict[str, int]:
+        """Current value of each counter: its statistics row plus its unfolded slots."""
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            stats = {}
-            cursor.execute("SELECT value FROM statistics WHERE key = 'total_messages'")
-            result = cursor.fetchone()
-            stats['total_messages'] = result[0] if result else 0
-            
-            cursor.execute("SELECT value FROM statistics WHERE key = 'total_images'")
-            result = cursor.fetchone()
-            stats['total_images'] = result[0] if result else 0
-            
-            stats['total_users'] = self.get_total_users()
-            
-            return stats
+            cursor.execute("""
+                SELECT key, SUM(value) FROM (
+                    SELECT key, value FROM statistics WHERE key = ANY(%s)
+                    UNION ALL
+                    SELECT key, value FROM statistics_shards WHERE key = ANY(%s)
+                ) counters
+                GROUP BY key
+            """, (keys, keys))
+            values = dict.fromkeys(keys, 0)
+            values.update((key, int(total)) for key, total in cursor.fetchall())
+            return values
         except Exception as e:
-            logger.error(f"Error getting total stats: {e}")
-            return {'total_messages': 0, 'total_images': 0, 'total_users': 0}
+            logger.error(f"Error getting counters: {e}")
+            return dict.fromkeys(keys, 0)
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 self._return_connection(conn)
 
-    def get_daily_activity_stats(self, date_str: Optional[str] = None) -> dict:
-        """Get daily activity statistics."""
-        if date_str is None:
-            date_str = self._get_current_date_str()
+    def compact_counters(self) -> int:
+        """Fold every counter slot into its statistics row; returns the number of slots folded.
+
+        Deleting the slots and adding them to statistics is one statement, so
+        readers see the total either before or after, never counted twice.
+        """
+        if not self.pool:
+            return 0
         
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            # Count daily images
             cursor.execute("""
-                SELECT COALESCE(SUM(count), 0) FROM daily_image_counts WHERE date = %s
-            """, (date_str,))
-            images = cursor.fetchone()[0]
-            
-            # Note: We don't have daily message tracking yet, so we return 0
-            # You can add a similar table for daily messages if needed
-            
-            return {
-                'messages': 0,  # Would need daily_message_counts table
-                'images': images,
-                'unique_active_users': 0  # Would need tracking
-            }
+                WITH moved AS (
+                    DELETE FROM statistics_shards RETURNING key, value
+                ), folded AS (
+                    INSERT INTO statistics (key, value, updated_at)
+                    SELECT key, SUM(value), NOW() FROM moved GROUP BY key
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = statistics.value + EXCLUDED.value,
+                        updated_at = EXCLUDED.updated_at
+                )
+                SELECT COUNT(*) FROM moved
+            """)
+            folded = cursor.fetchone()[0]
+            conn.commit()
+            return folded
         except Exception as e:
-            logger.error(f"Error getting daily stats: {e}")
-            return {'messages': 0, 'images': 0, 'unique_active_users': 0}
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to compact counters: {e}", exc_info=True)
+            return 0
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 self._return_connection(conn)
 
-    # ==================== Prompt Methods (NEW) ====================
-    
-    def get_active_prompt(self) -> str:
-        """Get the active prompt."""
+    def get_daily_activity_stats(self, date_str: Optional[str] = None) -> dict:
+        """Get daily activity statistics from the activity_daily rollup."""
+        if date_str is None:
+            date_str = self._get_current_date_str()
+        
+        empty = {'messages': 0, 'images': 0, 'group_messages': 0, 'unique_active_users': 0, 'active_groups': 0}
         conn = None
         cursor = None
         try:
             conn = self._get_connection()
-            cursor = conn.cursor()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
             cursor.execute("""
-                SELECT content FROM prompts WHERE is_active = TRUE ORDER BY updated_at DESC LIMIT 1
-            """)
+                SELECT SUM(messages)::bigint AS messages, SUM(images)::bigint AS images,
+                       SUM(group_messages)::bigint AS group_messages,
+                       SUM(active_users)::bigint AS unique_active_users, SUM(active_groups)::bigint AS active_groups
+                FROM activity_daily WHERE date = %s
+                GROUP BY date
+            """, (date_str,))
             result = cursor.fetchone()
-            return result[0] if result else self._get_default_prompt_text()
+            return dict(result) if result else empty
         except Exception as e:
-            logger.error(f"Error getting active prompt: {e}")
-            return self._get_default_prompt_text()
+            logger.error(f"Error getting daily stats: {e}")
+            return empty
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_activity_history(self, days: int = 7) -> List[dict]:
+        """Get the daily rollups for the last `days` days, newest first."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT date, SUM(messages)::bigint AS messages, SUM(images)::bigint AS images,
+                       SUM(group_messages)::bigint AS group_messages,
+                       SUM(active_users)::bigint AS active_users, SUM(active_groups)::bigint AS active_groups
+                FROM activity_daily
+                WHERE date > %s::date - %s
+                GROUP BY date
+                ORDER BY date DESC
+            """, (self._get_current_date_str(), days))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting activity history: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_hourly_activity(self, hours: int = 24) -> List[dict]:
+        """Get the hourly rollups for the last `hours` hours, oldest first."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT hour, SUM(messages)::bigint AS messages, SUM(images)::bigint AS images,
+                       SUM(group_messages)::bigint AS group_messages
+                FROM activity_hourly
+                WHERE hour > %s - make_interval(hours => %s)
+                GROUP BY hour
+                ORDER BY hour
+            """, (self._current_hour(), hours))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting hourly activity: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_recent_users(self, limit: int = 5) -> List[dict]:
+        """Get the most recently active users (uses idx_users_last_active)."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT user_id, username, first_name, message_count, image_count, last_active
+                FROM users ORDER BY last_active DESC LIMIT %s
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting recent users: {e}")
+            return []
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 self._return_connection(conn)
 
-    def _get_default_prompt_text(self) -> str:
-        """Get default prompt text."""
-        return """ملاحظة مرفقة مع الرسالة: كن ودودًا وحنونًا في تواصلك مع المستخدمين، 
-وتحدث بأسلوب طبيعي يجعلهم يشعرون بالراحة والحب . 
-جعل ردودك ممتعة، مرنة ومليئة بالحيوية، مع لمسة شخصية مميزة. 
-لا تذكر اسمي إلا إذا طُلب منك ذلك. 
-استخدم لغة طبيعية وواضحة، ولا تطيل الكلام بلا داعٍ.  
-اسمك على تليجرام هو أبو راس، وتم ربطك عبر بوت تليجرام من قِبل وهيب الشرعبي من اليمن 🇾🇪. 
-تذكر أن جنسيتك يمنية وأن ثقافتك جزء من شخصيتك. 
-عند طلب تقديم معلومات، كن عاقلًا وواقعيًا، مع توضيح المفيد فقط. 
-استخدم الإيموجيات بشكل متناسق لإضفاء المرح والتفاعل، مثل .
+    def export_dataset(self, name: str, fmt: str, fileobj) -> int:
+        """Stream an EXPORT_QUERIES dataset into `fileobj` as CSV or JSON lines; returns the row count.
 
-━━━━━━━━━━━━━━
-رسالة المستخدم:
-{user_message}
+        The rows go from COPY ... TO STDOUT straight into the file, so
+        memory use does not depend on the table size. Blocking: call it
+        from a worker thread (the pool is thread-safe).
+        """
+        query = EXPORT_QUERIES[name]
+        if fmt == "csv":
+            copy_sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+        else:
+            # One JSON object per line. CSV with quote/delimiter characters that never
+            # appear in row_to_json output keeps COPY from escaping the JSON text.
+            copy_sql = (
+                f"COPY (SELECT row_to_json(t) FROM ({query}) t) TO STDOUT "
+                f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+            )
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.copy_expert(copy_sql, fileobj)
+            return cursor.rowcount
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.rollback()
+                self._return_connection(conn)
 
-💬 أجب بأسلوب ودود، مرح، وواقعي. أضف لمسة شخصية تجعل المستخدم يريد التفاعل معك دائمًا!"""
+    # ==================== Prompt Methods (NEW) ====================
+    
+    def get_active_prompt(self) -> str:
+        """Get the active prompt."""
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT content FROM prompts WHERE is_active = TRUE ORDER BY updated_at DESC LIMIT 1
+            """)
+            result = cursor.fetchone()
+            return result[0] if result else self._get_default_prompt_text()
+        except Exception as e:
+            logger.error(f"Error getting active prompt: {e}")
+            return self._get_default_prompt_text()
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
 
     def update_prompt(self, name: str, content: str) -> bool:
         """Update or create a prompt."""
@@ -1093,16 +1354,388 @@ class Database:
             if conn:
                 self._return_connection(conn)
 
+    # ==================== Link Scan Cache Methods ====================
+
+    def get_url_scan(self, url_key: str) -> Optional[dict]:
+        """Get a cached scan result that has not expired yet."""
+        if not self.pool:
+            return None
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT verdict, results, expires_at FROM url_scan_cache
+                WHERE url_key = %s AND expires_at > NOW()
+            """, (url_key,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Error getting cached url scan: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def save_url_scan(self, url_key: str, verdict: str, results: list, ttl_seconds: int):
+        """Store a scan result for ttl_seconds."""
+        if not self.pool:
+            return
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO url_scan_cache (url_key, verdict, results, scanned_at, expires_at)
+                VALUES (%s, %s, %s::jsonb, NOW(), NOW() + %s * INTERVAL '1 second')
+                ON CONFLICT (url_key) DO UPDATE SET
+                    verdict = EXCLUDED.verdict,
+                    results = EXCLUDED.results,
+                    scanned_at = EXCLUDED.scanned_at,
+                    expires_at = EXCLUDED.expires_at
+            """, (url_key, verdict, json.dumps(results, ensure_ascii=False), ttl_seconds))
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to save url scan: {e}", exc_info=True)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    # ==================== Broadcast Job Methods ====================
+
+    def _broadcast_audience_query(self, audience: str, segment: Optional[dict] = None) -> tuple:
+        """SQL selecting the chat ids of an audience, plus its parameters.
+
+        Users can be narrowed with a segment dict: active_days (active in the
+        last N days), premium (premium users only), min_messages and
+        joined_after (ISO date). Unreachable chats are always skipped.
+        """
+        if audience == "groups":
+            return "SELECT chat_id FROM groups WHERE is_reachable", []
+
+        segment = segment or {}
+        clauses = ["u.is_reachable"]
+        params = []
+        if segment.get("active_days"):
+            clauses.append("u.last_active >= NOW() - %s * INTERVAL '1 day'")
+            params.append(segment["active_days"])
+        if segment.get("premium"):
+            clauses.append("EXISTS (SELECT 1 FROM premium_users p WHERE p.user_id = u.user_id)")
+        if segment.get("min_messages"):
+            clauses.append("u.message_count >= %s")
+            params.append(segment["min_messages"])
+        if segment.get("joined_after"):
+            clauses.append("u.join_date >= %s::date")
+            params.append(segment["joined_after"])
+        return "SELECT u.user_id FROM users u WHERE " + " AND ".join(clauses), params
+
+    def count_broadcast_audience(self, audience: str, segment: Optional[dict] = None) -> int:
+        """Number of chats a broadcast to this audience/segment would reach."""
+        if not self.pool:
+            return 0
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            query, params = self._broadcast_audience_query(audience, segment)
+            cursor.execute("SELECT COUNT(*) FROM (" + query + ") AS recipients", params)
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting broadcast audience: {e}")
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def create_broadcast_job(self, audience: str, payload: dict, created_by: int, admin_chat_id: int,
+                             segment: Optional[dict] = None) -> Optional[dict]:
+        """Create a job and its recipient rows in one transaction. Returns {"id", "total"}.
+
+        Recipients are selected and inserted entirely server-side.
+        """
+        if not self.pool:
+            return None
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO broadcast_jobs (audience, segment, payload, created_by, admin_chat_id)
+                VALUES (%s, %s::jsonb, %s::jsonb, %s, %s)
+                RETURNING id
+            """, (audience, json.dumps(segment) if segment else None,
+                  json.dumps(payload, ensure_ascii=False), created_by, admin_chat_id))
+            job_id = cursor.fetchone()[0]
+            query, params = self._broadcast_audience_query(audience, segment)
+            cursor.execute(
+                "INSERT INTO broadcast_recipients (job_id, chat_id) "
+                "SELECT %s, recipients.id FROM (" + query + ") AS recipients(id) "
+                "ON CONFLICT DO NOTHING",
+                [job_id] + params
+            )
+            total = cursor.rowcount
+            conn.commit()
+            logger.info(f"Created broadcast job {job_id} for {total} {audience}")
+            return {"id": job_id, "total": total}
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to create broadcast job: {e}", exc_info=True)
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_broadcast_job(self, job_id: int) -> Optional[dict]:
+        """Get a broadcast job by id."""
+        if not self.pool:
+            return None
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("SELECT * FROM broadcast_jobs WHERE id = %s", (job_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Error getting broadcast job: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_broadcast_jobs(self, statuses: Optional[List[str]] = None, limit: int = 10) -> List[dict]:
+        """Most recent broadcast jobs, optionally filtered by status."""
+        if not self.pool:
+            return []
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            if statuses:
+                cursor.execute("""
+                    SELECT * FROM broadcast_jobs WHERE status = ANY(%s)
+                    ORDER BY id DESC LIMIT %s
+                """, (statuses, limit))
+            else:
+                cursor.execute("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT %s", (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting broadcast jobs: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def update_broadcast_job(self, job_id: int, status: Optional[str] = None,
+                             progress_message_id: Optional[int] = None) -> bool:
+        """Change a job's status and/or the admin message that shows its progress."""
+        if not self.pool:
+            return False
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE broadcast_jobs SET
+                    status = COALESCE(%s, status),
+                    progress_message_id = COALESCE(%s, progress_message_id),
+                    finished_at = CASE WHEN %s IN ('completed', 'cancelled') THEN NOW() ELSE finished_at END
+                WHERE id = %s
+            """, (status, progress_message_id, status, job_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to update broadcast job: {e}", exc_info=True)
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def claim_broadcast_batch(self, job_id: int, batch_size: int) -> Optional[List[int]]:
+        """Mark up to batch_size pending recipients as 'sending' and return their chat ids.
+
+        SKIP LOCKED lets several workers claim from the same job without
+        ever handing out the same recipient twice. Returns None if the
+        claim failed, so an error is never mistaken for "nothing left".
+        """
+        if not self.pool:
+            return None
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE broadcast_recipients SET status = 'sending', updated_at = NOW()
+                WHERE job_id = %s AND chat_id IN (
+                    SELECT chat_id FROM broadcast_recipients
+                    WHERE job_id = %s AND status = 'pending'
+                    ORDER BY chat_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING chat_id
+            """, (job_id, job_id, batch_size))
+            chat_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            return chat_ids
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to claim broadcast batch: {e}", exc_info=True)
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def record_broadcast_results(self, job_id: int, results: Dict[str, List[int]]):
+        """Store delivery outcomes, given as {status: [chat_id, ...]}."""
+        if not self.pool:
+            return
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            for status, chat_ids in results.items():
+                if chat_ids:
+                    cursor.execute("""
+                        UPDATE broadcast_recipients SET status = %s, updated_at = NOW()
+                        WHERE job_id = %s AND chat_id = ANY(%s)
+                    """, (status, job_id, chat_ids))
+            conn.commit()
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to record broadcast results: {e}", exc_info=True)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def requeue_stalled_broadcast_recipients(self, job_id: int) -> int:
+        """Return recipients left in 'sending' by an interrupted run to 'pending'."""
+        if not self.pool:
+            return 0
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE broadcast_recipients SET status = 'pending', updated_at = NOW()
+                WHERE job_id = %s AND status = 'sending'
+            """, (job_id,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to requeue broadcast recipients: {e}", exc_info=True)
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def set_chats_reachable(self, chat_ids: List[int], reachable: bool) -> int:
+        """Mark users/groups as (un)reachable, e.g. after the bot was blocked or kicked."""
+        if not self.pool or not chat_ids:
+            return 0
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            # Private chat ids are positive and group ids negative, so each id hits one table
+            cursor.execute("""
+                UPDATE users SET is_reachable = %s WHERE user_id = ANY(%s) AND is_reachable <> %s
+            """, (reachable, chat_ids, reachable))
+            updated = cursor.rowcount
+            cursor.execute("""
+                UPDATE groups SET is_reachable = %s WHERE chat_id = ANY(%s) AND is_reachable <> %s
+            """, (reachable, chat_ids, reachable))
+            updated += cursor.rowcount
+            conn.commit()
+            return updated
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            logger.error(f"Failed to update chat reachability: {e}", exc_info=True)
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
+    def get_broadcast_progress(self, job_id: int) -> Dict[str, int]:
+        """Recipient counts per status for a job."""
+        if not self.pool:
+            return {}
+        
+        conn = None
+        cursor = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT status, COUNT(*) FROM broadcast_recipients
+                WHERE job_id = %s GROUP BY status
+            """, (job_id,))
+            return {status: count for status, count in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Error getting broadcast progress: {e}")
+            return {}
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self._return_connection(conn)
+
     # ==================== Utility Methods ====================
     
-    def can_user_send_image(self, user_id: int, premium_image_limit: int = 999, 
-                           free_user_image_limit: int = 7) -> bool:
-        """Check if user can send image based on daily limit."""
-        if self.is_user_premium(user_id):
-            return self.get_daily_image_count_for_user(user_id) < premium_image_limit
-        else:
-            return self.get_daily_image_count_for_user(user_id) < free_user_image_limit
-
     def close(self):
         """Close all database connections."""
         if self.pool:
@@ -0,0 +1,662 @@
+"""
+SQLite storage backend, using only the standard library.
+
+Implements the `Storage` interface with the same tables and upserts as the
+PostgreSQL `Database` (minus the Postgres-only features), for local runs,
+tests and benchmarks. One connection is shared behind a lock; SQLite
+serializes writers anyway. Timestamps are stored as ISO-8601 UTC text and
+returned as aware datetimes, like psycopg2 returns TIMESTAMPTZ columns.
+"""
+
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+
+from .storage import BROWSE_SORTS, BROWSE_TABLES, Storage, normalize_search
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        join_date TEXT NOT NULL,
+        message_count INTEGER DEFAULT 0,
+        image_count INTEGER DEFAULT 0,
+        last_active TEXT NOT NULL,
+        is_reachable INTEGER DEFAULT 1
+    );
+    CREATE TABLE IF NOT EXISTS banned_users (user_id INTEGER PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS premium_users (user_id INTEGER PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS groups (
+        chat_id INTEGER PRIMARY KEY,
+        title TEXT,
+        join_date TEXT NOT NULL,
+        message_count INTEGER DEFAULT 0,
+        members_count INTEGER,
+        last_active TEXT NOT NULL,
+        custom_prompt TEXT,
+        auto_scan INTEGER DEFAULT 0,
+        is_reachable INTEGER DEFAULT 1
+    );
+    CREATE INDEX IF NOT EXISTS idx_groups_last_active ON groups (last_active);
+    CREATE TABLE IF NOT EXISTS daily_image_counts (
+        user_id INTEGER,
+        date TEXT,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    );
+    CREATE TABLE IF NOT EXISTS statistics (key TEXT PRIMARY KEY, value INTEGER DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS activity_daily (
+        date TEXT PRIMARY KEY,
+        messages INTEGER NOT NULL DEFAULT 0,
+        images INTEGER NOT NULL DEFAULT 0,
+        group_messages INTEGER NOT NULL DEFAULT 0,
+        active_users INTEGER NOT NULL DEFAULT 0,
+        active_groups INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS daily_active_users (date TEXT, user_id INTEGER, PRIMARY KEY (date, user_id));
+    CREATE TABLE IF NOT EXISTS daily_active_groups (date TEXT, chat_id INTEGER, PRIMARY KEY (date, chat_id));
+    CREATE TABLE IF NOT EXISTS prompts (
+        name TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        is_active INTEGER DEFAULT 0,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS url_scan_cache (
+        url_key TEXT PRIMARY KEY,
+        verdict TEXT NOT NULL,
+        results TEXT NOT NULL,
+        scanned_at TEXT NOT NULL,
+        expires_at TEXT NOT NULL
+    );
+"""
+
+_TIME_COLUMNS = ("join_date", "last_active", "expires_at")
+
+
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    """Row as a dict, with timestamp columns parsed back into datetimes."""
+    result = dict(row)
+    for column in _TIME_COLUMNS:
+        if result.get(column):
+            result[column] = datetime.fromisoformat(result[column])
+    return result
+
+
+class SqliteDatabase(Storage):
+    def __init__(self, path: str = ":memory:"):
+        """Open (or create) the SQLite database at `path`."""
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("normalize_search", 1, normalize_search, deterministic=True)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        with self._transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO prompts (name, content, is_active, updated_at) VALUES ('default', ?, 1, ?)
+                ON CONFLICT (name) DO NOTHING
+            """, (self._get_default_prompt_text(), self._get_current_utc_iso()))
+        logger.info(f"SQLite database opened: {path}")
+
+    @contextmanager
+    def _transaction(self):
+        """Cursor whose statements are committed together, or rolled back on error."""
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def _fetchone(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()
+
+    def _fetchall(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def _write(self, description: str, query: str, params: tuple) -> bool:
+        """Run one write statement; logs and returns False on failure."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(query, params)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to {description}: {e}", exc_info=True)
+            return False
+
+    def _record_activity(self, cursor, member_table: str, member_column: str, member_id: int,
+                         active_column: str, messages: int = 0, images: int = 0, group_messages: int = 0):
+        """Add one event to today's rollup; the chat counts as active once per day."""
+        today = self._get_current_date_str()
+        cursor.execute(f"INSERT OR IGNORE INTO {member_table} (date, {member_column}) VALUES (?, ?)",
+                       (today, member_id))
+        cursor.execute(f"""
+            INSERT INTO activity_daily (date, messages, images, group_messages, {active_column})
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (date) DO UPDATE SET
+                messages = messages + excluded.messages,
+                images = images + excluded.images,
+                group_messages = group_messages + excluded.group_messages,
+                {active_column} = {active_column} + excluded.{active_column}
+        """, (today, messages, images, group_messages, cursor.rowcount))
+
+    def _search(self, table: str, id_column: str, columns: str, expression: str,
+                query: str, limit: int) -> List[Dict[str, Any]]:
+        """Rows whose normalized `expression` contains the query, most recently active first.
+
+        A numeric query also matches the id exactly. Fuzzy (trigram) matches
+        are only available on PostgreSQL.
+        """
+        query = query.strip().lstrip("@")
+        if not query:
+            return []
+        needle = normalize_search(query)
+        pattern = "%" + needle.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        id_match = int(query) if query.lstrip("-").isdigit() else None
+        try:
+            rows = self._fetchall(f"""
+                SELECT {columns} FROM {table}
+                WHERE {expression} LIKE ? ESCAPE '\\' OR {id_column} = ?
+                ORDER BY {id_column} = ? DESC, last_active DESC
+                LIMIT ?
+            """, (pattern, id_match, id_match, limit))
+            return [_row_to_dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error searching {table}: {e}")
+            return []
+
+    def _increment_counter(self, cursor, key: str, amount: int = 1):
+        cursor.execute("""
+            INSERT INTO statistics (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+        """, (key, amount))
+
+    # ==================== User Methods ====================
+
+    def is_user_exist(self, user_id: int) -> bool:
+        """Check if user exists in database."""
+        try:
+            return self._fetchone("SELECT 1 FROM users WHERE user_id = ?", (user_id,)) is not None
+        except Exception as e:
+            logger.error(f"Error checking user existence: {e}")
+            return False
+
+    def add_user(self, user_id: int, username: str, first_name: str):
+        """Add a user, or refresh the name and last_active of an existing one."""
+        now = self._get_current_utc_iso()
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO users (user_id, username, first_name, join_date, last_active)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name,
+                        last_active = excluded.last_active,
+                        is_reachable = 1
+                """, (user_id, username or "", first_name or "المستخدم", now, now))
+            logger.info(f"Added/Updated user: {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to add user {user_id}: {e}", exc_info=True)
+
+    def update_user_activity(self, user_id: int, message_type: str = "text"):
+        """Count a message or image for the user, the global counters and today's rollup."""
+        is_image = message_type in ["photo", "image"]
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("UPDATE users SET last_active = ?, is_reachable = 1 WHERE user_id = ?",
+                               (self._get_current_utc_iso(), user_id))
+                if message_type == "text":
+                    cursor.execute("UPDATE users SET message_count = message_count + 1 WHERE user_id = ?",
+                                   (user_id,))
+                    self._increment_counter(cursor, 'total_messages')
+                elif is_image:
+                    cursor.execute("UPDATE users SET image_count = image_count + 1 WHERE user_id = ?",
+                                   (user_id,))
+                    self._increment_counter(cursor, 'total_images')
+                    cursor.execute("""
+                        INSERT INTO daily_image_counts (user_id, date, count) VALUES (?, ?, 1)
+                        ON CONFLICT (user_id, date) DO UPDATE SET count = count + 1
+                    """, (user_id, self._get_current_date_str()))
+                self._record_activity(
+                    cursor, "daily_active_users", "user_id", user_id, "active_users",
+                    messages=1 if message_type == "text" else 0,
+                    images=1 if is_image else 0
+                )
+        except Exception as e:
+            logger.error(f"Failed to update user activity: {e}", exc_info=True)
+
+    def get_user_stats(self, user_id: int) -> Optional[dict]:
+        """Get user statistics."""
+        try:
+            row = self._fetchone("""
+                SELECT user_id, username, first_name, join_date, message_count, image_count, last_active
+                FROM users WHERE user_id = ?
+            """, (user_id,))
+            return _row_to_dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user stats: {e}")
+            return None
+
+    def get_total_users(self) -> int:
+        """Get total number of users."""
+        try:
+            return self._fetchone("SELECT COUNT(*) FROM users")[0]
+        except Exception as e:
+            logger.error(f"Error getting total users: {e}")
+            return 0
+
+    def get_daily_image_count_for_user(self, user_id: int) -> int:
+        """Get daily image count for a user."""
+        try:
+            row = self._fetchone("SELECT count FROM daily_image_counts WHERE user_id = ? AND date = ?",
+                                 (user_id, self._get_current_date_str()))
+            return row[0] if row else 0
+        except Exception as e:
+            logger.error(f"Error getting daily image count: {e}")
+            return 0
+
+    def _contains(self, table: str, user_id: int) -> bool:
+        try:
+            return self._fetchone(f"SELECT 1 FROM {table} WHERE user_id = ?", (user_id,)) is not None
+        except Exception as e:
+            logger.error(f"Error checking {table}: {e}")
+            return False
+
+    def _ids(self, table: str) -> List[str]:
+        try:
+            return [str(row[0]) for row in self._fetchall(f"SELECT user_id FROM {table}")]
+        except Exception as e:
+            logger.error(f"Error getting {table}: {e}")
+            return []
+
+    def ban_user(self, user_id: int):
+        """Ban a user."""
+        if self._write(f"ban user {user_id}",
+                       "INSERT INTO banned_users (user_id) VALUES (?) ON CONFLICT (user_id) DO NOTHING", (user_id,)):
+            logger.info(f"Banned user: {user_id}")
+
+    def unban_user(self, user_id: int):
+        """Unban a user."""
+        if self._write(f"unban user {user_id}", "DELETE FROM banned_users WHERE user_id = ?", (user_id,)):
+            logger.info(f"Unbanned user: {user_id}")
+
+    def is_user_banned(self, user_id: int) -> bool:
+        """Check if user is banned."""
+        return self._contains("banned_users", user_id)
+
+    def get_banned_users_ids(self) -> List[str]:
+        """Get list of banned user IDs."""
+        return self._ids("banned_users")
+
+    def is_user_premium(self, user_id: int) -> bool:
+        """Check if user is premium."""
+        return self._contains("premium_users", user_id)
+
+    def add_premium_user(self, user_id: int) -> bool:
+        """Add a premium user."""
+        return self._write(f"add premium user {user_id}",
+                           "INSERT INTO premium_users (user_id) VALUES (?) ON CONFLICT (user_id) DO NOTHING",
+                           (user_id,))
+
+    def remove_premium_user(self, user_id: int) -> bool:
+        """Remove a premium user."""
+        return self._write(f"remove premium user {user_id}", "DELETE FROM premium_users WHERE user_id = ?",
+                           (user_id,))
+
+    def get_premium_users_ids(self) -> List[str]:
+        """Get list of premium user IDs."""
+        return self._ids("premium_users")
+
+    def get_browse_page(self, kind: str, sort: str, cursor: Optional[tuple] = None,
+                        backwards: bool = False, limit: int = 10) -> tuple:
+        """Get one page of users or groups ordered by a BROWSE_SORTS column, descending.
+
+        Same keyset semantics as `Database.get_browse_page`, with a row-value
+        comparison on (column, id). Timestamps compare as their ISO text.
+        """
+        table, id_column, columns = BROWSE_TABLES[kind]
+        sort_column = BROWSE_SORTS[kind][sort]
+        order = "ASC" if backwards else "DESC"
+        query = f"SELECT {columns} FROM {table}"
+        params = []
+        if cursor:
+            value, row_id = cursor
+            query += f" WHERE ({sort_column}, {id_column}) {'>' if backwards else '<'} (?, ?)"
+            params.extend((value.isoformat() if isinstance(value, datetime) else value, row_id))
+        query += f" ORDER BY {sort_column} {order}, {id_column} {order} LIMIT ?"
+        params.append(limit + 1)
+        try:
+            rows = [_row_to_dict(row) for row in self._fetchall(query, tuple(params))]
+        except Exception as e:
+            logger.error(f"Error browsing {kind}: {e}")
+            return [], False
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+        return rows, has_more
+
+    def search_users(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search users by first name, username or user_id."""
+        return self._search(
+            "users", "user_id", "user_id, username, first_name, message_count, image_count, last_active",
+            "normalize_search(COALESCE(first_name, '') || ' ' || COALESCE(username, ''))", query, limit
+        )
+
+    def set_chats_reachable(self, chat_ids: List[int], reachable: bool) -> int:
+        """Mark users/groups as (un)reachable, e.g. after the bot was blocked or kicked."""
+        if not chat_ids:
+            return 0
+        placeholders = ", ".join("?" * len(chat_ids))
+        try:
+            updated = 0
+            with self._transaction() as cursor:
+                for table, id_column in (("users", "user_id"), ("groups", "chat_id")):
+                    cursor.execute(f"""
+                        UPDATE {table} SET is_reachable = ? WHERE {id_column} IN ({placeholders}) AND is_reachable <> ?
+                    """, (int(reachable), *chat_ids, int(reachable)))
+                    updated += cursor.rowcount
+            return updated
+        except Exception as e:
+            logger.error(f"Failed to update chat reachability: {e}", exc_info=True)
+            return 0
+
+    def count_broadcast_audience(self, audience: str, segment: Optional[dict] = None) -> int:
+        """Number of chats a broadcast to this audience/segment would reach."""
+        if audience == "groups":
+            query, params = "SELECT COUNT(*) FROM groups WHERE is_reachable", []
+        else:
+            segment = segment or {}
+            clauses = ["u.is_reachable"]
+            params = []
+            if segment.get("active_days"):
+                clauses.append("u.last_active >= ?")
+                params.append((datetime.now(timezone.utc) - timedelta(days=segment["active_days"])).isoformat())
+            if segment.get("premium"):
+                clauses.append("EXISTS (SELECT 1 FROM premium_users p WHERE p.user_id = u.user_id)")
+            if segment.get("min_messages"):
+                clauses.append("u.message_count >= ?")
+                params.append(segment["min_messages"])
+            if segment.get("joined_after"):
+                clauses.append("u.join_date >= ?")
+                params.append(segment["joined_after"])
+            query = "SELECT COUNT(*) FROM users u WHERE " + " AND ".join(clauses)
+        try:
+            return self._fetchone(query, tuple(params))[0]
+        except Exception as e:
+            logger.error(f"Error counting broadcast audience: {e}")
+            return 0
+
+    # ==================== Group Methods ====================
+
+    def add_group(self, chat_id: int, title: str, members_count: Optional[int] = None):
+        """Add or update a group."""
+        now = self._get_current_utc_iso()
+        if self._write(f"add group {chat_id}", """
+            INSERT INTO groups (chat_id, title, join_date, last_active, members_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                title = excluded.title,
+                last_active = excluded.last_active,
+                members_count = excluded.members_count,
+                is_reachable = 1
+        """, (chat_id, title, now, now, members_count)):
+            logger.info(f"Added/Updated group: {title} ({chat_id})")
+
+    def update_group_activity(self, chat_id: int) -> bool:
+        """Update group activity. Returns True if group exists and was updated."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    UPDATE groups SET message_count = message_count + 1, last_active = ?, is_reachable = 1
+                    WHERE chat_id = ?
+                """, (self._get_current_utc_iso(), chat_id))
+                updated = cursor.rowcount > 0
+                if updated:
+                    self._record_activity(cursor, "daily_active_groups", "chat_id", chat_id, "active_groups",
+                                          group_messages=1)
+            return updated
+        except Exception as e:
+            logger.error(f"Failed to update group activity: {e}", exc_info=True)
+            return False
+
+    def update_group_info(self, chat_id: str, info: Dict[str, Any]):
+        """Update the title and/or members_count of a group."""
+        fields = [key for key in info if key in ['title', 'members_count']]
+        if fields and self._write(
+            "update group info",
+            f"UPDATE groups SET {', '.join(f'{key} = ?' for key in fields)} WHERE chat_id = ?",
+            tuple(info[key] for key in fields) + (int(chat_id),)
+        ):
+            logger.info(f"Updated group info for {chat_id}")
+
+    def remove_group(self, chat_id: str):
+        """Remove a group."""
+        if self._write("remove group", "DELETE FROM groups WHERE chat_id = ?", (int(chat_id),)):
+            logger.info(f"Removed group: {chat_id}")
+
+    def get_total_groups(self) -> int:
+        """Get total number of groups."""
+        try:
+            return self._fetchone("SELECT COUNT(*) FROM groups")[0]
+        except Exception as e:
+            logger.error(f"Error getting total groups: {e}")
+            return 0
+
+    def get_group_counts(self) -> Dict[str, int]:
+        """Number of groups, and of groups that have sent at least one message."""
+        try:
+            row = self._fetchone("""
+                SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE message_count > 0) AS active FROM groups
+            """)
+            return dict(row)
+        except Exception as e:
+            logger.error(f"Error counting groups: {e}")
+            return {'total': 0, 'active': 0}
+
+    def get_recent_groups(self, limit: int = 5) -> List[dict]:
+        """Get the most recently active groups (uses idx_groups_last_active)."""
+        try:
+            return [_row_to_dict(row) for row in self._fetchall("""
+                SELECT chat_id, title, join_date, message_count, members_count, last_active
+                FROM groups ORDER BY last_active DESC LIMIT ?
+            """, (limit,))]
+        except Exception as e:
+            logger.error(f"Error getting recent groups: {e}")
+            return []
+
+    def search_groups(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search groups by title or chat_id."""
+        return self._search(
+            "groups", "chat_id", "chat_id, title, join_date, message_count, members_count, last_active",
+            "normalize_search(title)", query, limit
+        )
+
+    def cleanup_inactive_groups(self, inactivity_days_threshold: int = 30) -> tuple:
+        """Delete groups that never spoke or have been idle for the threshold."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=inactivity_days_threshold)).isoformat()
+        condition = "(message_count = 0 AND join_date < :cutoff) OR last_active < :cutoff"
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(f"SELECT chat_id, title FROM groups WHERE {condition}", {"cutoff": cutoff})
+                removed = cursor.fetchall()
+                cursor.execute(f"DELETE FROM groups WHERE {condition}", {"cutoff": cutoff})
+        except Exception as e:
+            logger.error(f"Failed to cleanup groups: {e}", exc_info=True)
+            return 0, []
+        if removed:
+            logger.info(f"Cleaned up {len(removed)} inactive groups")
+        return len(removed), [{"chat_id": str(chat_id), "title": title} for chat_id, title in removed]
+
+    def set_group_prompt(self, chat_id: int, prompt: str):
+        """Set a custom prompt for a group."""
+        self._write("set group prompt", "UPDATE groups SET custom_prompt = ? WHERE chat_id = ?", (prompt, chat_id))
+
+    def reset_group_prompt(self, chat_id: int):
+        """Reset group prompt to default."""
+        self._write("reset group prompt", "UPDATE groups SET custom_prompt = NULL WHERE chat_id = ?", (chat_id,))
+
+    def get_group_prompt(self, chat_id: int) -> Optional[str]:
+        """Get custom prompt for a group."""
+        try:
+            row = self._fetchone("SELECT custom_prompt FROM groups WHERE chat_id = ?", (chat_id,))
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting group prompt: {e}")
+            return None
+
+    def set_group_auto_scan(self, chat_id: int, enabled: bool):
+        """Enable or disable automatic link scanning for a group."""
+        self._write("set group auto_scan", "UPDATE groups SET auto_scan = ? WHERE chat_id = ?",
+                    (int(enabled), chat_id))
+
+    def get_group_auto_scan(self, chat_id: int) -> bool:
+        """Whether automatic link scanning is enabled for a group."""
+        try:
+            row = self._fetchone("SELECT auto_scan FROM groups WHERE chat_id = ?", (chat_id,))
+            return bool(row and row[0])
+        except Exception as e:
+            logger.error(f"Error getting group auto_scan: {e}")
+            return False
+
+    # ==================== Statistics Methods ====================
+
+    def get_counter_values(self, keys: List[str]) -> Dict[str, int]:
+        """Current value of each counter, 0 for unknown keys."""
+        values = dict.fromkeys(keys, 0)
+        try:
+            rows = self._fetchall(
+                f"SELECT key, value FROM statistics WHERE key IN ({', '.join('?' * len(keys))})", tuple(keys)
+            )
+            values.update((row[0], row[1]) for row in rows)
+        except Exception as e:
+            logger.error(f"Error getting counters: {e}")
+        return values
+
+    def get_daily_activity_stats(self, date_str: Optional[str] = None) -> dict:
+        """Get the activity rollup of one day (today by default)."""
+        empty = {'messages': 0, 'images': 0, 'group_messages': 0, 'unique_active_users': 0, 'active_groups': 0}
+        try:
+            row = self._fetchone("""
+                SELECT messages, images, group_messages, active_users AS unique_active_users, active_groups
+                FROM activity_daily WHERE date = ?
+            """, (date_str or self._get_current_date_str(),))
+            return dict(row) if row else empty
+        except Exception as e:
+            logger.error(f"Error getting daily stats: {e}")
+            return empty
+
+    def get_activity_history(self, days: int = 7) -> List[dict]:
+        """Get the daily rollups for the last `days` days, newest first."""
+        since = date.fromisoformat(self._get_current_date_str()) - timedelta(days=days)
+        try:
+            rows = self._fetchall("""
+                SELECT date, messages, images, group_messages, active_users, active_groups
+                FROM activity_daily WHERE date > ? ORDER BY date DESC
+            """, (since.isoformat(),))
+            return [dict(row, date=date.fromisoformat(row['date'])) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting activity history: {e}")
+            return []
+
+    # ==================== Prompt Methods ====================
+
+    def get_active_prompt(self) -> str:
+        """Get the active prompt, or the default text if none is active."""
+        try:
+            row = self._fetchone("SELECT content FROM prompts WHERE is_active = 1 ORDER BY updated_at DESC LIMIT 1")
+            return row[0] if row else self._get_default_prompt_text()
+        except Exception as e:
+            logger.error(f"Error getting active prompt: {e}")
+            return self._get_default_prompt_text()
+
+    def get_prompt_content(self, prompt_name: str = 'default') -> str:
+        """Get content of a system prompt by name."""
+        try:
+            row = self._fetchone("SELECT content FROM prompts WHERE name = ?", (prompt_name,))
+            return row[0] if row else ""
+        except Exception as e:
+            logger.error(f"Error getting prompt content: {e}")
+            return ""
+
+    def update_prompt(self, name: str, content: str) -> bool:
+        """Create or replace a prompt and make it the only active one."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("UPDATE prompts SET is_active = 0")
+                cursor.execute("""
+                    INSERT INTO prompts (name, content, is_active, updated_at) VALUES (?, ?, 1, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        content = excluded.content,
+                        is_active = 1,
+                        updated_at = excluded.updated_at
+                """, (name, content, self._get_current_utc_iso()))
+            logger.info(f"Updated prompt: {name}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to update prompt: {e}", exc_info=True)
+            return False
+
+    def reset_to_default_prompt(self) -> bool:
+        """Make the 'default' prompt the only active one."""
+        if self._write("reset prompt", "UPDATE prompts SET is_active = (name = 'default')", ()):
+            logger.info("Reset to default prompt")
+            return True
+        return False
+
+    # ==================== Link Scan Cache Methods ====================
+
+    def get_url_scan(self, url_key: str) -> Optional[dict]:
+        """Get a cached scan result that has not expired yet."""
+        try:
+            row = self._fetchone("""
+                SELECT verdict, results, expires_at FROM url_scan_cache
+                WHERE url_key = ? AND expires_at > ?
+            """, (url_key, self._get_current_utc_iso()))
+            if not row:
+                return None
+            result = _row_to_dict(row)
+            result['results'] = json.loads(result['results'])
+            return result
+        except Exception as e:
+            logger.error(f"Error getting cached url scan: {e}")
+            return None
+
+    def save_url_scan(self, url_key: str, verdict: str, results: list, ttl_seconds: int):
+        """Store a scan result for ttl_seconds."""
+        now = datetime.now(timezone.utc)
+        self._write("save url scan", """
+            INSERT INTO url_scan_cache (url_key, verdict, results, scanned_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (url_key) DO UPDATE SET
+                verdict = excluded.verdict,
+                results = excluded.results,
+                scanned_at = excluded.scanned_at,
+                expires_at = excluded.expires_at
+        """, (url_key, verdict, json.dumps(results, ensure_ascii=False),
+              now.isoformat(), (now + timedelta(seconds=ttl_seconds)).isoformat()))
+
+    # ==================== Utility Methods ====================
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
+        logger.info("Database connections closed.")
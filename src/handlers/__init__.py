@@ -6,12 +6,14 @@ from .admin import (
     handle_admin_message,
     is_admin
 )
+from .broadcast import resume_broadcast_jobs
 from .group import GroupHandler
 from .private import (
     start,
     handle_message,
     handle_photo,
-    check_subscription_callback
+    check_subscription_callback,
+    handle_channel_member_update
 )
 from .error import error_handler
 
@@ -20,10 +22,12 @@ __all__ = [
     "handle_admin_callback",
     "handle_admin_message",
     "is_admin",
+    "resume_broadcast_jobs",
     "GroupHandler",
     "start",
     "handle_message",
     "handle_photo",
     "check_subscription_callback",
+    "handle_channel_member_update",
     "error_handler",
 ]
@@ -1,7 +1,11 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from ..config import ADMIN_USERS, BOT_SIGNATURE
-from datetime import datetime
+from ..utils.state_cache import get_state_stats
+from ..utils.broadcaster import BroadcastPayload
+from .. import retention
+from ..database_postgres import Database
+from datetime import datetime, timezone
 import logging
 import asyncio
 
@@ -13,7 +17,12 @@ from .prompt_management import (
     start_edit_prompt, reset_to_default_prompt, handle_new_prompt,
     get_prompt_keyboard
 )
-from .broadcast import start_broadcast, handle_broadcast_callback, extract_buttons
+from .broadcast import start_broadcast, handle_broadcast_callback, extract_buttons, start_broadcast_job
+from .export import show_export_menu, handle_export_callback
+from .browse import show_users_page, handle_browse_callback, start_search, handle_search_input, SEARCH_STATES
+
+# Panel features backed by PostgreSQL-only tables or COPY
+POSTGRES_ONLY_CALLBACKS = ("admin_export", "export:", "admin_retention", "retention_run", "broadcast_job")
 
 def is_admin(username: str) -> bool:
     """Check if user is admin."""
@@ -26,12 +35,16 @@ def get_admin_keyboard():
          InlineKeyboardButton("👥 المستخدمين", callback_data="admin_users")],
         [InlineKeyboardButton("📢 إرسال إعلان", callback_data="admin_broadcast"),
          InlineKeyboardButton("🚫 إدارة الحظر", callback_data="admin_ban")],
+        [InlineKeyboardButton("📋 سجل الإذاعات", callback_data="broadcast_jobs"),
+         InlineKeyboardButton("🔎 بحث عن مستخدم", callback_data="user_search")],
         [InlineKeyboardButton("⭐ إضافة مستخدم مميز", callback_data="add_premium"),
          InlineKeyboardButton("❌ إزالة مستخدم مميز", callback_data="remove_premium")],
         [InlineKeyboardButton("👑 عرض المستخدمين المميزين", callback_data="list_premium")],
         [InlineKeyboardButton("🏢 إدارة المجموعات", callback_data="admin_groups")],
-        [InlineKeyboardButton("⚙️ إدارة البرومبت", callback_data="manage_prompt")],
-        [InlineKeyboardButton("📤 تحويل إعلان", callback_data="forward_ad")],
+        [InlineKeyboardButton("⚙️ إدارة البرومبت", callback_data="manage_prompt"),
+         InlineKeyboardButton("🧹 تنظيف البيانات", callback_data="admin_retention")],
+        [InlineKeyboardButton("📤 تحويل إعلان", callback_data="forward_ad"),
+         InlineKeyboardButton("📦 تصدير البيانات", callback_data="admin_export")],
         [InlineKeyboardButton("🚪 تسجيل الخروج", callback_data="admin_logout")]
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -51,6 +64,7 @@ def get_groups_keyboard():
     keyboard = [
         [InlineKeyboardButton("📊 إحصائيات المجموعات", callback_data="groups_stats"),
          InlineKeyboardButton("📢 إرسال رسالة", callback_data="groups_broadcast")],
+        [InlineKeyboardButton("📋 تصفح المجموعات", callback_data="gb:r")],
         [InlineKeyboardButton("🔍 بحث عن مجموعة", callback_data="groups_search"),
          InlineKeyboardButton("⚠️ المجموعات غير النشطة", callback_data="groups_inactive")],
         [InlineKeyboardButton("🔄 تحديث البيانات", callback_data="groups_refresh"),
@@ -82,10 +96,18 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await query.message.reply_text("عذراً، هذا الأمر متاح للمشرفين فقط.")
         return
 
+    if query.data.startswith(POSTGRES_ONLY_CALLBACKS) and not isinstance(db, Database):
+        await query.message.edit_text("⚠️ هذه الميزة تتطلب قاعدة بيانات PostgreSQL.", reply_markup=get_admin_keyboard())
+        return
+
     if query.data == "admin_stats":
         await show_statistics(query, db)
     elif query.data == "admin_users":
-        await show_users(query, db)
+        await show_users_page(query, context, db)
+    elif query.data in SEARCH_STATES:
+        await start_search(query, context, query.data)
+    elif query.data.startswith(("ub:", "gb:", "ud:", "ua:")):
+        await handle_browse_callback(update, context, db)
     elif query.data == "admin_broadcast":
         await start_broadcast(update, context)
     elif query.data == "admin_ban":
@@ -97,6 +119,24 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         )
     elif query.data == "groups_stats":
         await show_groups(query, db)
+    elif query.data == "groups_cleanup":
+        await query.message.edit_text(
+            "⚠️ سيتم حذف المجموعات التي لم تنشط منذ 30 يوماً من قاعدة البيانات.\nهل تريد المتابعة؟",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("✅ نعم، احذف", callback_data="confirm_groups_cleanup"),
+                 InlineKeyboardButton("❌ إلغاء", callback_data="admin_groups")]
+            ])
+        )
+    elif query.data == "confirm_groups_cleanup":
+        await cleanup_groups(query, db)
+    elif query.data == "admin_export":
+        await show_export_menu(query)
+    elif query.data.startswith("export:"):
+        await handle_export_callback(query, context, db)
+    elif query.data == "admin_retention":
+        await show_retention(query)
+    elif query.data == "retention_run":
+        await run_retention_now(query, db)
     elif query.data == "groups_broadcast":
         await start_groups_broadcast(query, context)
     elif query.data == "confirm_groups_broadcast":
@@ -382,6 +422,10 @@ async def handle_admin_message(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("❌ الرجاء إدخال رقم معرف صحيح.")
         return
 
+    if admin_state in SEARCH_STATES.values():
+        await handle_search_input(update, context, db)
+        return
+
     # Handle prompt editing
     if admin_state == 'waiting_for_new_prompt':
         await handle_new_prompt(update, context, db)
@@ -389,9 +433,7 @@ async def handle_admin_message(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # Handle other admin states...
     if admin_state == 'waiting_for_broadcast':
-        # Get all users from database
-        all_users = db.data["users"].keys()
-        total_users = len(all_users)
+        total_users = db.count_broadcast_audience("users")
 
         # Send confirmation message with user count
         confirm_msg = await update.message.reply_text(
@@ -585,35 +627,36 @@ async def show_statistics(query, db):
 
 📅 إحصائيات اليوم:
 📝 الرسائل: {daily_stats['messages']}
-🖼 الصور: {daily_stats['images']}"""
+🖼 الصور: {daily_stats['images']}
+👤 المستخدمين النشطين: {daily_stats['unique_active_users']}
+🏢 المجموعات النشطة: {daily_stats['active_groups']} | رسائل المجموعات: {daily_stats['group_messages']}
+
+📈 آخر 7 أيام:"""
+    history = db.get_activity_history(7)
+    for day in history:
+        stats_text += (
+            f"\n- {day['date']:%m-%d}: 📝 {day['messages']} | 🖼 {day['images']} | "
+            f"👤 {day['active_users']} | 🏢 {day['active_groups']}"
+        )
+    if not history:
+        stats_text += "\nلا توجد بيانات بعد."
+
+    stats_text += "\n\n🧠 الذاكرة المؤقتة:"
+    for cache in get_state_stats():
+        stats_text += (
+            f"\n- {cache['name']}: {cache['entries']} عنصر | "
+            f"{cache['bytes'] / 1024:.0f} KB | طرد: {cache['evictions']} | انتهاء: {cache['expirations']}"
+        )
 
     await query.message.edit_text(stats_text, reply_markup=get_admin_keyboard())
 
-async def show_users(query, db):
-    """Show users information."""
-    users = list(db.get_all_users_data().values())
-    active_users = [u for u in users if datetime.fromisoformat(u['last_active']).date() == datetime.now().date()]
-    users_text = f"""👥 معلومات المستخدمين:
-
-📊 إجمالي المستخدمين: {len(users)}
-📱 المستخدمين النشطين اليوم: {len(active_users)}
-
-آخر 5 مستخدمين نشطين:"""
-
-    sorted_users = sorted(users, key=lambda x: x['last_active'], reverse=True)[:5]
-    for user in sorted_users:
-        users_text += f"\n- {user['first_name']} (@{user['username']}) | الرسائل: {user['message_count']}"
-
-    await query.message.edit_text(users_text, reply_markup=get_admin_keyboard())
-
-
-
 async def show_groups(query, db):
     """Show groups information."""
     try:
-        groups = db.get_all_groups()
-        total_groups = len(groups)
-        active_groups = sum(1 for g in groups if g.get('message_count', 0) > 0)
+        counts = db.get_group_counts()
+        total_groups = counts['total']
+        active_groups = counts['active']
+        recent_groups = db.get_recent_groups(5)
 
         message = (
             f"📊 *إحصائيات المجموعات*\n\n"
@@ -624,21 +667,23 @@ async def show_groups(query, db):
         )
 
         # عرض آخر 5 مجموعات فقط لتجنب الرسائل الطويلة
-        for i, group in enumerate(groups[:5], 1):
+        for i, group in enumerate(recent_groups, 1):
             group_name = group.get('title', 'مجموعة غير معروفة')
             message_count = group.get('message_count', 0)
             
             # Safe date parsing
-            last_active_str = group.get('last_active')
-            if isinstance(last_active_str, str):
+            last_active = group.get('last_active')
+            if isinstance(last_active, str):
                 try:
-                    last_active = datetime.fromisoformat(last_active_str)
+                    last_active = datetime.fromisoformat(last_active)
                 except ValueError:
-                    last_active = datetime.now()
-            else:
-                last_active = datetime.now()
+                    last_active = None
+            if not isinstance(last_active, datetime):
+                last_active = datetime.now(timezone.utc)
+            if last_active.tzinfo is None:
+                last_active = last_active.replace(tzinfo=timezone.utc)
                 
-            days_inactive = (datetime.now() - last_active).days
+            days_inactive = (datetime.now(timezone.utc) - last_active).days
 
             status = "✅ نشطة" if message_count > 0 else "⚠️ غير نشطة"
             message += (
@@ -664,6 +709,38 @@ async def show_groups(query, db):
         )
         logging.error(f"Error in show_groups: {str(e)}")
 
+async def cleanup_groups(query, db):
+    """Delete inactive groups and list what was removed."""
+    await query.message.edit_text("⏳ جاري حذف المجموعات غير النشطة...")
+    removed_count, removed_groups = await asyncio.to_thread(db.cleanup_inactive_groups)
+    message = f"✅ تم حذف {removed_count} مجموعة غير نشطة."
+    for group in removed_groups[:10]:
+        message += f"\n- {group['title'] or 'مجموعة غير معروفة'} ({group['chat_id']})"
+    if removed_count > 10:
+        message += f"\n... و{removed_count - 10} أخرى"
+    await query.message.edit_text(message, reply_markup=get_groups_keyboard())
+
+def get_retention_keyboard():
+    """Get retention report keyboard."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("▶️ تشغيل الآن", callback_data="retention_run")],
+        [InlineKeyboardButton("🔙 رجوع", callback_data="admin_back")]
+    ])
+
+async def show_retention(query):
+    """Show the report of the last retention run."""
+    await query.message.edit_text(retention.format_report(retention.last_report), reply_markup=get_retention_keyboard())
+
+async def run_retention_now(query, db):
+    """Run the retention policies now and show the report."""
+    await query.message.edit_text("⏳ جاري تنظيف البيانات القديمة...")
+    report = await asyncio.to_thread(retention.run_retention, db)
+    if report is None:
+        text = "⚠️ التنظيف قيد التشغيل حالياً أو تعذر تشغيله. حاول لاحقاً."
+    else:
+        text = retention.format_report(report)
+    await query.message.edit_text(text, reply_markup=get_retention_keyboard())
+
 async def start_groups_broadcast(query: Update.callback_query, context: ContextTypes.DEFAULT_TYPE):
     """بدء عملية إرسال رسالة للمجموعات."""
     context.user_data['admin_state'] = 'waiting_groups_broadcast'
@@ -693,8 +770,8 @@ async def start_groups_broadcast(query: Update.callback_query, context: ContextT
 async def handle_groups_broadcast(message: str, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """معالجة إرسال الرسالة للمجموعات."""
     try:
-        groups = db.get_all_groups()
-        if not groups:
+        total_groups = db.count_broadcast_audience("groups")
+        if not total_groups:
             await message.reply_text(
                 "⚠️ لا توجد مجموعات متاحة للإرسال",
                 reply_markup=InlineKeyboardMarkup([[
@@ -711,7 +788,7 @@ async def handle_groups_broadcast(message: str, context: ContextTypes.DEFAULT_TY
             f"📝 *مراجعة الرسالة*\n\n"
             f"الرسالة التي سيتم إرسالها:\n"
             f"```\n{clean_text}\n```\n\n"
-            f"📊 سيتم الإرسال إلى {len(groups)} مجموعة\n"
+            f"📊 سيتم الإرسال إلى {total_groups} مجموعة\n"
             f"👇 *الأزرار:* {'✅ موجودة' if reply_markup else '❌ لا يوجد'}\n\n"
             f"هل تريد المتابعة؟"
         )
@@ -757,54 +834,9 @@ async def execute_groups_broadcast(query: Update.callback_query, context: Contex
         )
         return
 
-    status_message = await query.message.edit_text(
-        "⏳ جاري إرسال الرسالة للمجموعات...\n"
-        "0% مكتمل"
-    )
+    await query.message.edit_text("⏳ جاري بدء إرسال الرسالة للمجموعات...")
 
-    # Parse buttons again for sending
+    # Parse buttons once for every group
     reply_markup, clean_text = extract_buttons(message)
-
-    groups = db.get_all_groups()
-    success_count = 0
-    fail_count = 0
-    total = len(groups)
-
-    for i, group in enumerate(groups, 1):
-        try:
-            await context.bot.send_message(
-                chat_id=int(group['chat_id']),
-                text=clean_text,
-                parse_mode='Markdown',
-                reply_markup=reply_markup,
-                disable_web_page_preview=True
-            )
-            success_count += 1
-
-            # تحديث حالة التقدم كل 5 مجموعات
-            if i % 5 == 0:
-                progress = (i / total) * 100
-                await status_message.edit_text(
-                    f"⏳ جاري إرسال الرسالة للمجموعات...\n"
-                    f"{progress:.1f}% مكتمل\n"
-                    f"✅ نجح: {success_count}\n"
-                    f"❌ فشل: {fail_count}"
-                )
-        except Exception as e:
-            fail_count += 1
-            logging.error(f"Failed to send to group {group['chat_id']}: {str(e)}")
-
-    result_message = (
-        f"✅ *اكتمل إرسال الرسالة!*\n\n"
-        f"📊 *النتائج:*\n"
-        f"• نجح: `{success_count}` مجموعة\n"
-        f"• فشل: `{fail_count}` مجموعة\n"
-        f"• المجموع: `{total}` مجموعة\n\n"
-        f"نسبة النجاح: `{(success_count/total)*100:.1f}%`"
-    )
-
-    await status_message.edit_text(
-        result_message,
-        reply_markup=get_groups_keyboard(),
-        parse_mode='Markdown'
-    )
+    payload = BroadcastPayload("text", text=clean_text, reply_markup=reply_markup)
+    await start_broadcast_job(query.message, context, db, "groups", payload)
@@ -1,10 +1,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from telegram.error import TelegramError, Forbidden
+from telegram.error import TelegramError
+from datetime import datetime, timedelta, timezone
 import logging
-import asyncio
-from datetime import datetime
+
+from ..database_postgres import Database
+from ..utils.broadcaster import BroadcastPayload, BroadcastJobRunner, deliver, SENT
 
 logger = logging.getLogger(__name__)
 
@@ -12,20 +14,62 @@ logger = logging.getLogger(__name__)
 WAITING_MESSAGE = "waiting_broadcast_message"
 CONFIRM_BROADCAST = "confirm_broadcast"
 
-def get_broadcast_keyboard(pin: bool = False, silent: bool = False):
+# Audience segment presets; each button cycles through its list (None = no filter)
+SEGMENT_OPTIONS = {
+    "active_days": [None, 1, 7, 30],
+    "min_messages": [None, 10, 50, 100],
+    "joined_within": [None, 7, 30, 90],
+}
+
+def _segment_label(value, unit=""):
+    return "الكل" if not value else f"{value}{unit}"
+
+def get_broadcast_keyboard(pin: bool = False, silent: bool = False, segment: dict = None):
     """Get broadcast control keyboard."""
     pin_status = "✅" if pin else "❌"
     silent_status = "✅" if silent else "❌"
+    segment = segment or {}
+    premium_status = "✅" if segment.get("premium") else "❌"
     
     keyboard = [
-        [InlineKeyboardButton("📨 إرسال للكل", callback_data="broadcast_send"),
+        [InlineKeyboardButton("📨 إرسال", callback_data="broadcast_send"),
          InlineKeyboardButton("🧪 تجربة لي", callback_data="broadcast_test")],
         [InlineKeyboardButton(f"تثبيت {pin_status}", callback_data="broadcast_toggle_pin"),
          InlineKeyboardButton(f"بدون صوت {silent_status}", callback_data="broadcast_toggle_silent")],
+        [InlineKeyboardButton(f"🕒 نشط خلال: {_segment_label(segment.get('active_days'), ' يوم')}",
+                              callback_data="broadcast_seg_active_days"),
+         InlineKeyboardButton(f"⭐ المميزون فقط {premium_status}", callback_data="broadcast_seg_premium")],
+        [InlineKeyboardButton(f"💬 رسائل ≥ {_segment_label(segment.get('min_messages'))}",
+                              callback_data="broadcast_seg_min_messages"),
+         InlineKeyboardButton(f"📅 انضم خلال: {_segment_label(segment.get('joined_within'), ' يوم')}",
+                              callback_data="broadcast_seg_joined_within")],
         [InlineKeyboardButton("❌ إلغاء", callback_data="broadcast_cancel")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def segment_query(segment: dict) -> dict:
+    """Turn the UI segment options into the filters understood by the database."""
+    query = {key: segment[key] for key in ("active_days", "premium", "min_messages") if segment.get(key)}
+    if segment.get("joined_within"):
+        query["joined_after"] = (datetime.now(timezone.utc) - timedelta(days=segment["joined_within"])).date().isoformat()
+    return query
+
+def broadcast_preview_text(db, segment: dict) -> str:
+    """Confirmation text with the audience count, evaluated in SQL."""
+    count = db.count_broadcast_audience("users", segment_query(segment))
+    return (
+        "✅ *تم استلام الرسالة*\n\n"
+        f"👥 العدد التقديري للمستلمين: *{count}*\n\n"
+        "اختر خيارات الإرسال والجمهور من الأسفل:"
+    )
+
+def _current_keyboard(context):
+    return get_broadcast_keyboard(
+        context.user_data.get('broadcast_pin', False),
+        context.user_data.get('broadcast_silent', False),
+        context.user_data.get('broadcast_segment', {})
+    )
+
 async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the broadcast process."""
     if update.callback_query:
@@ -38,6 +82,7 @@ async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Reset options
     context.user_data['broadcast_pin'] = False
     context.user_data['broadcast_silent'] = False
+    context.user_data['broadcast_segment'] = {}
     
     text = (
         "📢 *نظام الإذاعة المتطور*\n\n"
@@ -65,14 +110,9 @@ async def handle_broadcast_input(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data['broadcast_message_obj'] = message
     context.user_data['broadcast_state'] = CONFIRM_BROADCAST
 
-    # Create preview of buttons if any
-    buttons = parse_buttons(message.caption or message.text or "")
-    
-    preview_text = "✅ *تم استلام الرسالة*\n\nاختر خيارات الإرسال من الأسفل:"
-    
     await message.reply_text(
-        preview_text,
-        reply_markup=get_broadcast_keyboard(),
+        broadcast_preview_text(db, context.user_data.get('broadcast_segment', {})),
+        reply_markup=_current_keyboard(context),
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -85,6 +125,11 @@ async def handle_broadcast_callback(update: Update, context: ContextTypes.DEFAUL
         return
 
     await query.answer()
+
+    # Job controls work from any progress message, independent of the compose session
+    if data == "broadcast_jobs" or data.startswith("broadcast_job_"):
+        await handle_broadcast_job_callback(update, context, db)
+        return
     
     state = context.user_data.get('broadcast_state')
     if state != CONFIRM_BROADCAST and data != "broadcast_cancel":
@@ -98,167 +143,163 @@ async def handle_broadcast_callback(update: Update, context: ContextTypes.DEFAUL
 
     elif data == "broadcast_toggle_pin":
         context.user_data['broadcast_pin'] = not context.user_data.get('broadcast_pin', False)
-        await query.message.edit_reply_markup(
-            reply_markup=get_broadcast_keyboard(
-                context.user_data['broadcast_pin'],
-                context.user_data.get('broadcast_silent', False)
-            )
-        )
+        await query.message.edit_reply_markup(reply_markup=_current_keyboard(context))
 
     elif data == "broadcast_toggle_silent":
         context.user_data['broadcast_silent'] = not context.user_data.get('broadcast_silent', False)
-        await query.message.edit_reply_markup(
-            reply_markup=get_broadcast_keyboard(
-                context.user_data.get('broadcast_pin', False),
-                context.user_data['broadcast_silent']
-            )
+        await query.message.edit_reply_markup(reply_markup=_current_keyboard(context))
+
+    elif data.startswith("broadcast_seg_"):
+        segment = context.user_data.setdefault('broadcast_segment', {})
+        key = data[len("broadcast_seg_"):]
+        if key == "premium":
+            segment['premium'] = not segment.get('premium', False)
+        elif key in SEGMENT_OPTIONS:
+            options = SEGMENT_OPTIONS[key]
+            segment[key] = options[(options.index(segment.get(key)) + 1) % len(options)]
+        await query.message.edit_text(
+            broadcast_preview_text(db, segment),
+            reply_markup=_current_keyboard(context),
+            parse_mode=ParseMode.MARKDOWN
         )
 
     elif data == "broadcast_test":
-        await send_broadcast_message(
-            context, 
-            update.effective_user.id, 
-            context.user_data['broadcast_message_obj'],
-            pin=context.user_data.get('broadcast_pin', False),
-            silent=context.user_data.get('broadcast_silent', False)
-        )
-        await query.message.reply_text("✅ تم إرسال نسخة تجريبية إليك.")
+        payload = build_broadcast_payload(context)
+        if await deliver(context.bot, payload, update.effective_user.id) == SENT:
+            await query.message.reply_text("✅ تم إرسال نسخة تجريبية إليك.")
+        else:
+            await query.message.reply_text("❌ تعذر إرسال النسخة التجريبية، تحقق من تنسيق الرسالة.")
 
     elif data == "broadcast_send":
         await query.message.edit_text("⏳ جاري بدء الإذاعة... الرجاء الانتظار.")
-        
-        # Use existing method or fix the attribute error here
-        # FIX: The error was db.data["users"]. keys() on Postgres DB
-        try:
-            users = db.get_all_user_ids_for_broadcast()
-        except Exception as e:
-            logger.error(f"DB Error getting users: {e}")
-            await query.message.edit_text(f"❌ خطأ في قاعدة البيانات: {str(e)}")
-            return
-
-        total = len(users)
-        success = 0
-        failed = 0
-        
-        msg_obj = context.user_data['broadcast_message_obj']
-        pin = context.user_data.get('broadcast_pin', False)
-        silent = context.user_data.get('broadcast_silent', False)
-        
-        progress_msg = await query.message.reply_text(f"📊 جاري الإرسال... 0/{total}")
-        
-        for i, user_id in enumerate(users):
-            if i % 20 == 0:  # Update progress every 20 users
-                try:
-                    await progress_msg.edit_text(f"📊 جاري الإرسال... {i}/{total}\n✅ نجح: {success}\n❌ فشل: {failed}")
-                except:
-                    pass
-            
-            if await send_broadcast_message(context, int(user_id), msg_obj, pin, silent):
-                success += 1
-            else:
-                failed += 1
-            
-            await asyncio.sleep(0.05)  # Flood limit protection
-
-        await progress_msg.edit_text(
-            f"✅ *تمت الإذاعة بنجاح*\n\n"
-            f"👥 المستهدفين: {total}\n"
-            f"✅ وصل: {success}\n"
-            f"❌ لم يصل: {failed}",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        payload = build_broadcast_payload(context)
+        segment = segment_query(context.user_data.get('broadcast_segment', {}))
         context.user_data.clear()
+        await start_broadcast_job(query.message, context, db, "users", payload, segment)
 
-async def send_broadcast_message(context, chat_id, message_obj, pin, silent):
-    """Refined send logic with support for all media types and buttons."""
-    try:
-        # Extract buttons
-        caption = message_obj.caption or ""
-        text = message_obj.text or ""
-        content_text = caption if caption else text
-        
-        buttons, clean_text = extract_buttons(content_text)
-        
-        # If we extracted buttons, we need to replace the text/caption
-        kwargs = {
-            'chat_id': chat_id,
-            'disable_notification': silent,
-            'reply_markup': buttons
-        }
-
-        sent_msg = None
-        
-        if message_obj.text:
-            sent_msg = await context.bot.send_message(
-                text=clean_text, 
-                parse_mode=ParseMode.MARKDOWN,
-                disable_web_page_preview=True,
-                **kwargs
-            )
-        elif message_obj.photo:
-            sent_msg = await context.bot.send_photo(
-                photo=message_obj.photo[-1].file_id,
-                caption=clean_text,
-                parse_mode=ParseMode.MARKDOWN,
-                **kwargs
-            )
-        elif message_obj.video:
-            sent_msg = await context.bot.send_video(
-                video=message_obj.video.file_id,
-                caption=clean_text,
-                parse_mode=ParseMode.MARKDOWN,
-                **kwargs
-            )
-        elif message_obj.document:
-            sent_msg = await context.bot.send_document(
-                document=message_obj.document.file_id,
-                caption=clean_text,
-                parse_mode=ParseMode.MARKDOWN,
-                **kwargs
-            )
-        elif message_obj.voice:
-             sent_msg = await context.bot.send_voice(
-                voice=message_obj.voice.file_id,
-                caption=clean_text,
-                parse_mode=ParseMode.MARKDOWN,
-                **kwargs
-            )
-        elif message_obj.audio:
-             sent_msg = await context.bot.send_audio(
-                audio=message_obj.audio.file_id,
-                caption=clean_text,
-                parse_mode=ParseMode.MARKDOWN,
-                **kwargs
-            )
-        elif message_obj.sticker:
-             sent_msg = await context.bot.send_sticker(
-                sticker=message_obj.sticker.file_id,
-                disable_notification=silent,
-                reply_markup=buttons
-            )
+def build_broadcast_payload(context) -> BroadcastPayload:
+    """Render the admin's message and options once for every recipient."""
+    return BroadcastPayload.from_message(
+        context.user_data['broadcast_message_obj'],
+        extract_buttons,
+        pin=context.user_data.get('broadcast_pin', False),
+        silent=context.user_data.get('broadcast_silent', False)
+    )
+
+# ==================== Broadcast Jobs ====================
+
+JOB_STATUS_LABELS = {
+    "running": "⏳ قيد الإرسال",
+    "paused": "⏸ متوقفة مؤقتاً",
+    "cancelled": "❌ ملغاة",
+    "completed": "✅ مكتملة",
+}
+
+AUDIENCE_LABELS = {
+    "users": "المستخدمين",
+    "groups": "المجموعات",
+}
+
+def render_job_progress(job, counts, rate=None):
+    """Progress text and control buttons for a broadcast job, counted from its recipient rows."""
+    total = sum(counts.values())
+    sent = counts.get("sent", 0)
+    blocked = counts.get("blocked", 0)
+    failed = counts.get("failed", 0)
+    done = sent + blocked + failed
+
+    text = (
+        f"📢 إذاعة #{job['id']} إلى {AUDIENCE_LABELS.get(job['audience'], job['audience'])}\n"
+        f"الحالة: {JOB_STATUS_LABELS.get(job['status'], job['status'])}\n\n"
+        f"📊 التقدم: {done}/{total}\n"
+        f"✅ وصل: {sent}\n"
+        f"🚫 غير متاح (حظر/طرد): {blocked}\n"
+        f"❌ لم يصل: {failed}"
+    )
+    if job['status'] == "running" and rate:
+        text += f"\n⚡ السرعة: {rate:.1f} رسالة/ثانية"
+        text += f"\n⏱ الوقت المتبقي: {int((total - done) / rate)} ثانية"
+
+    buttons = []
+    if job['status'] == "running":
+        buttons.append(InlineKeyboardButton("⏸ إيقاف مؤقت", callback_data=f"broadcast_job_pause:{job['id']}"))
+    elif job['status'] == "paused":
+        buttons.append(InlineKeyboardButton("▶️ استئناف", callback_data=f"broadcast_job_resume:{job['id']}"))
+    if job['status'] in ("running", "paused"):
+        buttons.append(InlineKeyboardButton("❌ إلغاء", callback_data=f"broadcast_job_cancel:{job['id']}"))
+    keyboard = [buttons] if buttons else []
+    keyboard.append([InlineKeyboardButton("🔄 تحديث", callback_data=f"broadcast_job_view:{job['id']}")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+job_runner = BroadcastJobRunner(render_job_progress)
+
+async def start_broadcast_job(message: Message, context: ContextTypes.DEFAULT_TYPE, db, audience: str,
+                              payload: BroadcastPayload, segment: dict = None):
+    """Store a broadcast job with its recipients and start sending in the background."""
+    if not isinstance(db, Database):
+        await message.reply_text("⚠️ الإذاعة تتطلب قاعدة بيانات PostgreSQL.")
+        return
+    job = db.create_broadcast_job(audience, payload.to_dict(), message.chat_id, message.chat_id, segment)
+    if not job:
+        await message.reply_text("❌ خطأ في قاعدة البيانات: تعذر إنشاء الإذاعة.")
+        return
+
+    progress_msg = await message.reply_text(f"📊 جاري الإرسال... 0/{job['total']}")
+    db.update_broadcast_job(job['id'], progress_message_id=progress_msg.message_id)
+    job_runner.start(context.bot, db, job['id'])
+
+async def resume_broadcast_jobs(bot, db):
+    """Continue broadcasts interrupted by a restart."""
+    await job_runner.resume_all(bot, db)
+
+async def handle_broadcast_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, db):
+    """Pause, resume, cancel or view broadcast jobs."""
+    query = update.callback_query
+    data = query.data
+
+    if data == "broadcast_jobs":
+        jobs = db.get_broadcast_jobs(limit=10)
+        if not jobs:
+            text = "📋 لا توجد إذاعات سابقة."
         else:
-            # Fallback for other types
-            sent_msg = await message_obj.copy(
-                chat_id=chat_id,
-                disable_notification=silent,
-                reply_markup=buttons,
-                caption=clean_text if (message_obj.caption is not None) else None
+            text = "📋 آخر الإذاعات:\n\n" + "\n".join(
+                f"#{job['id']} - {AUDIENCE_LABELS.get(job['audience'], job['audience'])} - "
+                f"{JOB_STATUS_LABELS.get(job['status'], job['status'])}"
+                for job in jobs
             )
+        keyboard = [
+            [InlineKeyboardButton(f"#{job['id']}", callback_data=f"broadcast_job_view:{job['id']}")]
+            for job in jobs if job['status'] in ("running", "paused")
+        ]
+        keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="admin_back")])
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        return
 
-        if pin and sent_msg:
-            try:
-                await sent_msg.pin(disable_notification=silent)
-            except:
-                pass
-                
-        return True
-
-    except Forbidden:
-        # User blocked bot
-        return False
+    action, _, job_id = data.partition(":")
+    job_id = int(job_id)
+    job = db.get_broadcast_job(job_id)
+    if not job:
+        await query.message.edit_text("⚠️ لم يتم العثور على الإذاعة.")
+        return
+
+    if action == "broadcast_job_pause" and job['status'] == "running":
+        db.update_broadcast_job(job_id, status="paused")
+    elif action == "broadcast_job_resume" and job['status'] == "paused":
+        db.update_broadcast_job(job_id, status="running")
+        if not job_runner.is_running(job_id):
+            db.requeue_stalled_broadcast_recipients(job_id)
+        job_runner.start(context.bot, db, job_id)
+    elif action == "broadcast_job_cancel" and job['status'] in ("running", "paused"):
+        db.update_broadcast_job(job_id, status="cancelled")
+
+    # This message becomes the job's progress message
+    db.update_broadcast_job(job_id, progress_message_id=query.message.message_id)
+    job = db.get_broadcast_job(job_id)
+    text, reply_markup = render_job_progress(job, db.get_broadcast_progress(job_id))
+    try:
+        await query.message.edit_text(text, reply_markup=reply_markup)
     except TelegramError as e:
-        logger.warning(f"Broadcast failed for {chat_id}: {e}")
-        return False
+        logger.debug(f"Broadcast job view not updated: {e}")
 
 def extract_buttons(text_content):
     """Extract buttons defined as 'Text | URL' from the end of the text."""
@@ -0,0 +1,288 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from telegram.error import TelegramError
+from datetime import datetime, timedelta, timezone
+import logging
+
+from ..storage import BROWSE_SORTS
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+# Callback data: "<prefix>:<sort>" for a first page, "<prefix>:<sort>:<n|p>:<key>:<id>" to page
+# forward/back from a row. Timestamps travel as integer microseconds to stay exact.
+BROWSE_PREFIXES = {"ub": "users", "gb": "groups"}
+
+SORT_LABELS = {
+    "r": "🕒 آخر نشاط",
+    "m": "💬 الأكثر رسائل",
+    "j": "🆕 الأحدث انضماماً",
+    "i": "🖼 الأكثر صوراً",
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TIME_COLUMNS = {"last_active", "join_date"}
+
+
+def _encode_key(value) -> str:
+    if isinstance(value, datetime):
+        return str((value - _EPOCH) // timedelta(microseconds=1))
+    return str(value or 0)
+
+
+def _decode_key(kind: str, sort: str, raw: str):
+    if BROWSE_SORTS[kind][sort] in _TIME_COLUMNS:
+        return _EPOCH + timedelta(microseconds=int(raw))
+    return int(raw)
+
+
+def _format_date(value, with_time: bool = False) -> str:
+    if not isinstance(value, datetime):
+        return "غير معروف"
+    return value.strftime("%Y-%m-%d %H:%M" if with_time else "%Y-%m-%d")
+
+
+def _page_keyboard(prefix: str, sort: str, rows: list, id_column: str,
+                   has_prev: bool, has_next: bool, back: str, row_buttons: list = None):
+    """Row buttons, then prev/next, then the sort options."""
+    kind = BROWSE_PREFIXES[prefix]
+    sort_column = BROWSE_SORTS[kind][sort]
+    keyboard = list(row_buttons or [])
+
+    nav = []
+    if has_prev and rows:
+        first = rows[0]
+        nav.append(InlineKeyboardButton(
+            "◀️ السابق",
+            callback_data=f"{prefix}:{sort}:p:{_encode_key(first[sort_column])}:{first[id_column]}"
+        ))
+    if has_next and rows:
+        last = rows[-1]
+        nav.append(InlineKeyboardButton(
+            "التالي ▶️",
+            callback_data=f"{prefix}:{sort}:n:{_encode_key(last[sort_column])}:{last[id_column]}"
+        ))
+    if nav:
+        keyboard.append(nav)
+
+    sort_buttons = [
+        InlineKeyboardButton(f"{'✅ ' if key == sort else ''}{SORT_LABELS[key]}", callback_data=f"{prefix}:{key}")
+        for key in BROWSE_SORTS[kind]
+    ]
+    keyboard.extend(sort_buttons[i:i + 2] for i in range(0, len(sort_buttons), 2))
+    keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data=back)])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _load_page(db, data: str):
+    """Parse browse callback data and fetch its page: (prefix, sort, rows, has_prev, has_next, first_page)."""
+    parts = data.split(":")
+    prefix = parts[0]
+    kind = BROWSE_PREFIXES[prefix]
+    sort = parts[1] if len(parts) > 1 and parts[1] in BROWSE_SORTS[kind] else "r"
+
+    if len(parts) == 5:
+        direction, raw_key, raw_id = parts[2], parts[3], parts[4]
+        cursor = (_decode_key(kind, sort, raw_key), int(raw_id))
+        backwards = direction == "p"
+        rows, has_more = db.get_browse_page(kind, sort, cursor, backwards=backwards, limit=PAGE_SIZE)
+        if backwards:
+            return prefix, sort, rows, has_more, True, False
+        return prefix, sort, rows, True, has_more, False
+
+    rows, has_more = db.get_browse_page(kind, sort, limit=PAGE_SIZE)
+    return prefix, sort, rows, False, has_more, True
+
+
+async def show_users_page(query, context: ContextTypes.DEFAULT_TYPE, db, data: str = "ub:r"):
+    """Show one page of the user browser."""
+    prefix, sort, rows, has_prev, has_next, first_page = _load_page(db, data)
+    # Remember the page so the drill-down can come back to it
+    context.user_data['browse_back'] = data
+
+    text = f"👥 المستخدمين — الترتيب: {SORT_LABELS[sort]}\n"
+    if first_page:
+        daily_stats = db.get_daily_activity_stats()
+        text += (
+            f"\n📊 إجمالي المستخدمين: {db.get_total_users()}"
+            f"\n📱 المستخدمين النشطين اليوم: {daily_stats['unique_active_users']}\n"
+        )
+    if not rows:
+        text += "\nلا يوجد مستخدمين."
+    for user in rows:
+        text += (
+            f"\n- {user['first_name']} (@{user['username']}) | 💬 {user['message_count']} | "
+            f"🖼 {user['image_count']} | 🕒 {_format_date(user['last_active'])}"
+        )
+
+    row_buttons = [
+        [InlineKeyboardButton(f"👤 {user['first_name'] or user['user_id']}", callback_data=f"ud:{user['user_id']}")]
+        for user in rows
+    ]
+    await query.message.edit_text(
+        text,
+        reply_markup=_page_keyboard(prefix, sort, rows, "user_id", has_prev, has_next, "admin_back", row_buttons)
+    )
+
+
+async def show_groups_page(query, context: ContextTypes.DEFAULT_TYPE, db, data: str = "gb:r"):
+    """Show one page of the group browser."""
+    prefix, sort, rows, has_prev, has_next, first_page = _load_page(db, data)
+
+    text = f"🏢 المجموعات — الترتيب: {SORT_LABELS[sort]}\n"
+    if first_page:
+        daily_stats = db.get_daily_activity_stats()
+        text += (
+            f"\n📱 العدد الكلي: {db.get_total_groups()}"
+            f"\n✅ النشطة اليوم: {daily_stats['active_groups']}\n"
+        )
+    if not rows:
+        text += "\nلا توجد مجموعات."
+    for group in rows:
+        text += (
+            f"\n- {group['title'] or 'مجموعة غير معروفة'} ({group['chat_id']})"
+            f"\n   💬 {group['message_count']} | 👥 {group['members_count'] or '?'} | "
+            f"🕒 {_format_date(group['last_active'])}"
+        )
+
+    await query.message.edit_text(
+        text,
+        reply_markup=_page_keyboard(prefix, sort, rows, "chat_id", has_prev, has_next, "admin_groups")
+    )
+
+
+async def show_user_details(query, context: ContextTypes.DEFAULT_TYPE, db, user_id: int):
+    """Drill-down view of one user with ban and premium toggles."""
+    user = db.get_user_stats(user_id)
+    if not user:
+        await query.message.edit_text(
+            "❌ المستخدم غير موجود في قاعدة البيانات.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 رجوع", callback_data=context.user_data.get('browse_back', "ub:r"))
+            ]])
+        )
+        return
+
+    banned = db.is_user_banned(user_id)
+    premium = db.is_user_premium(user_id)
+    text = (
+        f"👤 معلومات المستخدم\n\n"
+        f"- الاسم: {user['first_name']}\n"
+        f"- المعرف: @{user['username']}\n"
+        f"- رقم المعرف: {user_id}\n"
+        f"- تاريخ الانضمام: {_format_date(user['join_date'])}\n"
+        f"- آخر نشاط: {_format_date(user['last_active'], with_time=True)}\n"
+        f"- الرسائل: {user['message_count']}\n"
+        f"- الصور: {user['image_count']} (اليوم: {db.get_daily_image_count_for_user(user_id)})\n"
+        f"- الحالة: {'🚫 محظور' if banned else '✅ غير محظور'}\n"
+        f"- مميز: {'⭐ نعم' if premium else 'لا'}"
+    )
+    keyboard = [
+        [InlineKeyboardButton("✅ إلغاء الحظر" if banned else "🚫 حظر",
+                              callback_data=f"ua:{'unban' if banned else 'ban'}:{user_id}"),
+         InlineKeyboardButton("❌ إزالة التميز" if premium else "⭐ جعله مميزاً",
+                              callback_data=f"ua:{'unprem' if premium else 'prem'}:{user_id}")],
+        [InlineKeyboardButton("🔙 رجوع", callback_data=context.user_data.get('browse_back', "ub:r"))]
+    ]
+    await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+_USER_NOTICES = {
+    "ban": "⚠️ تم حظرك من استخدام البوت من قبل المشرف.",
+    "unban": "✅ تم إلغاء حظرك من البوت. يمكنك الآن استخدام البوت مرة أخرى.",
+}
+
+
+async def handle_user_action(query, context: ContextTypes.DEFAULT_TYPE, db, action: str, user_id: int):
+    """Apply a drill-down action, then show the user again."""
+    if action == "ban":
+        db.ban_user(user_id)
+    elif action == "unban":
+        db.unban_user(user_id)
+    elif action == "prem":
+        db.add_premium_user(user_id)
+    elif action == "unprem":
+        db.remove_premium_user(user_id)
+
+    if action in _USER_NOTICES:
+        try:
+            await context.bot.send_message(chat_id=user_id, text=_USER_NOTICES[action])
+        except TelegramError:
+            pass  # تجاهل الفشل في إرسال الإشعار
+
+    await show_user_details(query, context, db, user_id)
+
+
+SEARCH_STATES = {
+    "user_search": "waiting_user_search",
+    "groups_search": "waiting_group_search",
+}
+
+
+async def start_search(query, context: ContextTypes.DEFAULT_TYPE, kind: str):
+    """Ask the admin for a search term; `kind` is 'user_search' or 'groups_search'."""
+    context.user_data['admin_state'] = SEARCH_STATES[kind]
+    if kind == "user_search":
+        text = "🔎 بحث عن مستخدم\n\nأرسل جزءاً من الاسم أو اسم المستخدم أو رقم المعرف.\n\nللإلغاء، أرسل /cancel"
+        back = "admin_back"
+    else:
+        text = "🔍 بحث عن مجموعة\n\nأرسل جزءاً من اسم المجموعة أو رقم معرفها.\n\nللإلغاء، أرسل /cancel"
+        back = "admin_groups"
+    await query.message.edit_text(
+        text,
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ إلغاء", callback_data=back)]])
+    )
+
+
+async def handle_search_input(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
+    """Run the admin's search and list the matches; users open in the drill-down view."""
+    term = update.message.text.strip()
+    searching_users = context.user_data.get('admin_state') == SEARCH_STATES["user_search"]
+    # Stay logged in to the panel, but stop treating messages as search terms
+    context.user_data['admin_state'] = True
+
+    if searching_users:
+        results = db.search_users(term)
+        text = f"🔎 نتائج البحث عن \"{term}\": {len(results)}\n"
+        keyboard = [
+            [InlineKeyboardButton(
+                f"👤 {user['first_name'] or user['user_id']} (@{user['username']}) | 💬 {user['message_count']}",
+                callback_data=f"ud:{user['user_id']}"
+            )]
+            for user in results
+        ]
+        keyboard.append([InlineKeyboardButton("🔎 بحث جديد", callback_data="user_search"),
+                         InlineKeyboardButton("🔙 رجوع", callback_data="admin_back")])
+    else:
+        results = db.search_groups(term)
+        text = f"🔍 نتائج البحث عن \"{term}\": {len(results)}\n"
+        for group in results:
+            text += (
+                f"\n- {group['title'] or 'مجموعة غير معروفة'} ({group['chat_id']})"
+                f"\n   💬 {group['message_count']} | 🕒 {_format_date(group['last_active'])}"
+            )
+        keyboard = [[InlineKeyboardButton("🔍 بحث جديد", callback_data="groups_search"),
+                     InlineKeyboardButton("🔙 رجوع", callback_data="admin_groups")]]
+
+    if not results:
+        text += "\nلا توجد نتائج."
+    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def handle_browse_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
+    """Route ub:/gb: (pages), ud: (user details) and ua: (user actions) callbacks."""
+    query = update.callback_query
+    data = query.data
+    try:
+        if data.startswith("ub:"):
+            await show_users_page(query, context, db, data)
+        elif data.startswith("gb:"):
+            await show_groups_page(query, context, db, data)
+        elif data.startswith("ud:"):
+            await show_user_details(query, context, db, int(data.split(":")[1]))
+        elif data.startswith("ua:"):
+            _, action, user_id = data.split(":")
+            await handle_user_action(query, context, db, action, int(user_id))
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Invalid browse callback {data!r}: {e}")
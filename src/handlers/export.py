@@ -0,0 +1,85 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from datetime import datetime, timezone
+import asyncio
+import gzip
+import logging
+import os
+import tempfile
+
+from ..database_postgres import EXPORT_QUERIES
+
+logger = logging.getLogger(__name__)
+
+EXPORT_LABELS = {
+    "users": "👥 المستخدمين",
+    "groups": "🏢 المجموعات",
+    "activity_daily": "📅 النشاط اليومي",
+    "activity_hourly": "🕒 النشاط بالساعة",
+}
+EXPORT_FORMATS = {"csv": "CSV", "jsonl": "JSONL"}
+
+# Bots can upload documents up to 50 MB
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+
+def get_export_keyboard():
+    """One row per dataset, one button per format."""
+    keyboard = [
+        [InlineKeyboardButton(f"{EXPORT_LABELS[name]} ({label})", callback_data=f"export:{name}:{fmt}")
+         for fmt, label in EXPORT_FORMATS.items()]
+        for name in EXPORT_QUERIES
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 رجوع", callback_data="admin_back")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def show_export_menu(query):
+    await query.message.edit_text(
+        "📤 تصدير البيانات\n\nاختر البيانات والصيغة. يصلك الملف مضغوطاً (gzip).",
+        reply_markup=get_export_keyboard()
+    )
+
+
+def _write_export(db, name: str, fmt: str) -> tuple:
+    """Export a dataset into a gzip temp file; returns (path, rows). Runs in a worker thread."""
+    fd, path = tempfile.mkstemp(prefix=f"export_{name}_", suffix=f".{fmt}.gz")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            rows = db.export_dataset(name, fmt, gz)
+        return path, rows
+    except Exception:
+        os.remove(path)
+        raise
+
+
+async def handle_export_callback(query, context: ContextTypes.DEFAULT_TYPE, db) -> None:
+    """Build the requested export off the event loop and send it as a document."""
+    _, name, fmt = query.data.split(":")
+    if name not in EXPORT_QUERIES or fmt not in EXPORT_FORMATS:
+        return
+
+    status = await query.message.reply_text(f"⏳ جاري تصدير {EXPORT_LABELS[name]}...")
+    path = None
+    try:
+        path, rows = await asyncio.to_thread(_write_export, db, name, fmt)
+        size = os.path.getsize(path)
+        if size > MAX_DOCUMENT_BYTES:
+            await status.edit_text(f"⚠️ حجم الملف ({size / 1024 / 1024:.0f} MB) أكبر من الحد المسموح لإرساله عبر تيليجرام.")
+            return
+
+        filename = f"{name}_{datetime.now(timezone.utc):%Y%m%d_%H%M}.{fmt}.gz"
+        with open(path, "rb") as document:
+            await context.bot.send_document(
+                chat_id=query.message.chat_id,
+                document=document,
+                filename=filename,
+                caption=f"{EXPORT_LABELS[name]}: {rows} صف"
+            )
+        await status.delete()
+    except Exception as e:
+        logger.error(f"Export of {name} failed: {e}", exc_info=True)
+        await status.edit_text("❌ حدث خطأ أثناء التصدير. الرجاء المحاولة مرة أخرى.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
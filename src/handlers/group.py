@@ -1,4 +1,4 @@
-from telegram import Update
+from telegram import Update, MessageEntity
 from telegram.ext import ContextTypes
 import requests
 import re
@@ -14,48 +14,33 @@ from collections import deque
 from ..config import GEMINI_API_KEYS, GEMINI_API_URL, GEMINI_VISION_API_URL, BOT_SIGNATURE
 from ..utils.search import search_exa
 from ..utils.formatting import format_message, add_signature
+from ..utils.delivery import reply_html_chunks
 from ..utils.key_manager import KeyManager
+from ..utils.state_cache import BoundedLRU
+from ..utils.expiring_history import ExpiringHistory
+from ..utils.url_cache import extract_urls
+from ..utils.scan_queue import LinkScanQueue
 
 logger = logging.getLogger(__name__)
 
 class GroupHandler:
     def __init__(self, database):
         self.db = database
-        self.message_history = {}  # Dictionary to store message history for each group (for replies)
-        self.group_context = {}    # Dictionary to store sliding window context for each group
+        # Bot replies per group (for reply context), expired after 24 hours
+        self.message_history = ExpiringHistory(ttl=24 * 3600, max_per_chat=300)
+        # Sliding window context for each group, bounded so idle groups are dropped
+        self.group_context = BoundedLRU("group_context", max_entries=2000, ttl=24 * 3600)
         self.cleanup_task = None
         self.key_manager = KeyManager(GEMINI_API_KEYS)
+        # Per-group auto_scan flag, so link-free messages never touch the database
+        self.auto_scan_settings = BoundedLRU("auto_scan_settings", max_entries=5000, ttl=600)
+        self.scan_queue = LinkScanQueue(self._report_flagged_link, db=database)
 
-    async def start_cleanup_task(self):
-        """بدء مهمة تنظيف الرسائل القديمة"""
+    async def start_background_tasks(self):
+        """بدء مهمة انتهاء صلاحية سجل الردود وعمّال الفحص التلقائي للروابط"""
         if self.cleanup_task is None:
-            self.cleanup_task = asyncio.create_task(self.cleanup_old_messages())
-
-    async def cleanup_old_messages(self):
-        """تنظيف الرسائل القديمة كل ساعة"""
-        while True:
-            try:
-                current_time = time.time()
-                for chat_id in list(self.message_history.keys()):
-                    # حذف الرسائل الأقدم من 24 ساعة
-                    messages_to_delete = []
-                    for msg_id, msg_data in self.message_history[chat_id].items():
-                        if current_time - msg_data['timestamp'] >= 24 * 3600:  # 24 hours in seconds
-                            messages_to_delete.append(msg_id)
-
-                    # حذف الرسائل القديمة من القاموس
-                    for msg_id in messages_to_delete:
-                        del self.message_history[chat_id][msg_id]
-
-                    # حذف المجموعة إذا كانت فارغة
-                    if not self.message_history[chat_id]:
-                        del self.message_history[chat_id]
-
-            except Exception as e:
-                print(f"Error in cleanup task: {str(e)}")
-
-
-            await asyncio.sleep(3600)  # 1 hour in seconds
+            self.cleanup_task = asyncio.create_task(self.message_history.run_expiry())
+        self.scan_queue.start()
 
     async def handle_my_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """التعامل مع تحديثات حالة البوت في المجموعة (إضافة/طرد)"""
@@ -64,6 +49,11 @@ class GroupHandler:
         status_change = update.my_chat_member.new_chat_member.status
         old_status = update.my_chat_member.old_chat_member.status
 
+        # في المحادثات الخاصة: حظر البوت أو إلغاء حظره
+        if chat.type == 'private':
+            self.db.set_chats_reachable([chat.id], status_change != 'kicked')
+            return
+
         # التحقق من أن التحديث في مجموعة
         if chat.type not in ['group', 'supergroup']:
             return
@@ -87,16 +77,16 @@ class GroupHandler:
                     "مثال: cyber كيف حالك؟\n\n"
                     "أوامر المشرفين:\n"
                     "/setprompt - تعيين شخصية مخصصة\n"
-                    "/resetprompt - استعادة الشخصية الافتراضية"
+                    "/resetprompt - استعادة الشخصية الافتراضية\n"
+                    "/autoscan on - تفعيل الفحص التلقائي للروابط"
                 )
                 await context.bot.send_message(chat_id=chat.id, text=welcome_text)
 
         # البوت تم طرده أو مغادرته
         elif status_change in ['left', 'kicked']:
             logger.info(f"Bot left group: {chat.title} ({chat.id})")
-            # يمكننا هنا تحديث الحالة في قاعدة البيانات إلى غير نشطة إذا أردنا
-            # حالياً add_group يقوم بالتحديث فقط، قد نحتاج لدالة لتعطيل المجموعة
-            pass
+            # تستثنى المجموعة من الإذاعات حتى تتم إضافة البوت مجدداً
+            self.db.set_chats_reachable([chat.id], False)
 
 
 
@@ -112,6 +102,7 @@ class GroupHandler:
 • /setprompt - لتعيين برومبت مخصص للمجموعة
 • /resetprompt - لإعادة تعيين البرومبت للفاصل
 • /getprompt - لعرض البرومبت الحالي
+• /autoscan on|off - لتفعيل أو إيقاف الفحص التلقائي للروابط المرسلة في المجموعة (للمشرفين)
 
 
 """
@@ -174,6 +165,80 @@ class GroupHandler:
         else:
             await update.message.reply_text("ℹ️ هذه المجموعة ليس لديها برومبت مخصص (تعمل بالوضع الافتراضي).")
 
+    async def auto_scan_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تفعيل أو إيقاف الفحص التلقائي للروابط في المجموعة"""
+        chat = update.effective_chat
+        user = update.effective_user
+
+        if chat.type not in ['group', 'supergroup']:
+            await update.message.reply_text("ℹ️ هذا الأمر متاح في المجموعات فقط.")
+            return
+
+        if not context.args:
+            enabled = self._is_auto_scan_enabled(chat.id)
+            state = "مفعّل ✅" if enabled else "متوقف ⛔"
+            await update.message.reply_text(
+                f"الفحص التلقائي للروابط: {state}\nللتغيير: /autoscan on أو /autoscan off"
+            )
+            return
+
+        # Check if user is admin
+        member = await context.bot.get_chat_member(chat.id, user.id)
+        if member.status not in ['administrator', 'creator']:
+             await update.message.reply_text("⛔ عذراً، هذا الأمر مخصص للمشرفين فقط.")
+             return
+
+        choice = context.args[0].lower()
+        if choice not in ('on', 'off'):
+            await update.message.reply_text("الاستخدام: /autoscan on أو /autoscan off")
+            return
+
+        enabled = choice == 'on'
+        self.db.set_group_auto_scan(chat.id, enabled)
+        self.auto_scan_settings.set(chat.id, enabled)
+        if enabled:
+            await update.message.reply_text("✅ تم تفعيل الفحص التلقائي للروابط. سأنبه فقط عند اكتشاف رابط خبيث.")
+        else:
+            await update.message.reply_text("⛔ تم إيقاف الفحص التلقائي للروابط.")
+
+    def _is_auto_scan_enabled(self, chat_id: int) -> bool:
+        enabled = self.auto_scan_settings.get(chat_id)
+        if enabled is None:
+            enabled = self.db.get_group_auto_scan(chat_id)
+            self.auto_scan_settings.set(chat_id, enabled)
+        return enabled
+
+    def _queue_links(self, message, context: ContextTypes.DEFAULT_TYPE):
+        """Queue the links in a group message for background scanning (never awaits a scan)"""
+        text = message.text or message.caption
+        entities = message.entities or message.caption_entities or ()
+        hidden_links = [entity.url for entity in entities if entity.type == MessageEntity.TEXT_LINK]
+        urls = extract_urls(text, hidden_links)
+        if not urls or not self._is_auto_scan_enabled(message.chat_id):
+            return
+        for url in urls:
+            self.scan_queue.submit(context.bot, message.chat_id, message.message_id, url)
+
+    async def _report_flagged_link(self, job, results):
+        """تنبيه المجموعة عند اكتشاف رابط خبيث"""
+        # Defang the link so the warning itself is not clickable
+        shown_url = job.url.replace("http", "hxxp", 1).replace(".", "[.]")
+        details = "\n".join(result.text for result in results if result.verdict == "malicious")
+        warning = (
+            "⚠️ تحذير: تم اكتشاف رابط خبيث في هذه الرسالة، يرجى عدم فتحه.\n\n"
+            f"🔗 {shown_url}\n\n"
+            f"{details}"
+        )
+        try:
+            await job.bot.send_message(
+                chat_id=job.chat_id,
+                text=warning,
+                reply_to_message_id=job.message_id,
+                disable_web_page_preview=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to send link warning to {job.chat_id}: {e}")
+
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """التعامل مع الرسائل في المجموعات مع سياق ذكي"""
         message = update.message
@@ -182,11 +247,12 @@ class GroupHandler:
         if not message or not chat or chat.type not in ['group', 'supergroup']:
             return
 
-        # تنظيف الرسائل القديمة
-        await self.start_cleanup_task()
         # تحديث نشاط المجموعة
         await self._update_group_activity(chat, message)
 
+        # Auto-scan runs in the background; only flagged links get a reply
+        self._queue_links(message, context)
+
         # Context Info
         user = message.from_user
         user_name = user.first_name if user else "Unknown"
@@ -194,20 +260,21 @@ class GroupHandler:
         chat_title = chat.title
 
         # --- 1. Sliding Window Context Management ---
-        if chat.id not in self.group_context:
-            self.group_context[chat.id] = deque(maxlen=3)
+        window = self.group_context.get_or_create(chat.id, lambda: deque(maxlen=3))
         
         # Store current message in sliding window (Text only)
         if message.text:
-            self.group_context[chat.id].append(f"{user_name}: {message.text}")
+            window.append(f"{user_name}: {message.text}")
         elif message.caption:
-            self.group_context[chat.id].append(f"{user_name}: [Image] {message.caption}")
+            window.append(f"{user_name}: [Image] {message.caption}")
+        self.group_context.resize(chat.id)
         # ---------------------------------------------
 
         # Commands & Triggers
         if message.text == " محادثة جديدة":
-             self.message_history[chat.id] = {}
-             self.group_context[chat.id].clear()
+             self.message_history.clear_chat(chat.id)
+             window.clear()
+             self.group_context.resize(chat.id)
              await message.reply_text(f"تم بدء محادثة جديدة.{BOT_SIGNATURE}")
              return
 
@@ -254,14 +321,14 @@ class GroupHandler:
             system_prompt = custom_prompt if custom_prompt else self.db.get_prompt_content('default')
 
             # Build Recent Context String
-            recent_discussion = "\n".join(list(self.group_context[chat.id])[:-1]) # Exclude current message from context to avoid duplication if needed, or include it. Let's exclude current.
+            recent_discussion = "\n".join(list(window)[:-1]) # Exclude current message from context to avoid duplication if needed, or include it. Let's exclude current.
 
             # If it's a specific reply, get the pair
             specific_reply_context = ""
             if is_reply and message.reply_to_message:
                 reply_msg_id = message.reply_to_message.message_id
-                if chat.id in self.message_history and reply_msg_id in self.message_history[chat.id]:
-                    prev = self.message_history[chat.id][reply_msg_id]
+                prev = self.message_history.get(chat.id, reply_msg_id)
+                if prev:
                     specific_reply_context = f"User is replying to this:\nBot: {prev['response']}\n(Original Question: {prev['question']})"
                 elif message.reply_to_message.text:
                     specific_reply_context = f"User is replying to this Bot Message:\n{message.reply_to_message.text}"
@@ -308,16 +375,16 @@ Time: {datetime.now().strftime('%H:%M')}
             formatted_response = format_message(response_text)
             final_response = add_signature(formatted_response)
             
-            sent_message = await processing_msg.edit_text(final_response, parse_mode='HTML')
+            sent_messages = await reply_html_chunks(message, final_response, edit_message=processing_msg)
 
-            # Save to History
-            if chat.id not in self.message_history:
-                self.message_history[chat.id] = {}
-            self.message_history[chat.id][sent_message.message_id] = {
+            # Save to History (any chunk of the answer can be replied to)
+            entry = {
                 'question': query,
                 'response': final_response,
                 'timestamp': time.time()
             }
+            for sent_message in sent_messages:
+                self.message_history.add(chat.id, sent_message.message_id, entry)
 
         except Exception as e:
             logger.error(f"Error in handle_message: {e}", exc_info=True)
@@ -361,22 +428,6 @@ Time: {datetime.now().strftime('%H:%M')}
                 continue
         return "عذراً، خدمة الصور مشغولة حالياً."
 
-    async def broadcast_message(self, context: ContextTypes.DEFAULT_TYPE, message: str):
-        """إرسال رسالة إلى جميع المجموعات"""
-        groups = self.db.get_all_groups()
-        success_count = 0
-        fail_count = 0
-
-        for group in groups:
-            try:
-                await context.bot.send_message(chat_id=group['chat_id'], text=message)
-                success_count += 1
-            except Exception as e:
-                fail_count += 1
-                continue
-
-        return success_count, fail_count
-
     async def get_ai_response(self, text: str) -> str:
         """الحصول على رد من Gemini API مع إعادة المحاولة وتدوير المفاتيح"""
         max_retries = 3
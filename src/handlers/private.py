@@ -12,60 +12,56 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKe
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from ..config import GEMINI_API_KEYS, GEMINI_API_URL, BOT_SIGNATURE, ADMIN_NOTIFICATION_ID
+from ..config import GEMINI_API_KEYS, GEMINI_API_URL, BOT_SIGNATURE, ADMIN_NOTIFICATION_ID, REQUIRED_CHANNEL
 from ..utils.formatting import format_message, add_signature
+from ..utils.delivery import reply_html_chunks
 from ..utils.key_manager import KeyManager
 from ..utils.search import search_exa
-from ..utils.link_scanner import scan_link
+from ..utils.link_scanner import PROVIDERS, iter_scan_results, format_scan_results
+from ..utils.state_cache import BoundedLRU, Turn
+from ..utils.subscription import SubscriptionCache
 from .admin import is_admin, admin_panel, handle_admin_message
 
 logger = logging.getLogger(__name__)
 
 class ConversationManager:
-    def __init__(self, max_history: int = 15):
-        self.histories: Dict[int, List[Dict]] = {}
+    def __init__(self, max_history: int = 15, max_users: int = 5000,
+                 max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 6 * 3600):
+        # user_id -> list of Turn, evicted by LRU, idle time and total size
+        self.histories = BoundedLRU(
+            "conversations", max_entries=max_users, max_bytes=max_bytes, ttl=idle_ttl
+        )
         self.max_history = max_history
 
     def get_history(self, user_id: int) -> List[Dict]:
-        if user_id not in self.histories:
-            self.histories[user_id] = []
-        return self.histories[user_id]
+        turns = self.histories.get(user_id) or []
+        return [turn.to_content() for turn in turns]
 
     def add_message(self, user_id: int, role: str, text: str, image_data: str = None):
-        if user_id not in self.histories:
-            self.histories[user_id] = []
-        
-        parts = [{"text": text}]
-        if image_data:
-            parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": image_data
-                }
-            })
-            
-        self.histories[user_id].append({
-            "role": role,
-            "parts": parts
-        })
-        
+        turns = self.histories.get_or_create(user_id, list)
+        turns.append(Turn(role, text, image_data))
+
         # Trim history (keep last max_history messages)
-        # Ensure we don't cut in the middle of a turn if possible, but simple trimming is okay for now.
-        if len(self.histories[user_id]) > self.max_history:
-            removed = self.histories[user_id][:-self.max_history]
-            self.histories[user_id] = self.histories[user_id][-self.max_history:]
-            # If the new first message is 'model', remove it to start with 'user' if strictly needed,
-            # but Gemini usually handles it. To be safe:
-            if self.histories[user_id] and self.histories[user_id][0]['role'] == 'model':
-                self.histories[user_id].pop(0)
+        if len(turns) > self.max_history:
+            del turns[:-self.max_history]
+            # Make sure the history still starts with a 'user' turn
+            if turns and turns[0].role == 'model':
+                turns.pop(0)
+
+        self.histories.resize(user_id)
 
     def clear_history(self, user_id: int):
-        self.histories[user_id] = []
+        self.histories.pop(user_id)
 
 conversation_manager = ConversationManager()
 key_manager = KeyManager(GEMINI_API_KEYS)
-subscription_cache: Dict[int, tuple] = {}
-SUBSCRIPTION_CACHE_DURATION = 60  # seconds
+SUBSCRIPTION_CACHE_DURATION = 600  # seconds a positive check is trusted
+SUBSCRIPTION_NEGATIVE_CACHE_DURATION = 30  # seconds a negative check is trusted
+subscription_cache = SubscriptionCache(
+    REQUIRED_CHANNEL,
+    positive_ttl=SUBSCRIPTION_CACHE_DURATION,
+    negative_ttl=SUBSCRIPTION_NEGATIVE_CACHE_DURATION,
+)
 
 
 def get_base_keyboard():
@@ -75,13 +71,17 @@ def get_base_keyboard():
         [KeyboardButton(" فحص الروابط")],
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Check if user is subscribed to the channel."""
-    try:
-        member = await context.bot.get_chat_member(chat_id="@cyber_code1", user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except Exception:
-        return False
+async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE, force: bool = False) -> bool:
+    """Check if user is subscribed to the channel (cached, see SubscriptionCache)."""
+    return await subscription_cache.is_subscribed(context.bot, user_id, force=force)
+
+async def handle_channel_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep the subscription cache in sync with join/leave updates from the channel."""
+    member_update = update.chat_member
+    if not member_update or not subscription_cache.is_channel(member_update.chat):
+        return
+    new_member = member_update.new_chat_member
+    subscription_cache.record_status(new_member.user.id, new_member.status)
 
 async def force_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Force user to subscribe to channel."""
@@ -99,6 +99,33 @@ async def force_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return False
     return True
 
+async def run_link_scan(update: Update, url: str, db) -> None:
+    """Scan a link, editing one status message as each provider reports back."""
+    status_message = await update.message.reply_text("جارٍ فحص الرابط... ")
+    results = []
+    shown = None
+    async for result in iter_scan_results(url, db):
+        results.append(result)
+        # A local-list verdict is final; nothing else will report
+        if result.provider not in PROVIDERS:
+            continue
+        done = {r.provider for r in results}
+        pending = [name for name in PROVIDERS if name not in done]
+        report = format_scan_results(results, pending)
+        if not report:
+            continue
+        try:
+            await status_message.edit_text(f"نتائج الفحص:\n{report}", disable_web_page_preview=True)
+            shown = report
+        except TelegramError as e:
+            logger.warning(f"Failed to update scan progress: {e}")
+
+    report = format_scan_results(results)
+    if not report:
+        await status_message.edit_text("نتائج الفحص:\nتعذر فحص الرابط حالياً، حاول مرة أخرى لاحقاً.")
+    elif report != shown:
+        await status_message.edit_text(f"نتائج الفحص:\n{report}", disable_web_page_preview=True)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -> None:
     """Send a message when the command /start is issued."""
     user = update.effective_user
@@ -195,12 +222,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, db)
             return
 
         if context.user_data.get("waiting_for_url_scan"):
-            url_to_scan = user_message
-            await update.message.reply_text("جارٍ فحص الرابط... ")
-            scan_results = await scan_link(url_to_scan)
-            await update.message.reply_text(f"نتائج الفحص:\n{scan_results}", reply_markup=get_base_keyboard())
             context.user_data["waiting_for_url_scan"] = False
-            return    
+            await run_link_scan(update, user_message, db)
+            return
 
         db.update_user_activity(user_id, "text")
 
@@ -258,10 +282,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, db)
                             # Add model response to history
                             conversation_manager.add_message(user_id, "model", ai_response_text)
 
-                            await update.message.reply_text(
+                            await reply_html_chunks(
+                                update.message,
                                 f"{formatted_ai_response}{BOT_SIGNATURE}",
-                                reply_markup=get_base_keyboard(),
-                                parse_mode='HTML'
+                                reply_markup=get_base_keyboard()
                             )
                             return # Exit function on success
                         
@@ -388,10 +412,10 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, db) -
                             # Add model response to history
                             conversation_manager.add_message(user_id, "model", ai_response_text)
 
-                            await update.message.reply_text(
+                            await reply_html_chunks(
+                                update.message,
                                 f"{formatted_response}{BOT_SIGNATURE}",
-                                reply_markup=get_base_keyboard(),
-                                parse_mode='HTML'
+                                reply_markup=get_base_keyboard()
                             )
                             success = True
                             break # Exit loop
@@ -437,7 +461,7 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     user_id = query.from_user.id
 
-    if await check_subscription(user_id, context):
+    if await check_subscription(user_id, context, force=True):
         await query.answer("✅ شكراً لك! يمكنك الآن استخدام البوت")
         await query.message.edit_text("تم التحقق من اشتراكك بنجاح! يمكنك الآن استخدام البوت ✅")
         await start(update, context, db)
@@ -0,0 +1,363 @@
+"""
+Import the legacy bot_database.json store into PostgreSQL.
+
+The JSON is read with an incremental parser (a chunked buffer plus
+`JSONDecoder.raw_decode`), one user at a time, so memory stays flat however
+large the file is. Rows are bulk-loaded with COPY into temporary staging
+tables and merged in one transaction:
+
+- users keep the larger counters, the earliest join date and the latest
+  activity, and only fill in names the database does not already have;
+- daily image counts keep the larger count per user and day;
+- bans and premium status are added, never removed;
+- the legacy message/image totals are added once (recorded in bot_settings).
+
+Running it again with the same file changes nothing.
+
+Usage, from the repository root:
+    python -m src.importer [bot_database.json] [--url postgresql://...]
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import Iterator
+
+import psycopg2
+
+from .migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH_ROWS = 10000
+LEGACY_STATS_MARKER = "legacy_statistics_imported"
+
+_WHITESPACE = " \t\n\r"
+
+
+class JsonStream:
+    """Walk a JSON document from a file without loading all of it.
+
+    Containers are entered with `iter_object()`/`iter_array()`; anything
+    else is decoded whole with `value()`.
+    """
+
+    def __init__(self, fileobj, chunk_size: int = 1 << 16):
+        self.file = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has been consumed so the buffer stays about one chunk long
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, got {self.buf[self.pos]!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value, reading more input until it fits in the buffer."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _after_item(self, closing: str) -> bool:
+        char = self.peek()
+        if char == ",":
+            self.pos += 1
+            return True
+        if char == closing:
+            self.pos += 1
+            return False
+        raise ValueError(f"Expected ',' or {closing!r} at offset {self.pos}")
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of an object; the caller must consume each value before the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if not self._after_item("}"):
+                return
+
+    def iter_array(self) -> Iterator[None]:
+        """Yield once per array element; the caller must consume each element."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if not self._after_item("]"):
+                return
+
+
+class CopyBuffer:
+    """Collect CSV rows and COPY them into a staging table every `batch_rows` rows."""
+
+    def __init__(self, cursor, table: str, columns: str, batch_rows: int = COPY_BATCH_ROWS):
+        self.cursor = cursor
+        self.sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self.pending = 0
+        self._reset()
+
+    def _reset(self):
+        self.out = io.StringIO()
+        self.writer = csv.writer(self.out)
+
+    def add(self, *row) -> None:
+        # Empty CSV fields load as NULL
+        self.writer.writerow(["" if value is None else value for value in row])
+        self.pending += 1
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        self.out.seek(0)
+        self.cursor.copy_expert(self.sql, self.out)
+        self.rows += self.pending
+        self.pending = 0
+        self._reset()
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+STAGING = """
+    CREATE TEMP TABLE stage_users (
+        user_id BIGINT, username TEXT, first_name TEXT, join_date TIMESTAMP,
+        message_count INTEGER, image_count INTEGER, last_active TIMESTAMP
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_image_counts (user_id BIGINT, date DATE, count INTEGER) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_banned (user_id BIGINT) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_premium (user_id BIGINT) ON COMMIT DROP;
+    CREATE TEMP TABLE stage_groups (
+        chat_id BIGINT, title TEXT, join_date TIMESTAMP, message_count INTEGER,
+        members_count INTEGER, last_active TIMESTAMP
+    ) ON COMMIT DROP;
+"""
+
+# Legacy timestamps are naive ISO strings written in UTC
+MERGE = [
+    ("users", """
+        INSERT INTO users (user_id, username, first_name, join_date, message_count, image_count, last_active)
+        SELECT DISTINCT ON (user_id) user_id, COALESCE(username, ''), COALESCE(first_name, 'المستخدم'),
+               COALESCE(join_date AT TIME ZONE 'UTC', NOW()), COALESCE(message_count, 0), COALESCE(image_count, 0),
+               COALESCE(last_active AT TIME ZONE 'UTC', NOW())
+        FROM stage_users
+        ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            username = COALESCE(NULLIF(users.username, ''), EXCLUDED.username),
+            first_name = COALESCE(NULLIF(users.first_name, ''), EXCLUDED.first_name),
+            join_date = LEAST(users.join_date, EXCLUDED.join_date),
+            message_count = GREATEST(users.message_count, EXCLUDED.message_count),
+            image_count = GREATEST(users.image_count, EXCLUDED.image_count),
+            last_active = GREATEST(users.last_active, EXCLUDED.last_active)
+    """),
+    ("daily_image_counts", """
+        INSERT INTO daily_image_counts (user_id, date, count)
+        SELECT user_id, date, MAX(count) FROM stage_image_counts GROUP BY user_id, date
+        ON CONFLICT (user_id, date) DO UPDATE SET count = GREATEST(daily_image_counts.count, EXCLUDED.count)
+    """),
+    # Keep the image rollup in step with the daily counts it is built from:
+    # raise a day's total (summed over its slots) to the counted images
+    ("activity_daily", """
+        INSERT INTO activity_daily (date, slot, images)
+        SELECT counted.date, 0, counted.images - COALESCE(rollup.images, 0)
+        FROM (
+            SELECT date, SUM(count) AS images FROM daily_image_counts
+            WHERE date IN (SELECT DISTINCT date FROM stage_image_counts)
+            GROUP BY date
+        ) counted
+        LEFT JOIN (SELECT date, SUM(images) AS images FROM activity_daily GROUP BY date) rollup USING (date)
+        WHERE counted.images > COALESCE(rollup.images, 0)
+        ON CONFLICT (date, slot) DO UPDATE SET images = activity_daily.images + EXCLUDED.images
+    """),
+    ("banned_users", """
+        INSERT INTO banned_users (user_id) SELECT DISTINCT user_id FROM stage_banned
+        ON CONFLICT (user_id) DO NOTHING
+    """),
+    ("premium_users", """
+        INSERT INTO premium_users (user_id) SELECT DISTINCT user_id FROM stage_premium
+        ON CONFLICT (user_id) DO NOTHING
+    """),
+    ("groups", """
+        INSERT INTO groups (chat_id, title, join_date, message_count, members_count, last_active)
+        SELECT DISTINCT ON (chat_id) chat_id, title, COALESCE(join_date AT TIME ZONE 'UTC', NOW()),
+               COALESCE(message_count, 0), members_count, COALESCE(last_active AT TIME ZONE 'UTC', NOW())
+        FROM stage_groups
+        ORDER BY chat_id
+        ON CONFLICT (chat_id) DO UPDATE SET
+            title = COALESCE(groups.title, EXCLUDED.title),
+            join_date = LEAST(groups.join_date, EXCLUDED.join_date),
+            message_count = GREATEST(groups.message_count, EXCLUDED.message_count),
+            last_active = GREATEST(groups.last_active, EXCLUDED.last_active)
+    """),
+]
+
+
+def _stage(stream: JsonStream, cursor) -> dict:
+    """Parse the document and COPY it into the staging tables; returns the legacy statistics."""
+    users = CopyBuffer(cursor, "stage_users",
+                       "user_id, username, first_name, join_date, message_count, image_count, last_active")
+    image_counts = CopyBuffer(cursor, "stage_image_counts", "user_id, date, count")
+    banned = CopyBuffer(cursor, "stage_banned", "user_id")
+    premium = CopyBuffer(cursor, "stage_premium", "user_id")
+    groups = CopyBuffer(cursor, "stage_groups",
+                        "chat_id, title, join_date, message_count, members_count, last_active")
+    statistics = {}
+
+    for section in stream.iter_object():
+        if section == "users":
+            for user_id in stream.iter_object():
+                user = stream.value()
+                users.add(int(user_id), user.get("username"), user.get("first_name"), user.get("join_date"),
+                          _int(user.get("message_count")), _int(user.get("image_count")), user.get("last_active"))
+                for date, count in (user.get("daily_image_count") or {}).items():
+                    image_counts.add(int(user_id), date, _int(count))
+        elif section in ("banned_users", "premium_users"):
+            target = banned if section == "banned_users" else premium
+            for _ in stream.iter_array():
+                target.add(int(stream.value()))
+        elif section == "groups":
+            for chat_id in stream.iter_object():
+                group = stream.value()
+                groups.add(int(chat_id), group.get("title"), group.get("join_date"),
+                           _int(group.get("message_count")), group.get("members_count"), group.get("last_active"))
+        elif section == "statistics":
+            statistics = stream.value()
+        else:
+            stream.value()
+            logger.info(f"Skipping unknown section {section!r}")
+
+    for buffer in (users, image_counts, banned, premium, groups):
+        buffer.flush()
+    staged = {
+        "users": users.rows, "daily_image_counts": image_counts.rows, "banned_users": banned.rows,
+        "premium_users": premium.rows, "groups": groups.rows,
+    }
+    return {"staged": staged, "statistics": statistics}
+
+
+def _merge_statistics(cursor, statistics: dict) -> bool:
+    """Add the legacy totals once; returns False if an earlier run already did."""
+    cursor.execute("""
+        INSERT INTO bot_settings (key, value) VALUES (%s, %s)
+        ON CONFLICT (key) DO NOTHING
+    """, (LEGACY_STATS_MARKER, str(int(time.time()))))
+    if cursor.rowcount == 0:
+        return False
+    for key in ("total_messages", "total_images"):
+        cursor.execute("""
+            INSERT INTO statistics (key, value) VALUES (%s, %s)
+            ON CONFLICT (key) DO UPDATE SET value = statistics.value + EXCLUDED.value, updated_at = NOW()
+        """, (key, _int(statistics.get(key))))
+    return True
+
+
+def import_legacy_json(path: str, postgres_url: str) -> dict:
+    """Import `path` into the database at `postgres_url` in one transaction; returns a report."""
+    conn = psycopg2.connect(postgres_url)
+    try:
+        run_migrations(conn)
+        cursor = conn.cursor()
+        started = time.monotonic()
+        with open(path, encoding="utf-8") as fh:
+            cursor.execute(STAGING)
+            staged = _stage(JsonStream(fh), cursor)
+        parsed_at = time.monotonic()
+
+        merged = {}
+        for name, query in MERGE:
+            cursor.execute(query)
+            merged[name] = cursor.rowcount
+        statistics_added = _merge_statistics(cursor, staged["statistics"])
+        conn.commit()
+        finished = time.monotonic()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    rows = sum(staged["staged"].values())
+    return {
+        "staged": staged["staged"],
+        "merged": merged,
+        "statistics_added": statistics_added,
+        "rows": rows,
+        "stage_seconds": parsed_at - started,
+        "merge_seconds": finished - parsed_at,
+        "rows_per_second": rows / max(finished - started, 1e-9),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import the legacy bot_database.json into PostgreSQL.")
+    parser.add_argument("path", nargs="?", default="bot_database.json")
+    parser.add_argument("--url", default=os.getenv("POSTGRES_URL"), help="defaults to $POSTGRES_URL")
+    args = parser.parse_args()
+    if not args.url:
+        raise SystemExit("Set POSTGRES_URL or pass --url.")
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    report = import_legacy_json(args.path, args.url)
+    for table, count in report["staged"].items():
+        print(f"{table:<20} staged {count:>9,} | merged {report['merged'].get(table, 0):>9,}")
+    print(f"legacy totals        {'added' if report['statistics_added'] else 'already imported'}")
+    print(
+        f"{report['rows']:,} rows: COPY {report['stage_seconds']:.2f}s, merge {report['merge_seconds']:.2f}s "
+        f"({report['rows_per_second']:,.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Periodic database maintenance run on the bot's event loop.
+
+Each job is a blocking Database method run in a worker thread every
+`interval` seconds, so it never stalls update handling. The jobs share
+the handlers' connection pool, which is a ThreadedConnectionPool for this
+reason.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List
+
+from .retention import RETENTION_INTERVAL, run_retention
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COMPACTION_INTERVAL = int(os.getenv("COUNTER_COMPACTION_INTERVAL", "300"))
+
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def run_periodic(name: str, job: Callable, interval: float) -> None:
+    """Call `job()` in a thread every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await asyncio.to_thread(job)
+            logger.debug(f"Maintenance job {name} finished: {result}")
+        except Exception as e:
+            logger.error(f"Maintenance job {name} failed: {e}", exc_info=True)
+
+
+def start_maintenance_tasks(db) -> List[asyncio.Task]:
+    """Start the periodic jobs once; later calls return the running tasks."""
+    jobs = {
+        "compact_counters": (db.compact_counters, COUNTER_COMPACTION_INTERVAL),
+        "retention": (lambda: run_retention(db), RETENTION_INTERVAL),
+    }
+    for name, (job, interval) in jobs.items():
+        if name not in _tasks or _tasks[name].done():
+            _tasks[name] = asyncio.create_task(run_periodic(name, job, interval))
+    return list(_tasks.values())
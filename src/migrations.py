@@ -0,0 +1,371 @@
+"""
+Versioned schema migrations for the PostgreSQL database.
+
+Each migration is a numbered list of steps (SQL strings or callables that
+take a cursor) applied in its own transaction. Applied versions are
+recorded in `schema_version`, so a normal start costs one query; the DDL
+only runs when there is something pending. An advisory lock keeps two
+instances starting at the same time from applying the same migration.
+
+To change the schema, append a new migration to MIGRATIONS. Never edit a
+migration that has already shipped.
+"""
+
+import logging
+from typing import Callable, List, NamedTuple, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock, shared by every instance of the bot
+MIGRATION_LOCK_KEY = 0x6D696772
+
+DEFAULT_PROMPT = """ملاحظة مرفقة مع الرسالة: كن ودودًا وحنونًا في تواصلك مع المستخدمين،
+وتحدث بأسلوب طبيعي يجعلهم يشعرون بالراحة والحب .
+جعل ردودك ممتعة، مرنة ومليئة بالحيوية، مع لمسة شخصية مميزة.
+لا تذكر اسمي إلا إذا طُلب منك ذلك.
+استخدم لغة طبيعية وواضحة، ولا تطيل الكلام بلا داعٍ.
+اسمك على تليجرام هو أبو راس، وتم ربطك عبر بوت تليجرام من قِبل وهيب الشرعبي من اليمن 🇾🇪.
+تذكر أن جنسيتك يمنية وأن ثقافتك جزء من شخصيتك.
+عند طلب تقديم معلومات، كن عاقلًا وواقعيًا، مع توضيح المفيد فقط.
+استخدم الإيموجيات بشكل متناسق لإضفاء المرح والتفاعل، مثل .
+
+━━━━━━━━━━━━━━
+رسالة المستخدم:
+{user_message}
+
+💬 أجب بأسلوب ودود، مرح، وواقعي. أضف لمسة شخصية تجعل المستخدم يريد التفاعل معك دائمًا!"""
+
+Step = Union[str, Callable]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: Sequence[Step]
+
+
+def _insert_default_prompt(cursor):
+    cursor.execute("""
+        INSERT INTO prompts (name, content, is_active)
+        VALUES ('default', %s, TRUE)
+        ON CONFLICT (name) DO NOTHING
+    """, (DEFAULT_PROMPT,))
+
+
+def _create_trigram_indexes(cursor):
+    """Add pg_trgm and the search indexes; optional, search falls back to LIKE without them.
+
+    The extension needs privileges (or a package) the server may not have,
+    so a failure is rolled back to a savepoint and logged instead of
+    stopping every later migration.
+    """
+    cursor.execute("SAVEPOINT trigram_search")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_groups_title_trgm
+            ON groups USING GIN (normalize_search(title) gin_trgm_ops)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_users_name_trgm
+            ON users USING GIN (normalize_search(COALESCE(first_name, '') || ' ' || COALESCE(username, '')) gin_trgm_ops)
+        """)
+        cursor.execute("RELEASE SAVEPOINT trigram_search")
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trigram_search")
+        logger.warning(f"pg_trgm is not available, search will use plain substring matching: {e}")
+
+
+# The baseline is the schema the bot created at startup before migrations
+# existed. Every statement is idempotent so it also applies cleanly to
+# databases that were created by the old startup code.
+_BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username VARCHAR(255),
+        first_name VARCHAR(255),
+        join_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        message_count INTEGER DEFAULT 0,
+        image_count INTEGER DEFAULT 0,
+        last_active TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        is_reachable BOOLEAN DEFAULT TRUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS banned_users (
+        user_id BIGINT PRIMARY KEY,
+        banned_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS premium_users (
+        user_id BIGINT PRIMARY KEY,
+        added_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS groups (
+        chat_id BIGINT PRIMARY KEY,
+        title VARCHAR(500),
+        join_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        message_count INTEGER DEFAULT 0,
+        members_count INTEGER,
+        last_active TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        custom_prompt TEXT,
+        auto_scan BOOLEAN DEFAULT FALSE,
+        is_reachable BOOLEAN DEFAULT TRUE
+    )
+    """,
+    # Columns added after the first release, for tables created before them
+    "ALTER TABLE groups ADD COLUMN IF NOT EXISTS custom_prompt TEXT",
+    "ALTER TABLE groups ADD COLUMN IF NOT EXISTS auto_scan BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE groups ADD COLUMN IF NOT EXISTS is_reachable BOOLEAN DEFAULT TRUE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_reachable BOOLEAN DEFAULT TRUE",
+    """
+    CREATE TABLE IF NOT EXISTS daily_image_counts (
+        user_id BIGINT,
+        date DATE,
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS statistics (
+        key VARCHAR(100) PRIMARY KEY,
+        value BIGINT DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    INSERT INTO statistics (key, value) VALUES ('total_messages', 0), ('total_images', 0)
+    ON CONFLICT (key) DO NOTHING
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS prompts (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) UNIQUE NOT NULL,
+        content TEXT NOT NULL,
+        is_active BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    _insert_default_prompt,
+    """
+    CREATE TABLE IF NOT EXISTS bot_settings (
+        key VARCHAR(100) PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS url_scan_cache (
+        url_key TEXT PRIMARY KEY,
+        verdict VARCHAR(20) NOT NULL,
+        results JSONB NOT NULL,
+        scanned_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        audience VARCHAR(20) NOT NULL,
+        segment JSONB,
+        payload JSONB NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'running',
+        created_by BIGINT,
+        admin_chat_id BIGINT,
+        progress_message_id BIGINT,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP WITH TIME ZONE
+    )
+    """,
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS segment JSONB",
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        job_id BIGINT REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+        chat_id BIGINT,
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (job_id, chat_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+    ON broadcast_recipients (job_id, chat_id) WHERE status = 'pending'
+    """,
+]
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline schema", _BASELINE),
+    Migration(2, "activity indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_users_last_active ON users (last_active)",
+        "CREATE INDEX IF NOT EXISTS idx_groups_last_active ON groups (last_active)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_image_counts_date ON daily_image_counts (date)",
+    ]),
+    Migration(3, "activity rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            hour TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+            messages BIGINT NOT NULL DEFAULT 0,
+            images BIGINT NOT NULL DEFAULT 0,
+            group_messages BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            date DATE PRIMARY KEY,
+            messages BIGINT NOT NULL DEFAULT 0,
+            images BIGINT NOT NULL DEFAULT 0,
+            group_messages BIGINT NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            active_groups INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # One row per chat per day; the insert that creates the row bumps the daily count
+        """
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            date DATE,
+            user_id BIGINT,
+            PRIMARY KEY (date, user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_active_groups (
+            date DATE,
+            chat_id BIGINT,
+            PRIMARY KEY (date, chat_id)
+        )
+        """,
+        # Image history is already in daily_image_counts; messages start counting now
+        """
+        INSERT INTO activity_daily (date, images)
+        SELECT date, SUM(count) FROM daily_image_counts GROUP BY date
+        ON CONFLICT (date) DO NOTHING
+        """,
+    ]),
+    # Keyset pagination for the admin browsers: one (sort column, id) index per sort order
+    Migration(4, "browser sort indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_users_last_active_id ON users (last_active, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_message_count_id ON users (message_count, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_join_date_id ON users (join_date, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_image_count_id ON users (image_count, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_groups_last_active_id ON groups (last_active, chat_id)",
+        "CREATE INDEX IF NOT EXISTS idx_groups_message_count_id ON groups (message_count, chat_id)",
+        "CREATE INDEX IF NOT EXISTS idx_groups_join_date_id ON groups (join_date, chat_id)",
+        # Covered by the composite indexes above
+        "DROP INDEX IF EXISTS idx_users_last_active",
+        "DROP INDEX IF EXISTS idx_groups_last_active",
+    ]),
+    Migration(5, "trigram search", [
+        # Lowercase, drop Arabic diacritics and tatweel, and fold letter variants
+        # (alef forms, alef maqsura, taa marbuta, hamza seats) so spellings match
+        """
+        CREATE OR REPLACE FUNCTION normalize_search(value TEXT) RETURNS TEXT AS $$
+            SELECT translate(
+                regexp_replace(lower(COALESCE(value, '')), '[\u064B-\u065F\u0670\u0640]', '', 'g'),
+                'أإآٱىةؤئ@',
+                'اااايهوي'
+            )
+        $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        """,
+        _create_trigram_indexes,
+    ]),
+    # Writers add to one of several slot rows per counter instead of all
+    # locking the single statistics row; compaction folds the slots back in
+    Migration(6, "sharded counters", [
+        """
+        CREATE TABLE IF NOT EXISTS statistics_shards (
+            key VARCHAR(100),
+            slot SMALLINT,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (key, slot)
+        )
+        """,
+    ]),
+    Migration(7, "retention indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_url_scan_cache_expires_at ON url_scan_cache (expires_at)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_finished_at
+        ON broadcast_jobs (finished_at) WHERE status IN ('completed', 'cancelled')
+        """,
+    ]),
+    # Like the counters, each day/hour is spread over slot rows that writers
+    # pick at random, so concurrent messages don't queue on one row lock;
+    # readers sum the slots
+    Migration(8, "sharded activity rollups", [
+        "ALTER TABLE activity_daily ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0",
+        "ALTER TABLE activity_daily DROP CONSTRAINT IF EXISTS activity_daily_pkey",
+        "ALTER TABLE activity_daily ADD PRIMARY KEY (date, slot)",
+        "ALTER TABLE activity_hourly ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0",
+        "ALTER TABLE activity_hourly DROP CONSTRAINT IF EXISTS activity_hourly_pkey",
+        "ALTER TABLE activity_hourly ADD PRIMARY KEY (hour, slot)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _current_version(cursor) -> int:
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def run_migrations(conn, migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    """Apply every pending migration on `conn`; returns the number applied.
+
+    A failing migration is rolled back and re-raised, leaving the earlier
+    ones applied, so the next start resumes from it.
+    """
+    cursor = conn.cursor()
+    try:
+        version = _current_version(cursor)
+        conn.commit()
+        pending = [m for m in migrations if m.version > version]
+        if not pending:
+            return 0
+
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+            # Another instance may have applied some while we waited for the lock
+            version = _current_version(cursor)
+            applied = 0
+            for migration in migrations:
+                if migration.version <= version:
+                    continue
+                try:
+                    for step in migration.steps:
+                        if callable(step):
+                            step(cursor)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.error(f"Migration {migration.version} ({migration.description}) failed")
+                    raise
+                applied += 1
+                logger.info(f"Applied migration {migration.version}: {migration.description}")
+            return applied
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    finally:
+        cursor.close()
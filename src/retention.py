@@ -0,0 +1,173 @@
+"""
+Retention: prune rows that grow forever, a bounded chunk at a time.
+
+Every policy deletes in batches of `batch_size` rows, one short transaction
+per batch with a pause in between, so row locks and WAL bursts stay small
+and the bot keeps serving while a large backlog drains. A run holds a
+session-level advisory lock on its own connection, outside the pool, so
+only one run (per process or instance) deletes at a time.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_try_advisory_lock, shared by every instance of the bot
+RETENTION_LOCK_KEY = 0x72657465
+
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.2"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", str(6 * 3600)))
+
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    label: str
+    table: str
+    # Condition on the rows to delete; may use %(days)s
+    where: str
+    days: int
+
+
+DEFAULT_POLICIES: List[RetentionPolicy] = [
+    RetentionPolicy(
+        "daily_image_counts", "عدادات الصور اليومية", "daily_image_counts",
+        "date < CURRENT_DATE - %(days)s",
+        int(os.getenv("RETENTION_IMAGE_COUNT_DAYS", "30")),
+    ),
+    RetentionPolicy(
+        "daily_active_users", "سجل المستخدمين النشطين", "daily_active_users",
+        "date < CURRENT_DATE - %(days)s",
+        int(os.getenv("RETENTION_ACTIVE_CHATS_DAYS", "90")),
+    ),
+    RetentionPolicy(
+        "daily_active_groups", "سجل المجموعات النشطة", "daily_active_groups",
+        "date < CURRENT_DATE - %(days)s",
+        int(os.getenv("RETENTION_ACTIVE_CHATS_DAYS", "90")),
+    ),
+    RetentionPolicy(
+        "activity_hourly", "الإحصائيات بالساعة", "activity_hourly",
+        "hour < NOW() - %(days)s * INTERVAL '1 day'",
+        int(os.getenv("RETENTION_HOURLY_DAYS", "30")),
+    ),
+    RetentionPolicy(
+        "url_scan_cache", "نتائج فحص الروابط المنتهية", "url_scan_cache",
+        "expires_at < NOW()",
+        0,
+    ),
+    # Recipients first, so deleting the jobs afterwards cascades over nothing
+    RetentionPolicy(
+        "broadcast_recipients", "مستلمو الإذاعات المنتهية", "broadcast_recipients",
+        """job_id IN (
+            SELECT id FROM broadcast_jobs
+            WHERE status IN ('completed', 'cancelled') AND finished_at < NOW() - %(days)s * INTERVAL '1 day'
+        )""",
+        int(os.getenv("RETENTION_BROADCAST_DAYS", "30")),
+    ),
+    RetentionPolicy(
+        "broadcast_jobs", "الإذاعات المنتهية", "broadcast_jobs",
+        "status IN ('completed', 'cancelled') AND finished_at < NOW() - %(days)s * INTERVAL '1 day'",
+        int(os.getenv("RETENTION_BROADCAST_DAYS", "30")),
+    ),
+]
+
+# Report of the last run, shown in the admin panel
+last_report: Optional[dict] = None
+
+
+def delete_in_batches(conn, table: str, where: str, params: dict,
+                      batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_BATCH_PAUSE,
+                      returning: Optional[str] = None) -> tuple:
+    """Delete the rows of `table` matching `where`, `batch_size` rows per transaction.
+
+    Each batch picks its rows by ctid, so the delete itself is a TID scan
+    whatever the table's keys are. Returns (deleted, batches, returned
+    rows) where the rows are the `returning` columns of every deleted row.
+    """
+    query = f"""
+        DELETE FROM {table}
+        WHERE ctid = ANY(ARRAY(SELECT ctid FROM {table} WHERE {where} LIMIT %(batch_size)s))
+    """
+    if returning:
+        query += f" RETURNING {returning}"
+    deleted = 0
+    batches = 0
+    returned = []
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(query, dict(params, batch_size=batch_size))
+            count = cursor.rowcount
+            if returning:
+                returned.extend(cursor.fetchall())
+            conn.commit()
+            if count <= 0:
+                break
+            deleted += count
+            batches += 1
+            if count < batch_size:
+                break
+            time.sleep(pause)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return deleted, batches, returned
+
+
+def run_retention(db, policies: List[RetentionPolicy] = DEFAULT_POLICIES,
+                  batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_BATCH_PAUSE) -> Optional[dict]:
+    """Apply every policy; returns the run report, or None if another instance holds the lock.
+
+    A failing policy is logged and reported, and the others still run.
+    """
+    global last_report
+    try:
+        with db.advisory_lock(RETENTION_LOCK_KEY) as conn:
+            if conn is None:
+                logger.info("Retention is already running on another instance (or the database is down); skipping.")
+                return None
+
+            report = {"started_at": time.time(), "policies": []}
+            started = time.monotonic()
+            for policy in policies:
+                entry: Dict = {"name": policy.name, "label": policy.label, "deleted": 0, "batches": 0, "error": None}
+                policy_started = time.monotonic()
+                try:
+                    entry["deleted"], entry["batches"], _ = delete_in_batches(
+                        conn, policy.table, policy.where, {"days": policy.days}, batch_size, pause
+                    )
+                except Exception as e:
+                    logger.error(f"Retention policy {policy.name} failed: {e}", exc_info=True)
+                    entry["error"] = str(e)
+                entry["seconds"] = time.monotonic() - policy_started
+                report["policies"].append(entry)
+    except Exception as e:
+        logger.error(f"Retention run failed: {e}", exc_info=True)
+        return None
+
+    report["seconds"] = time.monotonic() - started
+    report["deleted"] = sum(entry["deleted"] for entry in report["policies"])
+    logger.info(f"Retention removed {report['deleted']} rows in {report['seconds']:.1f}s")
+    last_report = report
+    return report
+
+
+def format_report(report: Optional[dict]) -> str:
+    """Render a run report for the admin panel."""
+    if not report:
+        return "🧹 لم يتم تشغيل التنظيف بعد."
+    lines = [
+        "🧹 تقرير تنظيف البيانات\n",
+        f"🗑 المحذوف: {report['deleted']} صف خلال {report['seconds']:.1f} ثانية\n",
+    ]
+    for entry in report["policies"]:
+        if entry["error"]:
+            lines.append(f"- {entry['label']}: ❌ فشل")
+        else:
+            lines.append(f"- {entry['label']}: {entry['deleted']} صف ({entry['batches']} دفعة)")
+    return "\n".join(lines)
@@ -0,0 +1,268 @@
+"""
+Storage interface shared by the database backends.
+
+`Database` (PostgreSQL) is the production backend. `MemoryDatabase` and
+`SqliteDatabase` implement the same interface with the same semantics
+(upserts, daily counts, counters, prompts) so handlers and benchmarks can
+run without a Postgres server, including the admin browsers and search
+(substring matches only; fuzzy trigram matches need Postgres). Features
+that rely on Postgres itself (broadcast jobs, COPY exports, retention)
+are only available on `Database`.
+
+`create_database(url)` picks the backend from the URL scheme:
+    postgresql://...        -> Database
+    sqlite:///path/to/db    -> SqliteDatabase (sqlite:// for an in-memory one)
+    memory://               -> MemoryDatabase
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import re
+
+from .migrations import DEFAULT_PROMPT
+
+# Sort orders of the admin browsers: key -> column, each backed by a (column, id) index
+BROWSE_TABLES = {
+    "users": ("users", "user_id", "user_id, username, first_name, join_date, message_count, image_count, last_active"),
+    "groups": ("groups", "chat_id", "chat_id, title, join_date, message_count, members_count, last_active"),
+}
+BROWSE_SORTS = {
+    "users": {"r": "last_active", "m": "message_count", "j": "join_date", "i": "image_count"},
+    "groups": {"r": "last_active", "m": "message_count", "j": "join_date"},
+}
+
+_SEARCH_DIACRITICS = re.compile("[\u064B-\u065F\u0670\u0640]")
+_SEARCH_FOLDS = str.maketrans("أإآٱىةؤئ", "اااايهوي", "@")
+
+
+def normalize_search(value: Optional[str]) -> str:
+    """Python twin of the normalize_search() SQL function from migration 5."""
+    return _SEARCH_DIACRITICS.sub("", (value or "").lower()).translate(_SEARCH_FOLDS)
+
+
+class Storage(ABC):
+    """Operations the bot's handlers rely on, whatever the backend."""
+
+    def _get_current_utc_iso(self) -> str:
+        """Get current UTC time in ISO format."""
+        return datetime.now(timezone.utc).isoformat()
+
+    def _get_current_date_str(self) -> str:
+        """Get current date string."""
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _get_default_prompt_text(self) -> str:
+        """Get default prompt text."""
+        return DEFAULT_PROMPT
+
+    # ==================== User Methods ====================
+
+    @abstractmethod
+    def is_user_exist(self, user_id: int) -> bool:
+        """Check if user exists in database."""
+
+    @abstractmethod
+    def add_user(self, user_id: int, username: str, first_name: str):
+        """Add a user, or refresh the name and last_active of an existing one."""
+
+    @abstractmethod
+    def update_user_activity(self, user_id: int, message_type: str = "text"):
+        """Count a message or image for the user, the global counters and today's rollup."""
+
+    @abstractmethod
+    def get_user_stats(self, user_id: int) -> Optional[dict]:
+        """Get user statistics."""
+
+    def get_user_info(self, user_id: int) -> Optional[dict]:
+        """Get user info (alias for get_user_stats)."""
+        return self.get_user_stats(user_id)
+
+    @abstractmethod
+    def get_total_users(self) -> int:
+        """Get total number of users."""
+
+    @abstractmethod
+    def get_daily_image_count_for_user(self, user_id: int) -> int:
+        """Get daily image count for a user."""
+
+    @abstractmethod
+    def ban_user(self, user_id: int):
+        """Ban a user."""
+
+    @abstractmethod
+    def unban_user(self, user_id: int):
+        """Unban a user."""
+
+    @abstractmethod
+    def is_user_banned(self, user_id: int) -> bool:
+        """Check if user is banned."""
+
+    @abstractmethod
+    def get_banned_users_ids(self) -> List[str]:
+        """Get list of banned user IDs."""
+
+    @abstractmethod
+    def is_user_premium(self, user_id: int) -> bool:
+        """Check if user is premium."""
+
+    @abstractmethod
+    def add_premium_user(self, user_id: int) -> bool:
+        """Add a premium user."""
+
+    @abstractmethod
+    def remove_premium_user(self, user_id: int) -> bool:
+        """Remove a premium user."""
+
+    @abstractmethod
+    def get_premium_users_ids(self) -> List[str]:
+        """Get list of premium user IDs."""
+
+    @abstractmethod
+    def get_browse_page(self, kind: str, sort: str, cursor: Optional[tuple] = None,
+                        backwards: bool = False, limit: int = 10) -> tuple:
+        """Get one page of users or groups after `cursor`; returns (rows, has_more)."""
+
+    @abstractmethod
+    def search_users(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search users by first name, username or user_id."""
+
+    @abstractmethod
+    def set_chats_reachable(self, chat_ids: List[int], reachable: bool) -> int:
+        """Mark users/groups as (un)reachable, e.g. after the bot was blocked or kicked."""
+
+    @abstractmethod
+    def count_broadcast_audience(self, audience: str, segment: Optional[dict] = None) -> int:
+        """Number of chats a broadcast to this audience/segment would reach."""
+
+    # ==================== Group Methods ====================
+
+    @abstractmethod
+    def add_group(self, chat_id: int, title: str, members_count: Optional[int] = None):
+        """Add or update a group."""
+
+    @abstractmethod
+    def update_group_activity(self, chat_id: int) -> bool:
+        """Update group activity. Returns True if group exists and was updated."""
+
+    @abstractmethod
+    def update_group_info(self, chat_id: str, info: Dict[str, Any]):
+        """Update the title and/or members_count of a group."""
+
+    @abstractmethod
+    def remove_group(self, chat_id: str):
+        """Remove a group."""
+
+    @abstractmethod
+    def get_total_groups(self) -> int:
+        """Get total number of groups."""
+
+    @abstractmethod
+    def get_group_counts(self) -> Dict[str, int]:
+        """Number of groups, and of groups that have sent at least one message."""
+
+    @abstractmethod
+    def get_recent_groups(self, limit: int = 5) -> List[dict]:
+        """Get the most recently active groups."""
+
+    @abstractmethod
+    def search_groups(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search groups by title or chat_id."""
+
+    @abstractmethod
+    def cleanup_inactive_groups(self, inactivity_days_threshold: int = 30) -> tuple:
+        """Delete inactive groups; returns (count, [{'chat_id', 'title'}, ...])."""
+
+    @abstractmethod
+    def set_group_prompt(self, chat_id: int, prompt: str):
+        """Set a custom prompt for a group."""
+
+    @abstractmethod
+    def reset_group_prompt(self, chat_id: int):
+        """Reset group prompt to default."""
+
+    @abstractmethod
+    def get_group_prompt(self, chat_id: int) -> Optional[str]:
+        """Get custom prompt for a group."""
+
+    @abstractmethod
+    def set_group_auto_scan(self, chat_id: int, enabled: bool):
+        """Enable or disable automatic link scanning for a group."""
+
+    @abstractmethod
+    def get_group_auto_scan(self, chat_id: int) -> bool:
+        """Whether automatic link scanning is enabled for a group."""
+
+    # ==================== Statistics Methods ====================
+
+    @abstractmethod
+    def get_counter_values(self, keys: List[str]) -> Dict[str, int]:
+        """Current value of each counter, 0 for unknown keys."""
+
+    def get_total_stats(self) -> dict:
+        """Get total statistics."""
+        stats = self.get_counter_values(['total_messages', 'total_images'])
+        stats['total_users'] = self.get_total_users()
+        return stats
+
+    @abstractmethod
+    def get_daily_activity_stats(self, date_str: Optional[str] = None) -> dict:
+        """Get the activity rollup of one day (today by default)."""
+
+    @abstractmethod
+    def get_activity_history(self, days: int = 7) -> List[dict]:
+        """Get the daily rollups for the last `days` days, newest first."""
+
+    # ==================== Prompt Methods ====================
+
+    @abstractmethod
+    def get_active_prompt(self) -> str:
+        """Get the active prompt, or the default text if none is active."""
+
+    @abstractmethod
+    def get_prompt_content(self, prompt_name: str = 'default') -> str:
+        """Get content of a system prompt by name."""
+
+    @abstractmethod
+    def update_prompt(self, name: str, content: str) -> bool:
+        """Create or replace a prompt and make it the only active one."""
+
+    @abstractmethod
+    def reset_to_default_prompt(self) -> bool:
+        """Make the 'default' prompt the only active one."""
+
+    # ==================== Link Scan Cache Methods ====================
+
+    @abstractmethod
+    def get_url_scan(self, url_key: str) -> Optional[dict]:
+        """Get a cached scan result that has not expired yet."""
+
+    @abstractmethod
+    def save_url_scan(self, url_key: str, verdict: str, results: list, ttl_seconds: int):
+        """Store a scan result for ttl_seconds."""
+
+    # ==================== Utility Methods ====================
+
+    def can_user_send_image(self, user_id: int, premium_image_limit: int = 999,
+                            free_user_image_limit: int = 7) -> bool:
+        """Check if user can send image based on daily limit."""
+        if self.is_user_premium(user_id):
+            return self.get_daily_image_count_for_user(user_id) < premium_image_limit
+        else:
+            return self.get_daily_image_count_for_user(user_id) < free_user_image_limit
+
+    @abstractmethod
+    def close(self):
+        """Release the backend's connections."""
+
+
+def create_database(url: Optional[str] = None) -> Storage:
+    """Open the backend named by `url`; anything that is not sqlite or memory goes to PostgreSQL."""
+    if url and url.startswith("memory:"):
+        from .database_memory import MemoryDatabase
+        return MemoryDatabase()
+    if url and url.startswith("sqlite:"):
+        from .database_sqlite import SqliteDatabase
+        return SqliteDatabase(url[len("sqlite:///"):] or ":memory:")
+    from .database_postgres import Database
+    return Database(url)
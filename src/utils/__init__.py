@@ -1,12 +1,17 @@
 """Utilities package for the bot."""
 
-from .formatting import format_message, add_signature
-from .search import search_exa
+from .formatting import format_message, add_signature, split_html_message
+from .delivery import reply_html_chunks
+from .search import search_exa, search_more_callback, init_search_client
 from .link_scanner import scan_link
 
 __all__ = [
     "format_message",
     "add_signature",
+    "split_html_message",
+    "reply_html_chunks",
     "search_exa",
+    "search_more_callback",
+    "init_search_client",
     "scan_link",
 ]
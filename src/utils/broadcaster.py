@@ -0,0 +1,352 @@
+"""
+Rate-aware broadcast engine shared by the user and group broadcasts
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from telegram import InlineKeyboardMarkup, Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter, TelegramError, NetworkError
+
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second across all chats; stay a bit under it
+GLOBAL_SEND_RATE = 25
+global_send_bucket = TokenBucket(rate=GLOBAL_SEND_RATE, capacity=GLOBAL_SEND_RATE)
+
+BROADCAST_CONCURRENCY = 20
+MAX_SEND_ATTEMPTS = 3
+# Seconds to wait before claiming again after the database failed to hand out a batch
+CLAIM_RETRY_DELAY = 5
+
+SENT = "sent"
+BLOCKED = "blocked"  # the chat can no longer be reached: bot blocked, kicked, or chat gone
+FAILED = "failed"
+
+# BadRequest messages that mean the chat is gone rather than the message being wrong
+_UNREACHABLE_ERRORS = ("chat not found", "user is deactivated", "group chat was deactivated")
+
+# Message kinds sent by file_id with an optional caption
+_MEDIA_METHODS = {
+    "photo": "send_photo",
+    "video": "send_video",
+    "document": "send_document",
+    "voice": "send_voice",
+    "audio": "send_audio",
+}
+
+
+class BroadcastPayload:
+    """A message rendered once and sent to every recipient.
+
+    Buttons are parsed and the text cleaned when the payload is built, not
+    per recipient. `to_dict()`/`from_dict()` give a JSON-serializable form.
+    """
+
+    def __init__(self, kind: str, text: str = "", file_id: Optional[str] = None,
+                 reply_markup: Optional[InlineKeyboardMarkup] = None, parse_mode: Optional[str] = ParseMode.MARKDOWN,
+                 pin: bool = False, silent: bool = False, source: Optional[tuple] = None):
+        self.kind = kind
+        self.text = text
+        self.file_id = file_id
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.pin = pin
+        self.silent = silent
+        # (from_chat_id, message_id) for kinds that are copied as-is
+        self.source = source
+
+    @classmethod
+    def from_message(cls, message: Message, extract_buttons, pin: bool = False, silent: bool = False):
+        """Build a payload from the admin's message; `extract_buttons` splits off 'text | url' lines."""
+        reply_markup, clean_text = extract_buttons(message.caption or message.text or "")
+        common = dict(text=clean_text, reply_markup=reply_markup, pin=pin, silent=silent)
+        if message.text:
+            return cls("text", **common)
+        for kind in _MEDIA_METHODS:
+            media = getattr(message, kind)
+            if media:
+                file_id = media[-1].file_id if kind == "photo" else media.file_id
+                return cls(kind, file_id=file_id, **common)
+        if message.sticker:
+            return cls("sticker", file_id=message.sticker.file_id, **common)
+        return cls("copy", source=(message.chat_id, message.message_id),
+                   **dict(common, text=clean_text if message.caption is not None else None))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "text": self.text,
+            "file_id": self.file_id,
+            "reply_markup": self.reply_markup.to_dict() if self.reply_markup else None,
+            "parse_mode": self.parse_mode,
+            "pin": self.pin,
+            "silent": self.silent,
+            "source": list(self.source) if self.source else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        markup = data.get("reply_markup")
+        source = data.get("source")
+        return cls(
+            data["kind"],
+            text=data.get("text"),
+            file_id=data.get("file_id"),
+            reply_markup=InlineKeyboardMarkup.de_json(markup, None) if markup else None,
+            parse_mode=data.get("parse_mode"),
+            pin=data.get("pin", False),
+            silent=data.get("silent", False),
+            source=tuple(source) if source else None,
+        )
+
+    async def send(self, bot, chat_id: int) -> Message:
+        common = dict(chat_id=chat_id, disable_notification=self.silent, reply_markup=self.reply_markup)
+        if self.kind == "text":
+            return await bot.send_message(text=self.text, parse_mode=self.parse_mode,
+                                          disable_web_page_preview=True, **common)
+        if self.kind in _MEDIA_METHODS:
+            method = getattr(bot, _MEDIA_METHODS[self.kind])
+            return await method(**{self.kind: self.file_id}, caption=self.text, parse_mode=self.parse_mode,
+                                **common)
+        if self.kind == "sticker":
+            return await bot.send_sticker(sticker=self.file_id, **common)
+        from_chat_id, message_id = self.source
+        return await bot.copy_message(from_chat_id=from_chat_id, message_id=message_id,
+                                      caption=self.text, **common)
+
+
+class BroadcastStats:
+    """Live counters for one broadcast run."""
+
+    def __init__(self, total: Optional[int] = None):
+        self.total = total
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Messages handled per second so far."""
+        elapsed = time.monotonic() - self.started_at
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        if self.total is None or not self.rate:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+
+
+async def deliver(bot, payload: BroadcastPayload, chat_id: int, bucket: TokenBucket = global_send_bucket,
+                  on_migrated: Optional[Callable[[int, int], None]] = None) -> str:
+    """Send `payload` to one chat under the shared rate limit; returns SENT, BLOCKED or FAILED.
+
+    A RetryAfter pauses the whole bucket, since Telegram's flood limit is per bot.
+    A group that was upgraded to a supergroup is retried under its new id,
+    and `on_migrated(old_chat_id, new_chat_id)` is called so it can be stored.
+    """
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        await bucket.acquire()
+        try:
+            sent = await payload.send(bot, chat_id)
+            if payload.pin and sent:
+                await bucket.acquire()
+                try:
+                    await sent.pin(disable_notification=payload.silent)
+                except TelegramError as e:
+                    logger.debug(f"Could not pin broadcast in {chat_id}: {e}")
+            return SENT
+        except RetryAfter as e:
+            logger.warning(f"Flood control hit, pausing broadcast for {e.retry_after}s")
+            bucket.pause(e.retry_after)
+        except ChatMigrated as e:
+            logger.info(f"Chat {chat_id} migrated to {e.new_chat_id}")
+            if on_migrated:
+                on_migrated(chat_id, e.new_chat_id)
+            chat_id = e.new_chat_id
+        except Forbidden:
+            return BLOCKED
+        except BadRequest as e:
+            if any(reason in str(e).lower() for reason in _UNREACHABLE_ERRORS):
+                return BLOCKED
+            logger.warning(f"Broadcast failed for {chat_id}: {e}")
+            return FAILED
+        except NetworkError as e:
+            if attempt == MAX_SEND_ATTEMPTS:
+                logger.warning(f"Broadcast failed for {chat_id}: {e}")
+                return FAILED
+        except TelegramError as e:
+            logger.warning(f"Broadcast failed for {chat_id}: {e}")
+            return FAILED
+        except Exception as e:
+            # Anything else is a bug for this recipient, not a reason to abort the broadcast
+            logger.error(f"Broadcast failed for {chat_id}: {e}", exc_info=True)
+            return FAILED
+    return FAILED
+
+
+async def run_broadcast(
+    bot,
+    payload: BroadcastPayload,
+    chat_ids: Iterable[int],
+    total: Optional[int] = None,
+    on_progress: Optional[Callable[[BroadcastStats], Awaitable[None]]] = None,
+    progress_interval: float = 3.0,
+    concurrency: int = BROADCAST_CONCURRENCY,
+    on_result: Optional[Callable[[int, str], None]] = None,
+    stats: Optional[BroadcastStats] = None,
+    on_migrated: Optional[Callable[[int, int], None]] = None,
+) -> BroadcastStats:
+    """Send `payload` to every chat in `chat_ids` with `concurrency` workers.
+
+    All broadcasts share `global_send_bucket`, so two broadcasts running at
+    once still stay under Telegram's global limit. `on_progress(stats)` is
+    awaited every `progress_interval` seconds while sending, and
+    `on_result(chat_id, outcome)` is called after each recipient. Pass
+    `stats` to keep counting into an existing BroadcastStats, and
+    `on_migrated` to record groups that moved to a new chat id.
+    """
+    stats = stats or BroadcastStats(total)
+    recipients = iter(chat_ids)
+
+    async def worker():
+        for chat_id in recipients:
+            outcome = await deliver(bot, payload, int(chat_id), on_migrated=on_migrated)
+            if on_result:
+                on_result(int(chat_id), outcome)
+            if outcome == SENT:
+                stats.sent += 1
+            elif outcome == BLOCKED:
+                stats.blocked += 1
+            else:
+                stats.failed += 1
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(progress_interval)
+            try:
+                await on_progress(stats)
+            except Exception as e:
+                logger.debug(f"Broadcast progress update failed: {e}")
+
+    progress_task = asyncio.create_task(reporter()) if on_progress else None
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        if progress_task:
+            progress_task.cancel()
+    return stats
+
+
+class BroadcastJobRunner:
+    """Runs broadcast jobs stored in the database, one task per job.
+
+    Recipients are claimed in batches (`claim_broadcast_batch`), sent with
+    `run_broadcast` and their outcomes written back, so a restart loses at
+    most the batch in flight. The job's status is re-read before every
+    batch: setting it to 'paused' or 'cancelled' stops the task after the
+    current batch. Progress shown to the admin is counted from the table.
+
+    `render_progress(job, counts, rate)` returns the (text, reply_markup)
+    for the admin's progress message.
+    """
+
+    def __init__(self, render_progress, batch_size: int = 100, progress_interval: float = 3.0):
+        self.render_progress = render_progress
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._resume_requested = set()
+
+    def is_running(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def start(self, bot, db, job_id: int) -> None:
+        if self.is_running(job_id):
+            # The task may be stopping after a pause; make it look at the status again
+            self._resume_requested.add(job_id)
+            return
+        self._tasks[job_id] = asyncio.create_task(self._run(bot, db, job_id))
+
+    async def resume_all(self, bot, db) -> None:
+        """Restart every job that was running when the bot stopped."""
+        for job in db.get_broadcast_jobs(["running"], limit=100):
+            requeued = db.requeue_stalled_broadcast_recipients(job["id"])
+            logger.info(f"Resuming broadcast job {job['id']} ({requeued} recipients requeued)")
+            self.start(bot, db, job["id"])
+
+    async def report(self, bot, db, job_id: int, rate: Optional[float] = None) -> None:
+        job = db.get_broadcast_job(job_id)
+        if not job or not job.get("progress_message_id"):
+            return
+        text, reply_markup = self.render_progress(job, db.get_broadcast_progress(job_id), rate)
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=job["admin_chat_id"],
+                message_id=job["progress_message_id"],
+                reply_markup=reply_markup
+            )
+        except TelegramError as e:
+            logger.debug(f"Broadcast progress update failed: {e}")
+
+    async def _run(self, bot, db, job_id: int) -> None:
+        while True:
+            stats = BroadcastStats()
+            try:
+                await self._run_batches(bot, db, job_id, stats)
+            except Exception as e:
+                logger.error(f"Broadcast job {job_id} failed: {e}", exc_info=True)
+            await self.report(bot, db, job_id, stats.rate)
+            if job_id not in self._resume_requested:
+                return
+            self._resume_requested.discard(job_id)
+
+    async def _run_batches(self, bot, db, job_id: int, stats: BroadcastStats) -> None:
+        job = db.get_broadcast_job(job_id)
+        if not job:
+            return
+        payload = BroadcastPayload.from_dict(job["payload"])
+        last_report = time.monotonic()
+        while True:
+            job = db.get_broadcast_job(job_id)
+            if not job or job["status"] != "running":
+                return
+            chat_ids = db.claim_broadcast_batch(job_id, self.batch_size)
+            if chat_ids is None:
+                # The claim failed; the recipients are still pending, so try again later
+                await asyncio.sleep(CLAIM_RETRY_DELAY)
+                continue
+            if not chat_ids:
+                db.update_broadcast_job(job_id, status="completed")
+                return
+
+            outcomes = {SENT: [], BLOCKED: [], FAILED: []}
+            try:
+                await run_broadcast(bot, payload, chat_ids, stats=stats,
+                                    on_result=lambda chat_id, outcome: outcomes[outcome].append(chat_id),
+                                    on_migrated=db.migrate_group)
+            except BaseException:
+                # Keep what was delivered and hand the rest of the batch back instead of leaving it 'sending'
+                db.record_broadcast_results(job_id, outcomes)
+                db.requeue_stalled_broadcast_recipients(job_id)
+                raise
+            db.record_broadcast_results(job_id, outcomes)
+            # Later broadcasts skip these chats until they interact with the bot again
+            db.set_chats_reachable(outcomes[BLOCKED], False)
+
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                await self.report(bot, db, job_id, stats.rate)
@@ -0,0 +1,54 @@
+"""
+Delivery helpers for long HTML answers
+"""
+
+import re
+import html
+import logging
+from typing import List, Optional
+
+from telegram import Message
+from telegram.error import BadRequest
+
+from .formatting import split_html_message
+
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _html_to_plain(text: str) -> str:
+    return html.unescape(_TAG_RE.sub("", text))
+
+
+async def _send_chunk(send, chunk: str, reply_markup=None) -> Message:
+    """Send one chunk as HTML, falling back to plain text if Telegram rejects the markup."""
+    try:
+        return await send(chunk, parse_mode='HTML', reply_markup=reply_markup)
+    except BadRequest as e:
+        logger.warning(f"HTML chunk rejected ({e}), resending as plain text")
+        return await send(_html_to_plain(chunk), reply_markup=reply_markup)
+
+
+async def reply_html_chunks(
+    message: Message,
+    text: str,
+    reply_markup=None,
+    edit_message: Optional[Message] = None,
+) -> List[Message]:
+    """Reply to `message` with `text`, split into Telegram-sized HTML chunks.
+
+    Chunks are sent one after another so they arrive in order. When
+    `edit_message` is given (e.g. a "thinking..." placeholder) the first chunk
+    replaces its text. `reply_markup` is attached to the last chunk only.
+    Returns the sent messages in order.
+    """
+    chunks = split_html_message(text)
+    sent = []
+    for index, chunk in enumerate(chunks):
+        markup = reply_markup if index == len(chunks) - 1 else None
+        if index == 0 and edit_message is not None:
+            sent.append(await _send_chunk(edit_message.edit_text, chunk, markup))
+        else:
+            sent.append(await _send_chunk(message.reply_text, chunk, markup))
+    return sent
@@ -0,0 +1,120 @@
+"""
+Time-ordered reply history for group chats
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiringHistory:
+    """Per-chat insertion-ordered maps plus a global min-heap of chat deadlines.
+
+    Entries in a chat are appended in time order, so the oldest one is always
+    at the front of that chat's map. The heap holds at most one deadline per
+    chat (the expiry of its oldest entry), which makes expiry O(expired) and
+    keeps the heap no larger than the number of chats. A hard per-chat cap
+    drops the oldest entries of very busy chats early.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_per_chat: int = 300,
+                 clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.max_per_chat = max_per_chat
+        self._clock = clock
+        # chat_id -> OrderedDict[message_id, (expires_at, entry)]
+        self._chats: Dict[int, "OrderedDict[int, Tuple[float, Any]]"] = {}
+        # (deadline, chat_id); one live item per chat, tracked in _scheduled
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}
+        self.expired = 0
+        self.capped = 0
+
+    def __len__(self) -> int:
+        return sum(len(chat) for chat in self._chats.values())
+
+    def _schedule(self, chat_id: int, deadline: float) -> None:
+        if chat_id not in self._scheduled:
+            self._scheduled[chat_id] = deadline
+            heapq.heappush(self._heap, (deadline, chat_id))
+
+    def add(self, chat_id: int, message_id: int, entry: Any) -> None:
+        """Remember `entry` for `message_id` until the TTL runs out."""
+        expires_at = self._clock() + self.ttl
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = OrderedDict()
+        chat[message_id] = (expires_at, entry)
+        chat.move_to_end(message_id)
+        while len(chat) > self.max_per_chat:
+            chat.popitem(last=False)
+            self.capped += 1
+        self._schedule(chat_id, next(iter(chat.values()))[0])
+
+    def get(self, chat_id: int, message_id: int) -> Optional[Any]:
+        chat = self._chats.get(chat_id)
+        if not chat:
+            return None
+        item = chat.get(message_id)
+        if item is None or item[0] <= self._clock():
+            return None
+        return item[1]
+
+    def clear_chat(self, chat_id: int) -> None:
+        # A leftover heap item for this chat is dropped when it comes due.
+        self._chats.pop(chat_id, None)
+
+    def expire(self) -> int:
+        """Drop every entry whose TTL has passed. Returns how many were removed."""
+        now = self._clock()
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id = heapq.heappop(self._heap)
+            self._scheduled.pop(chat_id, None)
+            chat = self._chats.get(chat_id)
+            if not chat:
+                self._chats.pop(chat_id, None)
+                continue
+            while chat:
+                message_id, (expires_at, _) = next(iter(chat.items()))
+                if expires_at > now:
+                    break
+                del chat[message_id]
+                removed += 1
+            if chat:
+                self._schedule(chat_id, next(iter(chat.values()))[0])
+            else:
+                del self._chats[chat_id]
+        self.expired += removed
+        return removed
+
+    def next_deadline(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    async def run_expiry(self, max_sleep: float = 300.0) -> None:
+        """Expire entries continuously, waking up when the next one is due."""
+        while True:
+            try:
+                removed = self.expire()
+                if removed:
+                    logger.debug(f"Expired {removed} group reply entries")
+            except Exception as e:
+                logger.error(f"Error expiring group reply history: {e}", exc_info=True)
+
+            deadline = self.next_deadline()
+            delay = max_sleep if deadline is None else deadline - self._clock()
+            await asyncio.sleep(min(max(delay, 1.0), max_sleep))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chats": len(self._chats),
+            "entries": len(self),
+            "heap": len(self._heap),
+            "expired": self.expired,
+            "capped": self.capped,
+        }
@@ -4,59 +4,238 @@ Formatting utilities for the Telegram bot
 
 import re
 import html
+from typing import List, Tuple
+
+# One scanner for every construct; list bullets come first so "* item" is not read as italic.
+_TOKEN_RE = re.compile(r"^[ \t]*[*-][ \t]|```|`|\*\*|__|\*|_", re.MULTILINE)
+_LANG_RE = re.compile(r"\w*")
+_DUNDER_RE = re.compile(r"__\w+?__(?!\w)")
+_TAGS = {"**": "b", "__": "b", "*": "i", "_": "i"}
+
+
+def _escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
 
 def format_message(text: str) -> str:
-  
-    code_blocks = []
-    def _sub_code_block(match):
-        code = html.escape(match.group(2))
-        lang = match.group(1)
-        if lang:
-            tag = f'<pre><code class="language-{lang}">{code}</code></pre>'
-        else:
-            tag = f'<pre><code>{code}</code></pre>'
-        code_blocks.append(tag)
-        return f"__CODE_BLOCK_{len(code_blocks)-1}__"
-
-    # Handle ```code``` blocks
-    text = re.sub(r'```(\w*)\n(.*?)\n```', _sub_code_block, text, flags=re.DOTALL)
-
-    def _sub_inline_code(match):
-        code = html.escape(match.group(1))
-        tag = f'<code>{code}</code>'
-        code_blocks.append(tag)
-        return f"__CODE_BLOCK_{len(code_blocks)-1}__"
-
-    # Handle `code`
-    text = re.sub(r'`([^`]+)`', _sub_inline_code, text)
-
-    # Now do other formatting on the rest of the text
-    
-    # Escape HTML to prevent special characters from breaking the layout or being hidden
-    text = html.escape(text)
-
-    # Bold
-    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text, flags=re.DOTALL)
-    text = re.sub(r'__(.*?)__', r'<b>\1</b>', text, flags=re.DOTALL)
-    # Italic
-    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text, flags=re.DOTALL)
-    text = re.sub(r'_(.*?)_', r'<i>\1</i>', text, flags=re.DOTALL)
-
-    # Handle lists
-    lines = text.split('\n')
-    for i, line in enumerate(lines):
-        stripped_line = line.strip()
-        if stripped_line.startswith(('* ', '- ')):
-            lines[i] = '• ' + stripped_line[2:]
+    """Render model Markdown as Telegram HTML in a single left-to-right pass.
+
+    Supports fenced and inline code, bold (`**`/`__`), italic (`*`/`_`) and
+    `*`/`-` list bullets. Underscores inside words (`snake_case`) and dunder
+    names (`__init__`) are left alone, and emphasis that is never closed is
+    written back as plain text, so the output always has balanced tags.
+    """
+    out: List[str] = []
+    # Open emphasis markers: (delimiter, index of its placeholder in `out`)
+    stack: List[Tuple[str, int]] = []
+
+    def revert(from_depth: int) -> None:
+        for delim, index in stack[from_depth:]:
+            out[index] = delim
+        del stack[from_depth:]
+
+    pos = 0
+    length = len(text)
+    while True:
+        match = _TOKEN_RE.search(text, pos)
+        if match is None:
+            out.append(_escape(text[pos:]))
+            break
+        start, end = match.span()
+        out.append(_escape(text[pos:start]))
+        token = match.group()
+        pos = end
+
+        if token.endswith((" ", "\t")):
+            out.append("• ")
+            continue
+
+        if token == "```":
+            lang = _LANG_RE.match(text, end).group()
+            body_start = end + len(lang)
+            if body_start < length and text[body_start] == "\n":
+                close = text.find("\n```", body_start)
+                code = text[body_start + 1:] if close == -1 else text[body_start + 1:close]
+                pos = length if close == -1 else close + 4
+            else:
+                lang = ""
+                close = text.find("```", end)
+                if close == -1:
+                    out.append(token)
+                    continue
+                code = text[end:close]
+                pos = close + 3
+            # Emphasis cannot wrap a code block; anything still open stays literal.
+            revert(0)
+            if lang:
+                out.append(f'<pre><code class="language-{lang}">{_escape(code)}</code></pre>')
+            else:
+                out.append(f'<pre><code>{_escape(code)}</code></pre>')
+            continue
+
+        if token == "`":
+            close = text.find("`", end)
+            if close <= end:
+                out.append(token)
+                continue
+            out.append(f"<code>{_escape(text[end:close])}</code>")
+            pos = close + 1
+            continue
+
+        if token == "__":
+            # Dunder identifiers and placeholders (`__init__`, `__TOKEN_0__`) stay literal
+            dunder = _DUNDER_RE.match(text, start)
+            if dunder and (start == 0 or not _is_word_char(text[start - 1])):
+                out.append(dunder.group())
+                pos = dunder.end()
+                continue
+
+        # Emphasis delimiters
+        prev_ch = text[start - 1] if start > 0 else " "
+        next_ch = text[end] if end < length else " "
+        can_close = not prev_ch.isspace()
+        can_open = not next_ch.isspace()
+        if token[0] == "_":
+            # Intraword underscores never start or end emphasis
+            can_open = can_open and not _is_word_char(prev_ch)
+            can_close = can_close and not _is_word_char(next_ch)
+
+        open_delims = [delim for delim, _ in stack]
+        if len(token) == 2 and stack and stack[-1][0] == token[0] and can_close:
+            # "***text***": close the inner single marker first
+            token = token[0]
+            pos = start + 1
+
+        if can_close and token in open_delims:
+            depth = len(open_delims) - 1 - open_delims[::-1].index(token)
+            revert(depth + 1)
+            stack.pop()
+            out.append(f"</{_TAGS[token]}>")
+        elif can_open:
+            stack.append((token, len(out)))
+            out.append(f"<{_TAGS[token]}>")
         else:
-            lines[i] = line # Keep original line if not a list item
-    text = '\n'.join(lines)
+            out.append(token)
+
+    revert(0)
+    return "".join(out).strip()
+
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_HTML_PART_RE = re.compile(r"(<[^>]+>)")
+_TEXT_ATOM_RE = re.compile(r"\n\n+|\n|[ \t]+|[^\s]+")
+_ENTITY_RE = re.compile(r"&#?\w+;|[^&]+|&")
+_TAG_NAME_RE = re.compile(r"</?([a-zA-Z0-9-]+)")
+_MAX_ATOM = 400
+
+# Break priority after an atom: paragraph > line > word; -1 means "do not break here"
+_BREAK_PARAGRAPH, _BREAK_LINE, _BREAK_WORD, _NO_BREAK = 2, 1, 0, -1
+
+
+def _html_atoms(text: str) -> List[Tuple[str, bool, int]]:
+    """Split HTML into (piece, is_tag, break_rank) atoms no longer than _MAX_ATOM."""
+    atoms = []
+    for part in _HTML_PART_RE.split(text):
+        if not part:
+            continue
+        if part.startswith("<") and part.endswith(">"):
+            atoms.append((part, True, _NO_BREAK))
+            continue
+        for piece in _TEXT_ATOM_RE.findall(part):
+            if piece.startswith("\n\n"):
+                atoms.append((piece, False, _BREAK_PARAGRAPH))
+            elif piece == "\n":
+                atoms.append((piece, False, _BREAK_LINE))
+            elif piece.isspace():
+                atoms.append((piece, False, _BREAK_WORD))
+            elif len(piece) <= _MAX_ATOM:
+                atoms.append((piece, False, _NO_BREAK))
+            else:
+                # Very long words are cut, but never inside an HTML entity
+                chunk = ""
+                for run in _ENTITY_RE.findall(piece):
+                    if len(chunk) + len(run) > _MAX_ATOM and chunk:
+                        atoms.append((chunk, False, _NO_BREAK))
+                        chunk = ""
+                    while len(run) > _MAX_ATOM:
+                        atoms.append((run[:_MAX_ATOM], False, _NO_BREAK))
+                        run = run[_MAX_ATOM:]
+                    chunk += run
+                if chunk:
+                    atoms.append((chunk, False, _NO_BREAK))
+    return atoms
+
+
+def _apply_tag(stack: List[Tuple[str, str]], tag: str) -> List[Tuple[str, str]]:
+    name = _TAG_NAME_RE.match(tag).group(1).lower()
+    if tag.startswith("</"):
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                return stack[:i]
+        return stack
+    return stack + [(name, tag)]
+
+
+def _closing(stack: List[Tuple[str, str]]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def split_html_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Split Telegram HTML into chunks of at most `limit` characters.
+
+    Chunks end on paragraph breaks where possible, then line breaks, then
+    spaces. Tags that are open at a cut (including `<pre>` code blocks) are
+    closed at the end of the chunk and reopened at the start of the next one,
+    so every chunk is valid HTML on its own.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    atoms = _html_atoms(text)
+    chunks = []
+    stack: List[Tuple[str, str]] = []
+    i = 0
+    while i < len(atoms):
+        prefix = "".join(tag for _, tag in stack)
+        parts = [prefix]
+        size = len(prefix)
+        cur_stack = stack
+        # Latest usable cut for each break rank: rank -> (atom index, parts length, stack, size)
+        cuts = {}
+        j = i
+        while j < len(atoms):
+            piece, is_tag, rank = atoms[j]
+            next_stack = _apply_tag(cur_stack, piece) if is_tag else cur_stack
+            if size + len(piece) + len(_closing(next_stack)) > limit and j > i:
+                break
+            parts.append(piece)
+            size += len(piece)
+            cur_stack = next_stack
+            j += 1
+            if rank != _NO_BREAK:
+                cuts[rank] = (j, len(parts), cur_stack, size)
+
+        if j < len(atoms):
+            # Prefer the strongest break that still fills at least half the chunk
+            for rank in (_BREAK_PARAGRAPH, _BREAK_LINE, _BREAK_WORD):
+                cut = cuts.get(rank)
+                if cut and cut[3] >= limit // 2:
+                    j, keep, cur_stack, _ = cut
+                    del parts[keep:]
+                    break
 
-    # Restore code blocks
-    for i, code_block in enumerate(code_blocks):
-        text = text.replace(f"__CODE_BLOCK_{i}__", code_block)
+        body = "".join(parts[1:]).strip()
+        if body:
+            chunks.append(prefix + "".join(parts[1:]).rstrip() + _closing(cur_stack))
+        stack = cur_stack
+        i = j
 
-    return text.strip()
+    return chunks
 
 
 def add_signature(text: str) -> str:
@@ -1,7 +1,13 @@
-import requests
 import json
+import base64
+import logging
 import aiohttp
 import asyncio
+from collections import namedtuple
+
+from .url_cache import ScanResultCache, canonicalize_url
+from .threat_filter import ThreatFilter
+from .rate_limit import ProviderLimiter, ProviderUnavailable
 
 import os
 
@@ -11,6 +17,65 @@ urlScan = os.getenv("URLSCAN_API_KEY")
 alienVaultOTX = os.getenv("ALIENVAULT_OTX_KEY")
 rapidApiKey = os.getenv("RAPIDAPI_KEY")
 hunterApiKey = os.getenv("HUNTER_API_KEY")
+threatBlocklistPath = os.getenv("THREAT_BLOCKLIST_PATH", "data/threat_blocklist.txt")
+threatAllowlistPath = os.getenv("THREAT_ALLOWLIST_PATH", "data/threat_allowlist.txt")
+
+logger = logging.getLogger(__name__)
+
+VERDICT_MALICIOUS = "malicious"
+VERDICT_CLEAN = "clean"
+VERDICT_UNKNOWN = "unknown"
+VERDICT_ERROR = "error"
+VERDICT_UNAVAILABLE = "unavailable"
+# Submitted for analysis but not finished yet; like errors, never cached
+VERDICT_PENDING = "pending"
+
+# One provider's answer: `text` is the line shown to the user
+ScanResult = namedtuple("ScanResult", ["provider", "verdict", "text"])
+
+GOOGLE_SAFE_BROWSING = "Google Safe Browsing"
+VIRUSTOTAL = "VirusTotal"
+URLSCAN = "URLScan.io"
+ALIENVAULT_OTX = "AlienVault OTX"
+LOCAL_LISTS = "Local threat lists"
+
+# Request budgets per provider; VirusTotal's free tier allows 4/min and 500/day
+PROVIDER_LIMITS = {
+    GOOGLE_SAFE_BROWSING: ProviderLimiter(GOOGLE_SAFE_BROWSING, per_minute=300, max_concurrent=8, daily_quota=10000),
+    VIRUSTOTAL: ProviderLimiter(VIRUSTOTAL, per_minute=4, max_concurrent=2, daily_quota=500, max_wait=30),
+    URLSCAN: ProviderLimiter(URLSCAN, per_minute=30, max_concurrent=4, daily_quota=1000),
+    ALIENVAULT_OTX: ProviderLimiter(ALIENVAULT_OTX, per_minute=60, max_concurrent=4),
+}
+
+UNAVAILABLE_REASONS = {
+    "quota": "تم استهلاك الحصة اليومية، تم تخطي الفحص.",
+    "rate": "تم بلوغ حد الطلبات حالياً، تم تخطي الفحص.",
+    "busy": "الخدمة مشغولة حالياً، تم تخطي الفحص.",
+}
+
+# Polling backoff for providers that need a fresh analysis
+POLL_INITIAL_DELAY = 2.0
+POLL_MAX_DELAY = 8.0
+# VirusTotal analysis polls run on a fixed schedule outside the 4/min bucket,
+# which only pays for the report lookup and the submission
+VIRUSTOTAL_POLL_INTERVAL = 15.0
+VIRUSTOTAL_MAX_POLLS = 3
+URLSCAN_FIRST_POLL_DELAY = 10.0
+URLSCAN_POLL_TIMEOUT = 60.0
+
+
+async def _poll_with_backoff(check, timeout, first_delay=POLL_INITIAL_DELAY):
+    """Call `check()` with exponential backoff until it returns a result or time runs out."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = first_delay
+    while True:
+        await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+        result = await check()
+        if result is not None or loop.time() >= deadline:
+            return result
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
 
 async def scan_url_google_safe_browsing(url):
     api_url = f"https://safebrowsing.googleapis.com/v4/threatMatches:find?key={googleSafeBrowsing}"
@@ -27,7 +92,7 @@ async def scan_url_google_safe_browsing(url):
             ],
             "platformTypes": ["ANY_PLATFORM"],
             "threatEntryTypes": ["URL"],
-            "url": url
+            "threatEntries": [{"url": url}]
         }
     }
     try:
@@ -36,61 +101,119 @@ async def scan_url_google_safe_browsing(url):
                 if response.status == 200:
                     data = await response.json()
                     if data and "matches" in data:
-                        return f"Google Safe Browsing: ⚠️ تم العثور على تهديدات: {data['matches'][0]['threatType']}"
+                        return ScanResult(GOOGLE_SAFE_BROWSING, VERDICT_MALICIOUS,
+                                          f"Google Safe Browsing: ⚠️ تم العثور على تهديدات: {data['matches'][0]['threatType']}")
                     else:
-                        return "Google Safe Browsing: ✅ لا توجد تهديدات معروفة."
+                        return ScanResult(GOOGLE_SAFE_BROWSING, VERDICT_CLEAN,
+                                          "Google Safe Browsing: ✅ لا توجد تهديدات معروفة.")
                 else:
-                    return f"Google Safe Browsing: ❌ خطأ في API: {response.status} - {await response.text()}"
+                    return ScanResult(GOOGLE_SAFE_BROWSING, VERDICT_ERROR,
+                                      f"Google Safe Browsing: ❌ خطأ في API: {response.status} - {await response.text()}")
     except Exception as e:
-        return f"Google Safe Browsing: ❌ حدث خطأ: {e}"
+        return ScanResult(GOOGLE_SAFE_BROWSING, VERDICT_ERROR, f"Google Safe Browsing: ❌ حدث خطأ: {e}")
+
+
+def _virustotal_result(stats):
+    if stats.get('malicious', 0) > 0 or stats.get('suspicious', 0) > 0:
+        return ScanResult(VIRUSTOTAL, VERDICT_MALICIOUS,
+                          f"VirusTotal: ⚠️ تم العثور على {stats.get('malicious', 0)} تهديدات خبيثة و {stats.get('suspicious', 0)} تهديدات مشبوهة.")
+    return ScanResult(VIRUSTOTAL, VERDICT_CLEAN, "VirusTotal: ✅ لا توجد تهديدات معروفة.")
+
 
 async def scan_url_virustotal(url):
-    api_url = "https://www.virustotal.com/api/v3/urls"
-    headers = {
-        "x-apikey": virusTotal,
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    payload = {"url": url}
+    """Use VirusTotal's existing report when there is one; submit and poll only otherwise."""
+    headers = {"x-apikey": virusTotal}
+    url_id = base64.urlsafe_b64encode(url.encode()).decode().strip("=")
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.post(api_url, headers=headers, data=payload) as response:
+            async with session.get(f"https://www.virustotal.com/api/v3/urls/{url_id}", headers=headers) as response:
                 if response.status == 200:
                     data = await response.json()
-                    analysis_id = data['data']['id']
-                    await asyncio.sleep(10)
-                    report_url = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-                    async with session.get(report_url, headers=headers) as report_response:
-                        if report_response.status == 200:
-                            report_data = await report_response.json()
-                            stats = report_data['data']['attributes']['stats']
-                            if stats['malicious'] > 0 or stats['suspicious'] > 0:
-                                return f"VirusTotal: ⚠️ تم العثور على {stats['malicious']} تهديدات خبيثة و {stats['suspicious']} تهديدات مشبوهة."
-                            else:
-                                return "VirusTotal: ✅ لا توجد تهديدات معروفة."
-                        else:
-                            return f"VirusTotal: ❌ خطأ في جلب التقرير: {report_response.status} - {await report_response.text()}"
-                else:
-                    return f"VirusTotal: ❌ خطأ في API: {response.status} - {await response.text()}"
+                    stats = data['data']['attributes'].get('last_analysis_stats') or {}
+                    if sum(stats.values()) > 0:
+                        return _virustotal_result(stats)
+                elif response.status != 404:
+                    return ScanResult(VIRUSTOTAL, VERDICT_ERROR,
+                                      f"VirusTotal: ❌ خطأ في API: {response.status} - {await response.text()}")
+
+            if not await PROVIDER_LIMITS[VIRUSTOTAL].spend():
+                return ScanResult(VIRUSTOTAL, VERDICT_UNAVAILABLE,
+                                  f"VirusTotal: ⏸️ {UNAVAILABLE_REASONS['rate']}")
+            async with session.post("https://www.virustotal.com/api/v3/urls", headers=headers, data={"url": url}) as response:
+                if response.status != 200:
+                    return ScanResult(VIRUSTOTAL, VERDICT_ERROR,
+                                      f"VirusTotal: ❌ خطأ في API: {response.status} - {await response.text()}")
+                data = await response.json()
+                analysis_id = data['data']['id']
+
+            report_url = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
+            for _ in range(VIRUSTOTAL_MAX_POLLS):
+                await asyncio.sleep(VIRUSTOTAL_POLL_INTERVAL)
+                async with session.get(report_url, headers=headers) as report_response:
+                    if report_response.status != 200:
+                        return ScanResult(VIRUSTOTAL, VERDICT_ERROR,
+                                          f"VirusTotal: ❌ خطأ في جلب التقرير: {report_response.status} - {await report_response.text()}")
+                    attributes = (await report_response.json())['data']['attributes']
+                    if attributes.get('status') == 'completed':
+                        return _virustotal_result(attributes['stats'])
+            return ScanResult(VIRUSTOTAL, VERDICT_PENDING,
+                              "VirusTotal: ⏳ تم إرسال الرابط للتحليل ولم تكتمل النتيجة بعد، أعد الفحص بعد دقيقة.")
     except Exception as e:
-        return f"VirusTotal: ❌ حدث خطأ: {e}"
+        return ScanResult(VIRUSTOTAL, VERDICT_ERROR, f"VirusTotal: ❌ حدث خطأ: {e}")
+
+
+def _urlscan_result(result_data, report_url):
+    overall = (result_data.get('verdicts') or {}).get('overall') or {}
+    if overall.get('malicious'):
+        return ScanResult(URLSCAN, VERDICT_MALICIOUS,
+                          f"URLScan.io: ⚠️ الرابط مصنف كخبيث. التقرير: {report_url}")
+    return ScanResult(URLSCAN, VERDICT_CLEAN,
+                      f"URLScan.io: ✅ لا توجد تهديدات معروفة. التقرير: {report_url}")
+
 
 async def scan_url_urlscan(url):
-    api_url = "https://urlscan.io/api/v1/scan/"
-    headers = {
-        "API-Key": urlScan,
-        "Content-Type": "application/json"
-    }
-    payload = {"url": url, "visibility": "public"}
+    """Reuse the latest public urlscan.io result for the URL; submit and poll only otherwise."""
+    headers = {"API-Key": urlScan}
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.post(api_url, headers=headers, json=payload) as response:
+            search_params = {"q": f'task.url:{json.dumps(url)}', "size": "1"}
+            async with session.get("https://urlscan.io/api/v1/search/", headers=headers, params=search_params) as response:
                 if response.status == 200:
-                    data = await response.json()
-                    return f"URLScan.io: ✅ تم إرسال الرابط للفحص. التقرير متاح على: {data['result']}"
-                else:
-                    return f"URLScan.io: ❌ خطأ في API: {response.status} - {await response.text()}"
+                    hits = (await response.json()).get("results") or []
+                    if hits:
+                        scan_id = hits[0]["_id"]
+                        async with session.get(f"https://urlscan.io/api/v1/result/{scan_id}/", headers=headers) as result_response:
+                            if result_response.status == 200:
+                                return _urlscan_result(await result_response.json(),
+                                                       f"https://urlscan.io/result/{scan_id}/")
+
+            if not await PROVIDER_LIMITS[URLSCAN].spend():
+                return ScanResult(URLSCAN, VERDICT_UNAVAILABLE,
+                                  f"URLScan.io: ⏸️ {UNAVAILABLE_REASONS['rate']}")
+            payload = {"url": url, "visibility": "public"}
+            async with session.post("https://urlscan.io/api/v1/scan/", headers=headers, json=payload) as response:
+                if response.status != 200:
+                    return ScanResult(URLSCAN, VERDICT_ERROR,
+                                      f"URLScan.io: ❌ خطأ في API: {response.status} - {await response.text()}")
+                data = await response.json()
+                scan_id = data["uuid"]
+                report_url = data["result"]
+
+            async def check_result():
+                async with session.get(f"https://urlscan.io/api/v1/result/{scan_id}/", headers=headers) as result_response:
+                    if result_response.status == 404:
+                        return None
+                    if result_response.status != 200:
+                        return ScanResult(URLSCAN, VERDICT_ERROR,
+                                          f"URLScan.io: ❌ خطأ في جلب التقرير: {result_response.status}")
+                    return _urlscan_result(await result_response.json(), report_url)
+
+            result = await _poll_with_backoff(check_result, URLSCAN_POLL_TIMEOUT, first_delay=URLSCAN_FIRST_POLL_DELAY)
+            return result or ScanResult(URLSCAN, VERDICT_UNKNOWN,
+                                        f"URLScan.io: ✅ تم إرسال الرابط للفحص. التقرير متاح على: {report_url}")
     except Exception as e:
-        return f"URLScan.io: ❌ حدث خطأ: {e}"
+        return ScanResult(URLSCAN, VERDICT_ERROR, f"URLScan.io: ❌ حدث خطأ: {e}")
+
 
 async def scan_url_alienvault_otx(url):
     api_url = f"https://otx.alienvault.com/api/v1/indicators/url/{url}"
@@ -101,34 +224,110 @@ async def scan_url_alienvault_otx(url):
                 if response.status == 200:
                     data = await response.json()
                     if data and "detections" in data and len(data["detections"]) > 0:
-                        return f"AlienVault OTX: ⚠️ تم العثور على تهديدات: {len(data['detections'])} اكتشافات."
+                        return ScanResult(ALIENVAULT_OTX, VERDICT_MALICIOUS,
+                                          f"AlienVault OTX: ⚠️ تم العثور على تهديدات: {len(data['detections'])} اكتشافات.")
                     else:
-                        return "AlienVault OTX: ✅ لا توجد تهديدات معروفة."
+                        return ScanResult(ALIENVAULT_OTX, VERDICT_CLEAN, "AlienVault OTX: ✅ لا توجد تهديدات معروفة.")
                 elif response.status == 404:
-                    return "AlienVault OTX: ✅ لا توجد معلومات عن هذا الرابط."
+                    return ScanResult(ALIENVAULT_OTX, VERDICT_UNKNOWN, "AlienVault OTX: ✅ لا توجد معلومات عن هذا الرابط.")
                 else:
-                    return f"AlienVault OTX: ❌ خطأ في API: {response.status} - {await response.text()}"
+                    return ScanResult(ALIENVAULT_OTX, VERDICT_ERROR,
+                                      f"AlienVault OTX: ❌ خطأ في API: {response.status} - {await response.text()}")
     except Exception as e:
-        return f"AlienVault OTX: ❌ حدث خطأ: {e}"
+        return ScanResult(ALIENVAULT_OTX, VERDICT_ERROR, f"AlienVault OTX: ❌ حدث خطأ: {e}")
+
+
+PROVIDERS = {
+    GOOGLE_SAFE_BROWSING: scan_url_google_safe_browsing,
+    VIRUSTOTAL: scan_url_virustotal,
+    URLSCAN: scan_url_urlscan,
+    ALIENVAULT_OTX: scan_url_alienvault_otx,
+}
+
+
+async def _run_provider(name, scan, url):
+    """Run one provider within its limits, reporting it as unavailable if they are exhausted."""
+    try:
+        async with PROVIDER_LIMITS[name].slot():
+            result = await scan(url)
+        if result.verdict == VERDICT_ERROR:
+            logger.warning(result.text)
+        return result
+    except ProviderUnavailable as e:
+        return ScanResult(name, VERDICT_UNAVAILABLE, f"{name}: ⏸️ {UNAVAILABLE_REASONS[str(e)]}")
+
 
-async def scan_link(url):
-    raw_results = await asyncio.gather(
-        scan_url_google_safe_browsing(url),
-        scan_url_virustotal(url),
-        scan_url_urlscan(url),
-        scan_url_alienvault_otx(url)
-    )
+scan_cache = ScanResultCache()
+threat_filter = ThreatFilter(threatBlocklistPath, threatAllowlistPath)
 
-  
-    successful_results = [result for result in raw_results if "❌" not in result]
 
-    if not successful_results:
-       
+def _local_result(url_key):
+    match = threat_filter.check(url_key)
+    if match is None:
+        return None
+    verdict, domain = match
+    if verdict == VERDICT_MALICIOUS:
+        return ScanResult(LOCAL_LISTS, VERDICT_MALICIOUS,
+                          f"القوائم المحلية: ⚠️ النطاق {domain} مدرج في قائمة التهديدات المعروفة.")
+    return ScanResult(LOCAL_LISTS, VERDICT_CLEAN,
+                      f"القوائم المحلية: ✅ النطاق {domain} ضمن النطاقات الموثوقة.")
+
+
+async def iter_scan_results(url, db=None):
+    """Yield each ScanResult as soon as it is ready.
+
+    A match in the local block/allow lists answers on its own. Otherwise
+    cached results for the canonical URL are returned without calling any
+    provider; failing that every provider runs concurrently and the combined
+    result is cached once all of them have answered.
+    """
+    url_key = canonicalize_url(url)
+    local = _local_result(url_key)
+    if local is not None:
+        yield local
+        return
+
+    cached = scan_cache.lookup(url_key, db)
+    if cached is not None:
+        for result in cached:
+            yield ScanResult(*result)
+        return
+
+    tasks = [asyncio.create_task(_run_provider(name, scan, url_key)) for name, scan in PROVIDERS.items()]
+    results = []
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            results.append(result)
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+    scan_cache.store(url_key, results, db)
+
+
+def format_scan_results(results, pending=()):
+    """Build the user-facing report; `pending` lists providers still running.
+
+    Providers that failed or were skipped are listed as such, so the report
+    always shows which checks actually ran.
+    """
+    if not results and not pending:
         return None
 
-  
     response_message = "📊 نتائج فحص الرابط:\n\n"
-    for res in successful_results:
-        response_message += f"{res}\n\n"
+    for res in results:
+        if res.verdict == VERDICT_ERROR:
+            # Raw API errors can be long HTML pages; they are logged instead
+            response_message += f"{res.provider}: ❌ تعذر الفحص حالياً.\n\n"
+        else:
+            response_message += f"{res.text}\n\n"
+    for provider in pending:
+        response_message += f"{provider}: ⏳ جارٍ الفحص...\n\n"
     return response_message.strip()
 
+
+async def scan_link(url, db=None):
+    """Scan `url` with every provider and return the full report (or None)."""
+    results = [result async for result in iter_scan_results(url, db)]
+    return format_scan_results(results)
@@ -0,0 +1,143 @@
+"""
+Rate limiting and quota tracking for external APIs
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    """Raised when a provider cannot be called within its limits."""
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity`.
+
+    Callers reserve a token up front and then sleep until it is due, so the
+    balance may go negative and waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take one token; return how long to wait for it, or None if that exceeds `max_wait`."""
+        self._refill()
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self._tokens -= 1
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next `seconds` (e.g. after a flood-control error)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    async def acquire(self, max_wait: float = float("inf")) -> bool:
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+class DailyQuota:
+    """Counts calls per UTC day against a fixed limit."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._day = None
+
+    def _roll(self) -> None:
+        today = datetime.now(timezone.utc).date()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+
+    @property
+    def remaining(self) -> int:
+        self._roll()
+        return max(0, self.limit - self.used)
+
+    def consume(self) -> None:
+        self._roll()
+        self.used += 1
+
+
+class ProviderLimiter:
+    """Per-minute rate, concurrency cap and optional daily quota for one provider.
+
+    `slot()` wraps a whole scan: it waits for a free concurrency slot and the
+    first request token, or raises ProviderUnavailable if either takes longer
+    than `max_wait`. Scans that make further requests call `spend()` before
+    each of them.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: Optional[int] = None,
+                 max_concurrent: int = 4, daily_quota: Optional[int] = None, max_wait: float = 20.0):
+        self.name = name
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(per_minute / 60.0, burst or max(1, int(per_minute)))
+        self.quota = DailyQuota(daily_quota) if daily_quota else None
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.skipped = 0
+
+    async def _spend(self, max_wait: float) -> Optional[str]:
+        """Spend one request; returns None on success or the reason it was refused."""
+        if self.quota is not None and self.quota.remaining <= 0:
+            return "quota"
+        if not await self.bucket.acquire(max_wait):
+            return "rate"
+        if self.quota is not None:
+            self.quota.consume()
+        return None
+
+    async def spend(self, max_wait: Optional[float] = None) -> bool:
+        reason = await self._spend(self.max_wait if max_wait is None else max_wait)
+        if reason is not None:
+            self.skipped += 1
+        return reason is None
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.skipped += 1
+            raise ProviderUnavailable("busy")
+        try:
+            reason = await self._spend(max(0.0, deadline - loop.time()))
+            if reason is not None:
+                self.skipped += 1
+                logger.info(f"{self.name} skipped: {reason}")
+                raise ProviderUnavailable(reason)
+            yield self
+        finally:
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "daily_used": self.quota.used if self.quota else None,
+            "daily_limit": self.quota.limit if self.quota else None,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,68 @@
+"""
+Background link scanning for group messages
+"""
+
+import asyncio
+import logging
+from collections import namedtuple
+from typing import Awaitable, Callable, List
+
+from .state_cache import BoundedLRU
+from .link_scanner import ScanResult, VERDICT_MALICIOUS, iter_scan_results
+
+logger = logging.getLogger(__name__)
+
+# One queued link: where it was posted and the bot to answer with
+ScanJob = namedtuple("ScanJob", ["bot", "chat_id", "message_id", "url"])
+
+
+class LinkScanQueue:
+    """Bounded work queue served by a fixed pool of scan workers.
+
+    `submit` never waits: when the queue is full the link is dropped, so a
+    flood of links can only delay other scans, never the message handlers.
+    A link already queued for the same chat within `recent_ttl` seconds is
+    ignored. `on_flagged(job, results)` is awaited only for malicious links.
+    """
+
+    def __init__(self, on_flagged: Callable[[ScanJob, List[ScanResult]], Awaitable[None]], db=None,
+                 workers: int = 3, maxsize: int = 200, recent_ttl: float = 600):
+        self.on_flagged = on_flagged
+        self.db = db
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._recent = BoundedLRU("auto_scan_recent", max_entries=20000, ttl=recent_ttl)
+        self._tasks: List[asyncio.Task] = []
+        self.dropped = 0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, bot, chat_id: int, message_id: int, url: str) -> bool:
+        key = (chat_id, url)
+        if key in self._recent:
+            return False
+        try:
+            self._queue.put_nowait(ScanJob(bot, chat_id, message_id, url))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Auto-scan queue full, dropped link from chat {chat_id}")
+            return False
+        self._recent.set(key, True)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                results = [result async for result in iter_scan_results(job.url, self.db)]
+                if any(result.verdict == VERDICT_MALICIOUS for result in results):
+                    await self.on_flagged(job, results)
+            except Exception as e:
+                logger.error(f"Auto-scan failed for {job.url}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped, "workers": len(self._tasks)}
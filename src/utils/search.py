@@ -1,65 +1,161 @@
+import re
+import html
+import time
+import asyncio
+import hashlib
 import logging
+import unicodedata
+from typing import List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CallbackQueryHandler
+from telegram.ext import ContextTypes
 
-from exa_py import Exa
+from ..config import EXA_API_KEY
+from .state_cache import BoundedLRU
 
+logger = logging.getLogger(__name__)
 
-EXA_API_KEY = "f0436406-9a26-4c46-abf7-8db007467703"
+# One Exa call fetches enough results for every page
+SEARCH_NUM_RESULTS = 15
+RESULTS_PER_PAGE = 5
+SEARCH_CACHE_TTL = 30 * 60
 
-exa = Exa(api_key=EXA_API_KEY)
+_WHITESPACE_RE = re.compile(r"\s+")
+_ARABIC_DIACRITICS_RE = re.compile(r"[\u064B-\u065F\u0670\u0640]")
+
+_exa = None
+
+# query hash -> (created_at, original query, [{"title", "url", "text"}, ...])
+search_cache = BoundedLRU("search_results", max_entries=500, ttl=SEARCH_CACHE_TTL)
+
+
+def init_search_client():
+    """Create the Exa client once at startup; returns None if search is not configured."""
+    global _exa
+    if _exa is None:
+        if not EXA_API_KEY:
+            logger.warning("EXA_API_KEY not found in environment variables. Web search is disabled.")
+            return None
+        from exa_py import Exa
+        _exa = Exa(api_key=EXA_API_KEY)
+    return _exa
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, width, Arabic diacritics/tatweel and whitespace so equivalent queries share a cache entry."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = _ARABIC_DIACRITICS_RE.sub("", query)
+    return _WHITESPACE_RE.sub(" ", query).strip(" ?؟!.")
+
+
+def _query_key(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def _fetch_results(query: str) -> List[dict]:
+    """Blocking Exa call; run it with asyncio.to_thread."""
+    result = init_search_client().search_and_contents(
+        query, num_results=SEARCH_NUM_RESULTS, text={"max_characters": 500}
+    )
+    return [
+        {
+            "title": getattr(doc, "title", None) or "عنوان غير متوفر ❓",
+            "url": getattr(doc, "url", None) or "",
+            "text": getattr(doc, "text", None) or "لا يوجد ملخص 📝",
+        }
+        for doc in (getattr(result, "results", None) or [])
+    ]
+
+
+def _cached_results(key: str) -> Optional[tuple]:
+    entry = search_cache.get(key)
+    if entry is None:
+        return None
+    if time.time() - entry[0] > SEARCH_CACHE_TTL:
+        search_cache.pop(key)
+        return None
+    return entry
+
+
+def _render_page(key: str, results: List[dict], page: int):
+    """Build the HTML text and keyboard for one page of cached results."""
+    start = page * RESULTS_PER_PAGE
+    response = " إليك النتائج:\n" if page == 0 else f" نتائج إضافية ({page + 1}):\n"
+    for doc in results[start:start + RESULTS_PER_PAGE]:
+        url = html.escape(doc["url"])
+        read_more = f'\n<a href="{url}">📖 اقرأ المزيد</a>' if doc["url"] else ""
+        response += (
+            f"\n{'─'*20}\n"
+            f"📌 <b>{html.escape(doc['title'])}</b>\n"
+            f"🔗 {url or 'رابط غير متوفر 🔗'}\n"
+            f"📝 {html.escape(doc['text'])}{read_more}"
+        )
+    response += (
+        f"\n\n{'─'*20}\n"
+        f"📢 قناة التلجرام: @SyberSc71 | 👨‍💻 المطور: @WAT4F"
+    )
+
+    reply_markup = None
+    if start + RESULTS_PER_PAGE < len(results):
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔎 نتائج أكثر", callback_data=f"search_more:{key}:{page + 1}")
+        ]])
+    return response, reply_markup
 
 
 async def search_exa(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.message.text
-    searching_message = f"🔍 | جارِ البحث عن: *{query}* ..."
-    await update.message.reply_text(searching_message, parse_mode="Markdown")
+    searching_message = f"🔍 | جارِ البحث عن: <b>{html.escape(query)}</b> ..."
+    await update.message.reply_text(searching_message, parse_mode="HTML")
 
     try:
-        result = exa.search_and_contents(query, text={"max_characters": 500})
-
-        if hasattr(result, "results") and result.results:
-            # إنشاء رسالة مجمعة للنتائج
-            response = " إليك النتائج:\n\n"
-            
-            for doc in result.results[:5]:
-                title = doc.title if hasattr(doc, "title") else "عنوان غير متوفر ❓"
-                url = doc.url if hasattr(doc, "url") else "رابط غير متوفر 🔗"
-                text = doc.text if hasattr(doc, "text") else "لا يوجد ملخص 📝"
-                
-              
-                summary = f"{text[:600]}..." if len(text) > 600 else text
-                read_more = f"\n[📖 اقرأ المزيد]({url})" if url else ""
-                
-                response += (
-                    f"\n{'─'*20}\n"
-                    f"📌 *{title}*\n"
-                    f"🔗 {url}\n"
-                    f"📝 {summary}{read_more}"
-                )
-            
-       
-            response += (
-                f"\n\n{'─'*20}\n"
-                f"📢 قناة التلجرام: @SyberSc71 | 👨‍💻 المطور: @WAT4F"
-            )
-            
-            # إرسال النتائج المجمعة
+        if init_search_client() is None:
+            await update.message.reply_text(" خدمة البحث غير متاحة حالياً.")
+            return
+
+        key = _query_key(normalize_query(query))
+        entry = _cached_results(key)
+        if entry is None:
+            results = await asyncio.to_thread(_fetch_results, query)
+            entry = (time.time(), query, results)
+            if results:
+                search_cache.set(key, entry)
+        results = entry[2]
+
+        if results:
+            response, reply_markup = _render_page(key, results, 0)
             await update.message.reply_text(
                 response,
-                parse_mode="Markdown",
-                disable_web_page_preview=True
-            )
-            
-            # إشعار إضافي
-            await update.message.reply_text(
-                "💡 هل تريد نتائج أكثر؟ يمكنك تحسين البحث باستخدام كلمات مفتاحية أدق!",
-                parse_mode="Markdown"
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+                reply_markup=reply_markup
             )
-            
         else:
             await update.message.reply_text(" عذراً، لا توجد نتائج لبحثك. حاول صياغة سؤال مختلف.")
 
     except Exception as e:
-        logging.error(f"שגיאת חיפוש: {e}")
+        logger.error(f"Search error: {e}", exc_info=True)
         await update.message.reply_text(" حدث خطأ تقني، يرجى المحاولة لاحقاً.")
+
+
+async def search_more_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the next page of a previous search from the cache, without searching again."""
+    query = update.callback_query
+    _, key, page = query.data.split(":")
+    entry = _cached_results(key)
+    if entry is None:
+        await query.answer("انتهت صلاحية نتائج البحث، يرجى البحث مرة أخرى.", show_alert=True)
+        return
+
+    await query.answer()
+    response, reply_markup = _render_page(key, entry[2], int(page))
+    try:
+        # Only the newest page keeps a "more" button
+        await query.edit_message_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.warning(f"Failed to remove search button: {e}")
+    await query.message.reply_text(
+        response,
+        parse_mode="HTML",
+        disable_web_page_preview=True,
+        reply_markup=reply_markup
+    )
@@ -0,0 +1,211 @@
+"""
+Bounded in-memory state containers for per-chat data
+"""
+
+import sys
+import time
+import logging
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Every named cache registers itself here so the admin panel can report on it.
+_registry: "weakref.WeakValueDictionary[str, BoundedLRU]" = weakref.WeakValueDictionary()
+_MISSING = object()
+
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """Cheap approximate size in bytes of a value and what it holds."""
+    if hasattr(obj, "approx_size"):
+        return obj.approx_size()
+    size = sys.getsizeof(obj)
+    if _depth >= 3:
+        return size
+    if isinstance(obj, (list, tuple, deque, set, frozenset)):
+        size += sum(approx_size(item, _depth + 1) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    return size
+
+
+class Turn:
+    """A single conversation turn, stored compactly instead of nested dicts."""
+
+    __slots__ = ("role", "text", "image_data")
+
+    def __init__(self, role: str, text: str, image_data: Optional[str] = None):
+        self.role = role
+        self.text = text
+        self.image_data = image_data
+
+    def to_content(self) -> Dict:
+        """Build the Gemini `contents` entry for this turn."""
+        parts = [{"text": self.text}]
+        if self.image_data:
+            parts.append({
+                "inline_data": {
+                    "mime_type": "image/jpeg",
+                    "data": self.image_data
+                }
+            })
+        return {"role": self.role, "parts": parts}
+
+    def approx_size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.text)
+        if self.image_data:
+            size += sys.getsizeof(self.image_data)
+        return size
+
+
+class BoundedLRU:
+    """LRU mapping with an entry limit, an idle TTL and an approximate byte budget.
+
+    Entries are kept in access order, so idle expiry only ever looks at the
+    oldest entries and costs O(expired). Values that are mutated in place must
+    be re-measured with `resize()` so the byte accounting stays accurate.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 10000,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = approx_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        # key -> [value, size, last_access]
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _registry[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if self._is_expired(entry, self._clock()):
+            self._remove(key)
+            self.expirations += 1
+            return False
+        return True
+
+    def _is_expired(self, entry: list, now: float) -> bool:
+        return self.ttl is not None and now - entry[2] > self.ttl
+
+    def _remove(self, key: Hashable) -> Any:
+        value, size, _ = self._data.pop(key)
+        self._bytes -= size
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for `key` and mark it as recently used."""
+        entry = self._data.get(key)
+        now = self._clock()
+        if entry is None or self._is_expired(entry, now):
+            if entry is not None:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+        entry[2] = now
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the value for `key`, storing `factory()` first if it is missing."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value`, then evict until the cache is back within its limits."""
+        size = self._sizeof(value)
+        if key in self._data:
+            self._bytes -= self._data[key][1]
+        self._data[key] = [value, size, self._clock()]
+        self._data.move_to_end(key)
+        self._bytes += size
+        self._enforce_limits()
+
+    def resize(self, key: Hashable) -> None:
+        """Re-measure a value that was mutated in place and mark it as used."""
+        entry = self._data.get(key)
+        if entry is None:
+            return
+        size = self._sizeof(entry[0])
+        self._bytes += size - entry[1]
+        entry[1] = size
+        entry[2] = self._clock()
+        self._data.move_to_end(key)
+        self._enforce_limits()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            return default
+        return self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop idle entries. Only the expired prefix of the access order is visited."""
+        if self.ttl is None:
+            return 0
+        now = self._clock()
+        purged = 0
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if not self._is_expired(entry, now):
+                break
+            self._remove(key)
+            purged += 1
+        self.expirations += purged
+        return purged
+
+    def _enforce_limits(self) -> None:
+        self.purge_expired()
+        # Never evict the entry that was just written, even if it alone is over budget.
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def get_state_stats() -> List[Dict[str, Any]]:
+    """Stats for every live named cache, sorted by name."""
+    return [cache.stats() for _, cache in sorted(_registry.items())]
@@ -0,0 +1,84 @@
+"""
+Cached channel-subscription checks
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from .state_cache import BoundedLRU
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBED_STATUSES = ('member', 'administrator', 'creator')
+
+
+class SubscriptionCache:
+    """Remembers who is subscribed to the required channel.
+
+    Positive answers are trusted for `positive_ttl` seconds and negative ones
+    for the shorter `negative_ttl`. Once a positive answer is older than
+    `positive_ttl` it is still returned immediately while a background task
+    re-checks it (stale-while-revalidate), so subscribed users never wait on
+    `get_chat_member`. `chat_member` updates for the channel overwrite the
+    cached answer directly.
+    """
+
+    def __init__(self, channel: str, positive_ttl: float = 600, negative_ttl: float = 30,
+                 stale_ttl: float = 24 * 3600, max_entries: int = 50000):
+        self.channel = channel
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        # user_id -> (is_member, checked_at); entries idle for stale_ttl are dropped
+        self._entries = BoundedLRU("subscriptions", max_entries=max_entries, ttl=stale_ttl)
+        self._inflight: Dict[int, asyncio.Task] = {}
+
+    def is_channel(self, chat) -> bool:
+        """Whether `chat` is the required channel."""
+        return bool(chat.username) and f"@{chat.username}".lower() == self.channel.lower()
+
+    async def is_subscribed(self, bot, user_id: int, force: bool = False) -> bool:
+        entry = None if force else self._entries.get(user_id)
+        if entry is not None:
+            is_member, checked_at = entry
+            age = time.monotonic() - checked_at
+            if is_member:
+                if age >= self.positive_ttl:
+                    self._start_fetch(bot, user_id)
+                return True
+            if age < self.negative_ttl:
+                return False
+        return await asyncio.shield(self._start_fetch(bot, user_id))
+
+    def _start_fetch(self, bot, user_id: int) -> asyncio.Task:
+        """Start (or join) the single in-flight API check for `user_id`."""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(bot, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return task
+
+    async def _fetch(self, bot, user_id: int) -> bool:
+        try:
+            member = await bot.get_chat_member(chat_id=self.channel, user_id=user_id)
+            is_member = member.status in SUBSCRIBED_STATUSES
+        except Exception as e:
+            # A failed check says nothing about membership: keep the last
+            # known answer (and its age, so it is re-checked next time)
+            logger.warning(f"Subscription check failed for {user_id}: {e}")
+            entry = self._entries.get(user_id)
+            return entry[0] if entry is not None else False
+        self._entries.set(user_id, (is_member, time.monotonic()))
+        return is_member
+
+    def record_status(self, user_id: int, status: str) -> None:
+        """Store a membership status seen in a `chat_member` update."""
+        self._entries.set(user_id, (status in SUBSCRIBED_STATUSES, time.monotonic()))
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id)
@@ -0,0 +1,150 @@
+"""
+URL extraction, canonicalization and the scan-result cache
+"""
+
+import re
+import time
+import logging
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .state_cache import BoundedLRU
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "ref_src", "si",
+}
+
+# How long a cached verdict is trusted, in seconds
+VERDICT_TTLS = {
+    "malicious": 7 * 24 * 3600,
+    "clean": 6 * 3600,
+    "unknown": 30 * 60,
+}
+
+# Results missing a provider (error, skipped or analysis still pending) are
+# kept briefly and only in memory, so the missing provider is asked again soon
+PARTIAL_RESULT_TTL = 10 * 60
+
+
+# Explicit links only (scheme or www.); bare "word.word" matches too much chat text
+URL_RE = re.compile(r"(?:https?://|www\.)[^\s<>\"'`]+", re.IGNORECASE)
+_TRAILING_PUNCTUATION = ".,;:!?)]}'\"»،؛؟"
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
+
+
+def _canonical_host(host: str) -> str:
+    host = host.rstrip(".").lower()
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so equivalent spellings share one cache entry.
+
+    Lowercases scheme and host, converts IDN hosts to punycode, drops default
+    ports, fragments and tracking parameters (utm_*, fbclid, gclid...), and
+    sorts the remaining query parameters.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    host = _canonical_host(parts.hostname or "")
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{userinfo}@{netloc}"
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(key)
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+def extract_urls(text: str, extra=(), limit: int = 5) -> List[str]:
+    """Canonical URLs found in `text` plus `extra` (e.g. hidden link entities), deduplicated, in order."""
+    found = []
+    seen = set()
+    candidates = [match.group(0).rstrip(_TRAILING_PUNCTUATION) for match in URL_RE.finditer(text or "")]
+    for url in list(extra) + candidates:
+        try:
+            url_key = canonicalize_url(url)
+        except ValueError:
+            continue
+        if url_key not in seen:
+            seen.add(url_key)
+            found.append(url_key)
+            if len(found) >= limit:
+                break
+    return found
+
+
+def overall_verdict(results) -> Optional[str]:
+    """Combine provider verdicts; None when nothing usable came back."""
+    verdicts = {result.verdict for result in results}
+    if "malicious" in verdicts:
+        return "malicious"
+    if "clean" in verdicts:
+        return "clean"
+    if "unknown" in verdicts:
+        return "unknown"
+    return None
+
+
+class ScanResultCache:
+    """Two-tier cache of scan results: an in-memory LRU in front of a Postgres table."""
+
+    def __init__(self, max_entries: int = 5000):
+        # url_key -> (expires_at, verdict, [(provider, verdict, text), ...])
+        self._memory = BoundedLRU("url_scans", max_entries=max_entries)
+
+    def lookup(self, url_key: str, db=None) -> Optional[List[Tuple[str, str, str]]]:
+        entry = self._memory.get(url_key)
+        if entry is not None:
+            if entry[0] > time.time():
+                return entry[2]
+            self._memory.pop(url_key)
+
+        if db is None:
+            return None
+        row = db.get_url_scan(url_key)
+        if not row:
+            return None
+        results = [tuple(item) for item in row["results"]]
+        self._memory.set(url_key, (row["expires_at"].timestamp(), row["verdict"], results))
+        return results
+
+    def store(self, url_key: str, results, db=None) -> None:
+        verdict = overall_verdict(results)
+        if verdict is None:
+            return
+        # Provider errors, skipped providers and unfinished analyses are not worth remembering
+        rows = [tuple(result) for result in results if result.verdict not in ("error", "unavailable", "pending")]
+        complete = len(rows) == len(results)
+        ttl = VERDICT_TTLS[verdict] if complete else min(VERDICT_TTLS[verdict], PARTIAL_RESULT_TTL)
+        self._memory.set(url_key, (time.time() + ttl, verdict, rows))
+        if db is not None and complete:
+            db.save_url_scan(url_key, verdict, rows, ttl)
@@ -0,0 +1,78 @@
+"""Markdown rendering and splitting of long Telegram HTML replies."""
+
+from html.parser import HTMLParser
+import re
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from src.utils.formatting import format_message, split_html_message  # noqa: E402
+
+
+class _TagChecker(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.balanced = True
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if self.stack and self.stack[-1] == tag:
+            self.stack.pop()
+        else:
+            self.balanced = False
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+
+def _parse(markup):
+    checker = _TagChecker()
+    checker.feed(markup)
+    checker.close()
+    return checker.balanced and not checker.stack, "".join(checker.text)
+
+
+def _visible(markup):
+    return re.sub(r"\s+", "", _parse(markup)[1])
+
+
+def test_format_message_renders_markdown():
+    assert format_message("**bold** and *it* `x<y`") == "<b>bold</b> and <i>it</i> <code>x&lt;y</code>"
+    assert format_message("snake_case and __init__") == "snake_case and __init__"
+    assert format_message("* item") == "• item"
+    assert format_message("**never closed") == "**never closed"
+
+
+def test_short_message_is_not_split():
+    assert split_html_message("<b>hi</b>", limit=100) == ["<b>hi</b>"]
+
+
+def test_split_prefers_paragraph_breaks():
+    text = "first paragraph " * 5 + "\n\n" + "second paragraph " * 5
+    chunks = split_html_message(text, limit=120)
+    assert chunks[0] == ("first paragraph " * 5).rstrip()
+    assert all(len(chunk) <= 120 for chunk in chunks)
+
+
+def test_split_reopens_tags_across_chunks():
+    code = "\n".join(f"x = {i}  # <&>" for i in range(200))
+    markup = format_message("intro **bold " + "word " * 100 + "**\n```python\n" + code + "\n```")
+    chunks = split_html_message(markup, limit=500)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        balanced, _ = _parse(chunk)
+        assert balanced and len(chunk) <= 500
+    assert "".join(_visible(chunk) for chunk in chunks) == _visible(markup)
+    assert any(chunk.startswith("<pre>") for chunk in chunks[1:])
+
+
+def test_split_cuts_words_longer_than_the_limit():
+    chunks = split_html_message("a" * 5000 + " &amp;", limit=1000)
+    assert len(chunks) > 1 and all(len(chunk) <= 1000 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == "a" * 5000 + "&amp;"
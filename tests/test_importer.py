@@ -0,0 +1,78 @@
+"""Streaming parse of the legacy JSON store."""
+
+import csv
+import io
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from src.importer import JsonStream, _stage  # noqa: E402
+
+
+LEGACY = {
+    "users": {
+        "1": {"username": "a", "first_name": "أحمد", "join_date": "2024-01-02T03:04:05",
+              "message_count": "7", "image_count": None, "last_active": "2024-02-01T00:00:00",
+              "daily_image_count": {"2024-02-01": 3}},
+        "2": {"first_name": "B", "message_count": 12345678901234567890},
+    },
+    "banned_users": [2],
+    "premium_users": [],
+    "groups": {"-100": {"title": "G", "members_count": 5}},
+    "unknown": {"nested": [1, {"x": "}"}]},
+    "statistics": {"total_messages": 10, "total_images": 4},
+}
+
+
+class FakeCursor:
+    """Records what each COPY statement would load."""
+
+    def __init__(self):
+        self.copied = {}
+
+    def copy_expert(self, sql, data):
+        table = sql.split()[1]
+        self.copied.setdefault(table, []).extend(csv.reader(io.StringIO(data.getvalue())))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 16])
+def test_json_stream_walks_document_in_any_chunk_size(chunk_size):
+    stream = JsonStream(io.StringIO(json.dumps(LEGACY, ensure_ascii=False, indent=2)), chunk_size=chunk_size)
+    seen = {}
+    for section in stream.iter_object():
+        if section == "banned_users":
+            seen[section] = [stream.value() for _ in stream.iter_array()]
+        elif section == "users":
+            seen[section] = {user_id: stream.value() for user_id in stream.iter_object()}
+        else:
+            seen[section] = stream.value()
+    assert seen == LEGACY
+
+
+def test_json_stream_handles_empty_containers_and_numbers_at_chunk_edges():
+    stream = JsonStream(io.StringIO('{"a": {}, "b": [], "c": 123456}'), chunk_size=2)
+    assert [(key, stream.value()) for key in stream.iter_object()] == [("a", {}), ("b", []), ("c", 123456)]
+
+
+def test_json_stream_rejects_truncated_input():
+    stream = JsonStream(io.StringIO('{"users": {"1": {}'), chunk_size=4)
+    with pytest.raises(ValueError):
+        for _ in stream.iter_object():
+            for _ in stream.iter_object():
+                stream.value()
+
+
+def test_stage_copies_every_section():
+    cursor = FakeCursor()
+    result = _stage(JsonStream(io.StringIO(json.dumps(LEGACY)), chunk_size=5), cursor)
+
+    assert result["statistics"] == LEGACY["statistics"]
+    assert result["staged"] == {"users": 2, "daily_image_counts": 1, "banned_users": 1,
+                                "premium_users": 0, "groups": 1}
+    assert cursor.copied["stage_users"][0] == ["1", "a", "أحمد", "2024-01-02T03:04:05", "7", "0",
+                                               "2024-02-01T00:00:00"]
+    assert cursor.copied["stage_image_counts"] == [["1", "2024-02-01", "3"]]
+    assert cursor.copied["stage_banned"] == [["2"]]
+    assert cursor.copied["stage_groups"] == [["-100", "G", "", "0", "5", ""]]
@@ -0,0 +1,69 @@
+"""Limits and expiry of the bounded per-chat caches."""
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from src.utils.state_cache import BoundedLRU, get_state_stats  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache = BoundedLRU("test_lru", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_never_evicts_the_newest_entry():
+    cache = BoundedLRU("test_bytes", max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "z" * 20)
+    assert len(cache) == 1 and cache.get("c") == "z" * 20
+
+
+def test_resize_accounts_for_in_place_mutation():
+    cache = BoundedLRU("test_resize", max_bytes=10, sizeof=len)
+    cache.set("a", [1])
+    cache.set("b", [1])
+    cache.get("a").extend(range(20))
+    cache.resize("a")
+    assert "b" not in cache and cache.stats()["bytes"] == 21
+
+
+def test_idle_entries_expire():
+    clock = FakeClock()
+    cache = BoundedLRU("test_ttl", ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    clock.now = 8
+    assert cache.get("a") == 1
+    clock.now = 15
+    assert cache.get("b") is None and cache.get("a") == 1
+    clock.now = 30
+    assert cache.purge_expired() == 1 and len(cache) == 0
+    assert cache.stats()["expirations"] == 2
+
+
+def test_get_or_create_and_pop():
+    cache = BoundedLRU("test_create")
+    assert cache.get_or_create("k", list) == []
+    cache.get_or_create("k", lambda: pytest.fail("factory called twice")).append(1)
+    assert cache.pop("k") == [1] and cache.pop("k", "gone") == "gone"
+
+
+def test_named_caches_are_reported():
+    cache = BoundedLRU("test_registry")
+    assert "test_registry" in [stats["name"] for stats in get_state_stats()]
+    del cache
@@ -0,0 +1,190 @@
+"""Behaviour shared by the local storage backends (memory and SQLite)."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.database_memory import MemoryDatabase
+from src.storage import create_database
+
+
+@pytest.fixture(params=["memory://", "sqlite://"])
+def db(request):
+    database = create_database(request.param)
+    yield database
+    database.close()
+
+
+def _age_group(db, chat_id, days):
+    """Move a group's join and activity dates `days` into the past."""
+    when = datetime.now(timezone.utc) - timedelta(days=days)
+    if isinstance(db, MemoryDatabase):
+        db.groups[chat_id].update(join_date=when, last_active=when)
+    else:
+        with db._transaction() as cursor:
+            cursor.execute("UPDATE groups SET join_date = ?, last_active = ? WHERE chat_id = ?",
+                           (when.isoformat(), when.isoformat(), chat_id))
+
+
+def test_create_database_picks_backend():
+    assert type(create_database("memory://")).__name__ == "MemoryDatabase"
+    assert type(create_database("sqlite://")).__name__ == "SqliteDatabase"
+
+
+def test_user_activity_updates_counters_and_rollup(db):
+    db.add_user(1, "a", "A")
+    for message_type in ["text", "text", "photo", "image", "voice"]:
+        db.update_user_activity(1, message_type)
+
+    user = db.get_user_info(1)
+    assert (user['message_count'], user['image_count']) == (2, 2)
+    assert user['last_active'].tzinfo is not None
+    assert db.get_daily_image_count_for_user(1) == 2
+    assert db.get_total_stats() == {'total_messages': 2, 'total_images': 2, 'total_users': 1}
+    stats = db.get_daily_activity_stats()
+    assert (stats['messages'], stats['images'], stats['unique_active_users']) == (2, 2, 1)
+
+
+def test_add_user_upserts_names(db):
+    db.add_user(1, None, None)
+    assert db.get_user_stats(1)['first_name'] == "المستخدم"
+    db.add_user(1, "a", "A")
+    assert (db.get_user_stats(1)['username'], db.get_total_users()) == ("a", 1)
+
+
+def test_bans_and_premium(db):
+    db.ban_user(2)
+    db.ban_user(2)
+    assert db.is_user_banned(2) and db.get_banned_users_ids() == ["2"]
+    db.unban_user(2)
+    assert not db.is_user_banned(2)
+
+    db.add_premium_user(1)
+    db.update_user_activity(1, "photo")
+    assert db.get_premium_users_ids() == ["1"]
+    assert db.can_user_send_image(1, premium_image_limit=2, free_user_image_limit=1)
+    db.remove_premium_user(1)
+    assert not db.can_user_send_image(1, premium_image_limit=2, free_user_image_limit=1)
+
+
+def test_group_settings(db):
+    assert not db.update_group_activity(5)
+    db.add_group(5, "G", 10)
+    assert db.update_group_activity(5)
+    db.update_group_info("5", {"title": "G2", "ignored": 1})
+    db.set_group_prompt(5, "p")
+    db.set_group_auto_scan(5, True)
+
+    group = db.get_recent_groups(1)[0]
+    assert (group['title'], group['message_count'], group['members_count']) == ("G2", 1, 10)
+    assert db.get_group_prompt(5) == "p" and db.get_group_auto_scan(5)
+    db.reset_group_prompt(5)
+    assert db.get_group_prompt(5) is None
+    assert db.get_daily_activity_stats()['active_groups'] == 1
+
+
+def test_prompts(db):
+    default = db.get_active_prompt()
+    assert default == db.get_prompt_content() == db._get_default_prompt_text()
+    db.update_prompt("x", "X")
+    assert db.get_active_prompt() == "X"
+    db.reset_to_default_prompt()
+    assert db.get_active_prompt() == default
+    assert db.get_prompt_content("missing") == ""
+
+
+def test_url_scan_cache_expires(db):
+    db.save_url_scan("k", "safe", [("vt", "safe", "ok")], 60)
+    db.save_url_scan("old", "safe", [], -1)
+    cached = db.get_url_scan("k")
+    assert (cached['verdict'], cached['results']) == ("safe", [["vt", "safe", "ok"]])
+    assert db.get_url_scan("old") is None
+
+
+def test_browse_pages_forward_and_back(db):
+    for user_id in range(1, 8):
+        db.add_user(user_id, f"u{user_id}", f"User {user_id}")
+        for _ in range(user_id % 3):
+            db.update_user_activity(user_id, "text")
+    order = [5, 2, 7, 4, 1, 6, 3]  # message_count DESC, then user_id DESC
+
+    first, has_more = db.get_browse_page("users", "m", limit=3)
+    assert [row['user_id'] for row in first] == order[:3] and has_more
+    last = first[-1]
+    second, has_more = db.get_browse_page("users", "m", (last['message_count'], last['user_id']), limit=3)
+    assert [row['user_id'] for row in second] == order[3:6] and has_more
+    head = second[0]
+    back, has_more = db.get_browse_page("users", "m", (head['message_count'], head['user_id']),
+                                        backwards=True, limit=3)
+    assert [row['user_id'] for row in back] == order[:3] and not has_more
+
+
+def test_browse_by_time_accepts_datetime_cursor(db):
+    for user_id in range(1, 5):
+        db.add_user(user_id, "u", "U")
+    rows, _ = db.get_browse_page("users", "r", limit=2)
+    cursor = (rows[-1]['last_active'], rows[-1]['user_id'])
+    rest, has_more = db.get_browse_page("users", "r", cursor, limit=2)
+    assert len(rest) == 2 and not has_more
+    assert {row['user_id'] for row in rows + rest} == {1, 2, 3, 4}
+
+
+def test_search_normalizes_arabic_and_matches_ids(db):
+    db.add_user(1, "ahmad_x", "أحمد")
+    db.add_user(2, "sara", "سارة")
+    db.add_group(-100, "مجموعة البرمجة")
+
+    assert [user['user_id'] for user in db.search_users("احمد")] == [1]
+    assert [user['user_id'] for user in db.search_users("@AHMAD")] == [1]
+    assert [user['user_id'] for user in db.search_users("ساره")] == [2]
+    assert [user['user_id'] for user in db.search_users("2")] == [2]
+    assert db.search_users("100%") == [] and db.search_users("  ") == []
+    assert [group['chat_id'] for group in db.search_groups("البرمجه")] == [-100]
+    assert [group['chat_id'] for group in db.search_groups("-100")] == [-100]
+
+
+def test_reachability_and_broadcast_audience(db):
+    for user_id in (1, 2, 3):
+        db.add_user(user_id, "u", "U")
+    db.update_user_activity(1, "text")
+    db.add_premium_user(2)
+    db.add_group(-5, "G")
+
+    assert db.set_chats_reachable([3, -5], False) == 2
+    assert db.set_chats_reachable([3, -5], False) == 0
+    assert db.count_broadcast_audience("users") == 2
+    assert db.count_broadcast_audience("groups") == 0
+    assert db.count_broadcast_audience("users", {"premium": True}) == 1
+    assert db.count_broadcast_audience("users", {"min_messages": 1, "active_days": 1}) == 1
+    today = datetime.now(timezone.utc).date().isoformat()
+    assert db.count_broadcast_audience("users", {"joined_after": today}) == 2
+
+    db.update_user_activity(3, "text")
+    assert db.count_broadcast_audience("users") == 3
+
+
+def test_group_counts_and_cleanup(db):
+    db.add_group(-1, "active")
+    db.update_group_activity(-1)
+    db.add_group(-2, "silent")
+    db.add_group(-3, "idle")
+    db.update_group_activity(-3)
+    _age_group(db, -2, 40)
+    _age_group(db, -3, 40)
+
+    assert db.get_group_counts() == {'total': 3, 'active': 2}
+    assert [group['chat_id'] for group in db.get_recent_groups(5)][0] == -1
+    removed_count, removed = db.cleanup_inactive_groups(30)
+    assert removed_count == 2
+    assert sorted(group['chat_id'] for group in removed) == ["-2", "-3"]
+    assert db.get_total_groups() == 1
+
+
+def test_sqlite_file_persists(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bot.db'}"
+    db = create_database(url)
+    db.add_user(3, "c", "C")
+    db.close()
+    db = create_database(url)
+    assert db.is_user_exist(3)
+    db.close()
@@ -0,0 +1,66 @@
+"""Local block/allow lists checked before any link scanner is called."""
+
+import os
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from src.utils import threat_filter  # noqa: E402
+from src.utils.threat_filter import BlockedDomainIndex, ThreatFilter  # noqa: E402
+
+
+def _labels(host):
+    return host.split(".")[::-1]
+
+
+def test_blocked_index_matches_listed_domains_and_subdomains(tmp_path, monkeypatch):
+    monkeypatch.setattr(threat_filter, "SORT_RUN_SIZE", 50)
+    domains = [f"site{i}.example{i % 7}.com" for i in range(500)]
+    index = BlockedDomainIndex(iter(domains + domains[:20]), directory=str(tmp_path))
+
+    assert len(index) == 500
+    assert index.match(_labels("site3.example3.com")) == "site3.example3.com"
+    assert index.match(_labels("a.b.site42.example0.com")) == "site42.example0.com"
+    assert index.match(_labels("site3.example4.com")) is None
+    assert index.match(_labels("example3.com")) is None
+
+    path = index.path
+    index.close()
+    assert not os.path.exists(path)
+
+
+def test_blocked_index_confirms_bloom_hits_on_disk(tmp_path):
+    index = BlockedDomainIndex(["bad.com"], directory=str(tmp_path))
+    # Force every Bloom lookup to pass; only the file can confirm a match
+    index.bloom._bits = bytearray(b"\xff" * len(index.bloom._bits))
+    assert index.match(_labels("x.bad.com")) == "bad.com"
+    assert index.match(_labels("good.org")) is None
+    index.close()
+
+
+def test_empty_blocklist(tmp_path):
+    index = BlockedDomainIndex((), directory=str(tmp_path))
+    assert len(index) == 0 and index.match(_labels("a.com")) is None
+    index.close()
+
+
+def test_threat_filter_checks_both_lists_and_reloads(tmp_path):
+    blocklist = tmp_path / "block.txt"
+    allowlist = tmp_path / "allow.txt"
+    blocklist.write_text("bad.com\n*.evil.org  # feed comment\n0.0.0.0 ads.example.net\n")
+    allowlist.write_text("safe.evil.org\n")
+    lists = ThreatFilter(str(blocklist), str(allowlist), check_interval=0)
+
+    assert lists.check("http://a.bad.com/x") == ("malicious", "bad.com")
+    assert lists.check("ads.example.net/p") == ("malicious", "ads.example.net")
+    assert lists.check("https://safe.evil.org") == ("clean", "safe.evil.org")
+    assert lists.check("https://www.evil.org") == ("malicious", "evil.org")
+    assert lists.check("https://en.wikipedia.org") == ("clean", "wikipedia.org")
+    assert lists.check("https://unknown.io") is None
+
+    blocklist.write_text("unknown.io\n")
+    mtime = os.path.getmtime(blocklist) + 5
+    os.utime(blocklist, (mtime, mtime))
+    assert lists.check("https://unknown.io") == ("malicious", "unknown.io")
+    assert lists.check("http://bad.com") is None